@@ -4,71 +4,81 @@ Script to analyze and visualize the collected DeFi protocol data.
 """
 
 import os
+import logging
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import numpy as np
 
+from pool_registry import load_metadata, pool_parts
+from profiling import count, profiled
+from strategy import list_pool_files
+
+logger = logging.getLogger(__name__)
+
 # Configuration
-DATA_DIR = "data"
 OUTPUT_DIR = "graphs"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+MIN_DATA_POINTS = 5  # Pools with fewer rows are left out of the analysis
+
+_plt = None
+_pool_metadata = None
 
-# Set plot style
-plt.style.use('ggplot')
-sns.set_theme(style="whitegrid")
-plt.rcParams['figure.figsize'] = (14, 8)
-plt.rcParams['font.size'] = 12
+def get_pyplot():
+    """Import matplotlib and seaborn and set the plot style on first use"""
+    global _plt
+    if _plt is None:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
 
+        plt.style.use('ggplot')
+        sns.set_theme(style="whitegrid")
+        plt.rcParams['figure.figsize'] = (14, 8)
+        plt.rcParams['font.size'] = 12
+        _plt = plt
+    return _plt
+
+@profiled('load')
 def load_all_data():
-    """Load all CSV files from the data directory"""
+    """Load the data files of the pools selected from the pool registry"""
     all_data = {}
     
-    for filename in os.listdir(DATA_DIR):
-        if filename.endswith('.csv') and filename != 'summary.csv':
-            filepath = os.path.join(DATA_DIR, filename)
-            pool_name = filename.replace('.csv', '')
+    for filepath in list_pool_files():
+        pool_name = os.path.splitext(os.path.basename(filepath))[0]
+        
+        try:
+            df = pd.read_csv(filepath)
+            count('files')
+            count('rows', len(df))
             
-            try:
-                df = pd.read_csv(filepath)
-                
-                # Skip if empty or very few data points
-                if len(df) < 5:
-                    print(f"Skipping {pool_name} - insufficient data points ({len(df)})")
-                    continue
-                
-                # Convert date to datetime
-                df['date'] = pd.to_datetime(df['date'])
-                
-                # Sort by date
-                df = df.sort_values('date')
-                
-                # Store in dictionary
-                all_data[pool_name] = df
-                print(f"Loaded {pool_name} - {len(df)} data points")
-            except Exception as e:
-                print(f"Error loading {pool_name}: {e}")
-    
+            # Skip if empty or very few data points
+            if len(df) < MIN_DATA_POINTS:
+                logger.debug(f"Skipping {pool_name} - insufficient data points ({len(df)})")
+                continue
+            
+            # Convert date to datetime
+            df['date'] = pd.to_datetime(df['date'])
+            
+            # Sort by date
+            df = df.sort_values('date')
+            
+            # Store in dictionary
+            all_data[pool_name] = df
+            logger.debug(f"Loaded {pool_name} - {len(df)} data points")
+        except Exception as e:
+            logger.warning(f"Error loading {pool_name}: {e}")
+
     return all_data
 
 def extract_protocol_info(pool_name):
-    """Extract protocol, asset, and chain from pool name"""
-    parts = pool_name.split('_')
-    
-    if len(parts) >= 3:
-        protocol = parts[0]
-        asset = parts[1]
-        chain = parts[2]
-    else:
-        protocol = parts[0] if len(parts) > 0 else "unknown"
-        asset = parts[1] if len(parts) > 1 else "unknown"
-        chain = "unknown"
-    
-    return protocol, asset, chain
+    """Extract protocol, asset, and chain of a pool from the pool registry"""
+    global _pool_metadata
+    if _pool_metadata is None:
+        _pool_metadata = load_metadata()
+    return pool_parts(pool_name, _pool_metadata)
 
+@profiled('plot')
 def plot_apy_by_protocol(all_data):
     """Plot APY over time for each protocol"""
+    plt = get_pyplot()
     protocols = set()
     for pool_name in all_data.keys():
         protocol, _, _ = extract_protocol_info(pool_name)
@@ -92,10 +102,12 @@ def plot_apy_by_protocol(all_data):
         output_file = os.path.join(OUTPUT_DIR, f'apy_{protocol}.png')
         plt.savefig(output_file, bbox_inches='tight')
         plt.close()
-        print(f"Saved APY plot for {protocol} to {output_file}")
+        logger.debug(f"Saved APY plot for {protocol} to {output_file}")
 
+@profiled('plot')
 def plot_tvl_by_protocol(all_data):
     """Plot TVL over time for each protocol"""
+    plt = get_pyplot()
     protocols = set()
     for pool_name in all_data.keys():
         protocol, _, _ = extract_protocol_info(pool_name)
@@ -123,10 +135,12 @@ def plot_tvl_by_protocol(all_data):
         output_file = os.path.join(OUTPUT_DIR, f'tvl_{protocol}.png')
         plt.savefig(output_file, bbox_inches='tight')
         plt.close()
-        print(f"Saved TVL plot for {protocol} to {output_file}")
+        logger.debug(f"Saved TVL plot for {protocol} to {output_file}")
 
+@profiled('plot')
 def plot_apy_tvl_by_asset(all_data):
     """Plot APY and TVL over time for each asset"""
+    plt = get_pyplot()
     assets = set()
     for pool_name in all_data.keys():
         _, asset, _ = extract_protocol_info(pool_name)
@@ -173,8 +187,9 @@ def plot_apy_tvl_by_asset(all_data):
         output_file = os.path.join(OUTPUT_DIR, f'apy_tvl_{asset}.png')
         plt.savefig(output_file, bbox_inches='tight')
         plt.close()
-        print(f"Saved APY/TVL plot for {asset} to {output_file}")
+        logger.debug(f"Saved APY/TVL plot for {asset} to {output_file}")
 
+@profiled('summarise')
 def create_aggregated_model(all_data):
     """Create an aggregated model that takes the highest APY at each point in time"""
     # Get all unique dates across all datasets
@@ -217,8 +232,10 @@ def create_aggregated_model(all_data):
     
     return agg_df
 
+@profiled('plot')
 def plot_aggregated_model(agg_df, all_data):
     """Plot the aggregated model showing the highest APY at each point in time"""
+    plt = get_pyplot()
     plt.figure(figsize=(14, 8))
     
     # Plot the best APY
@@ -275,8 +292,10 @@ def plot_aggregated_model(agg_df, all_data):
     
     print(f"Saved aggregated model statistics to {stats_file}")
 
+@profiled('volatility')
 def calculate_volatility(all_data, agg_df):
     """Calculate APY volatility for each pool and the aggregated model"""
+    plt = get_pyplot()
     volatility_data = []
     
     # Calculate volatility for each pool
@@ -284,11 +303,9 @@ def calculate_volatility(all_data, agg_df):
         if len(df) >= 30:  # Only consider pools with sufficient data
             protocol, asset, chain = extract_protocol_info(pool_name)
             
-            # Calculate daily APY changes
-            df['apy_change'] = df['apy'].diff()
-            
-            # Calculate volatility (standard deviation of daily changes)
-            volatility = df['apy_change'].std()
+            # Calculate volatility (standard deviation of daily changes); the
+            # frames may be shared with later stages, so they are not modified
+            volatility = df['apy'].diff().std()
             
             volatility_data.append({
                 'pool': pool_name,
@@ -350,10 +367,15 @@ def calculate_volatility(all_data, agg_df):
     
     return volatility_df
 
-def main():
+def main(all_data=None):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    
     # Load all data
-    print("Loading data...")
-    all_data = load_all_data()
+    if all_data is None:
+        print("Loading data...")
+        all_data = load_all_data()
+    else:
+        all_data = {name: df for name, df in all_data.items() if len(df) >= MIN_DATA_POINTS}
     print(f"Loaded {len(all_data)} datasets")
     
     # Plot APY by protocol
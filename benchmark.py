@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark the analysis pipeline on synthetic universes of increasing size.
+
+For each size a universe is generated with synthetic_data.py (and reused on later
+runs), then every stage is timed from inside that directory: strategy.load_all_data,
+calculate_pool_statistics, find_best_protocols, weighted_apy.calculate_weighted_apy,
+analyze_data.create_aggregated_model and calculate_volatility. The time is the best
+of --repeat runs. Peak memory comes from a separate tracemalloc run, so tracing does
+not distort the timings. Every stage runs at every size; with --limits, stages known to
+scale badly are skipped above a size limit. Results go to benchmarks/results_<timestamp>.json
+together with the git commit and library versions and a top-level list of skipped
+stages, and --compare prints the per-stage change between two result files.
+
+Usage:
+    python benchmark.py --pools 50 500 2000 --years 1
+    python benchmark.py --pools 20000 --years 10 --repeat 1
+    python benchmark.py --compare benchmarks/results_a.json benchmarks/results_b.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from synthetic_data import generate_universe
+
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / 'benchmarks'
+UNIVERSE_DIR = RESULTS_DIR / 'universes'
+DEFAULT_POOLS = [50, 500, 2000]
+DEFAULT_YEARS = [1]
+
+# Largest universe (pools x days) each stage is run on with --limits
+STAGE_LIMITS = {
+    'create_aggregated_model': 50_000,    # Loops over every date and pool
+    'calculate_volatility': 2_000_000,    # Draws one bar per pool
+}
+
+
+def _load_all_data(ctx):
+    import strategy
+    ctx['all_data'] = strategy.load_all_data()
+
+
+def _calculate_pool_statistics(ctx):
+    import strategy
+    strategy.calculate_pool_statistics(ctx['all_data'])
+
+
+def _find_best_protocols(ctx):
+    import strategy
+    strategy.find_best_protocols(ctx['all_data'])
+
+
+def _calculate_weighted_apy(ctx):
+    import weighted_apy
+    if 'summary' not in ctx:
+        allowed_pools = weighted_apy.load_allowed_pools()
+        ctx['summary'] = weighted_apy.load_summary_data(allowed_pools)
+    weighted_apy.calculate_weighted_apy(*ctx['summary'])
+
+
+def _create_aggregated_model(ctx):
+    import analyze_data
+    ctx['agg_df'] = analyze_data.create_aggregated_model(ctx['all_data'])
+
+
+def _calculate_volatility(ctx):
+    import analyze_data
+    os.makedirs(analyze_data.OUTPUT_DIR, exist_ok=True)
+    agg_df = ctx.get('agg_df')
+    if agg_df is None:
+        # Stand-in for a skipped aggregated model, so volatility can still be timed
+        combined = pd.concat(ctx['all_data'].values(), ignore_index=True)
+        agg_df = combined.groupby('date', as_index=False)['apy'].max().rename(columns={'apy': 'best_apy'})
+    analyze_data.calculate_volatility(ctx['all_data'], agg_df.copy())
+
+
+STAGES = [
+    ('load_all_data', _load_all_data),
+    ('calculate_pool_statistics', _calculate_pool_statistics),
+    ('find_best_protocols', _find_best_protocols),
+    ('calculate_weighted_apy', _calculate_weighted_apy),
+    ('create_aggregated_model', _create_aggregated_model),
+    ('calculate_volatility', _calculate_volatility),
+]
+
+
+@contextlib.contextmanager
+def inside(directory):
+    """Run with the universe as working directory and the stages' progress output silenced"""
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.chdir(cwd)
+
+
+def time_stage(func, ctx, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(ctx)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func, ctx):
+    """Peak traced allocation of one run of the stage, in MiB"""
+    tracemalloc.start()
+    try:
+        func(ctx)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def run_size(n_pools, years, seed, repeat, measure_memory, skip, limits):
+    directory = UNIVERSE_DIR / f"{n_pools}x{years:g}y_seed{seed}"
+    start = time.perf_counter()
+    generate_universe(directory, n_pools, years, seed)
+    print(f"\n{n_pools} pools x {years:g} years (universe ready in {time.perf_counter() - start:.1f}s)")
+
+    pool_days = int(n_pools * round(365 * years))
+    stages = {}
+    ctx = {}
+    with inside(directory):
+        for name, func in STAGES:
+            limit = STAGE_LIMITS.get(name)
+            if name in skip:
+                stages[name] = {'skipped': 'requested'}
+            elif limits and limit is not None and pool_days > limit:
+                stages[name] = {'skipped': f'{pool_days} pool-days above limit {limit}'}
+            else:
+                seconds = time_stage(func, ctx, repeat)
+                stages[name] = {'seconds': round(seconds, 4)}
+                if measure_memory:
+                    stages[name]['peak_mib'] = round(peak_memory(func, ctx), 1)
+            result = stages[name]
+            sys.__stdout__.write(f"  {name:<28} " + (
+                f"skipped ({result['skipped']})" if 'skipped' in result else
+                f"{result['seconds']:9.3f}s" + (f"  {result['peak_mib']:9.1f} MiB" if 'peak_mib' in result else '')
+            ) + "\n")
+    return {'pools': n_pools, 'years': years, 'pool_days': pool_days, 'seed': seed, 'stages': stages}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit or None,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(old_file, new_file):
+    """Print per-stage time and memory ratios between two result files"""
+    old = json.loads(Path(old_file).read_text())
+    new = json.loads(Path(new_file).read_text())
+    old_runs = {(run['pools'], run['years']): run for run in old['runs']}
+    print(f"{old_file} ({old['environment']['git_commit']}) -> {new_file} ({new['environment']['git_commit']})")
+    for run in new['runs']:
+        before = old_runs.get((run['pools'], run['years']))
+        if before is None:
+            continue
+        print(f"\n{run['pools']} pools x {run['years']:g} years")
+        for name, result in run['stages'].items():
+            previous = before['stages'].get(name, {})
+            if 'seconds' not in result or 'seconds' not in previous:
+                continue
+            line = f"  {name:<28} {previous['seconds']:9.3f}s -> {result['seconds']:9.3f}s " \
+                   f"({previous['seconds'] / max(result['seconds'], 1e-9):.2f}x)"
+            if 'peak_mib' in result and 'peak_mib' in previous:
+                line += f"   {previous['peak_mib']:.1f} -> {result['peak_mib']:.1f} MiB"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pools', type=int, nargs='+', default=DEFAULT_POOLS)
+    parser.add_argument('--years', type=float, nargs='+', default=DEFAULT_YEARS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (best is kept)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--skip', nargs='+', default=[], choices=[name for name, _ in STAGES])
+    parser.add_argument('--limits', action='store_true',
+                        help='skip stages above their STAGE_LIMITS size instead of running every stage')
+    parser.add_argument('--output', help='result file (default: benchmarks/results_<timestamp>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    runs = []
+    for years in args.years:
+        for n_pools in args.pools:
+            runs.append(run_size(n_pools, years, args.seed, args.repeat, not args.no_memory,
+                                 set(args.skip), args.limits))
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    skipped = [{'pools': run['pools'], 'years': run['years'], 'stage': name, 'reason': result['skipped']}
+               for run in runs for name, result in run['stages'].items() if 'skipped' in result]
+    output.write_text(json.dumps({'environment': environment(), 'skipped': skipped, 'runs': runs}, indent=2))
+    print(f"\nSaved results to {output}")
+    if skipped:
+        print(f"WARNING: {len(skipped)} stage run(s) skipped, their timings are missing:")
+        for entry in skipped:
+            print(f"  {entry['stage']} at {entry['pools']} pools x {entry['years']:g} years ({entry['reason']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Script to run the strategy and weighted APY steps out of core, under a memory budget.
+
+strategy.find_best_protocols concatenates every pool and analyze_data keeps all
+pools in memory, so memory grows with pools x days. Here the pool files are
+streamed instead: they are read one at a time (very large files in row chunks),
+gathered into batches that fit the budget, and each batch is folded into
+reductions that merge associatively:
+
+- best pool per date and APY type: the per-batch argmax rows are merged with the
+  running best by another argmax, earlier pools winning ties as in the in-memory
+  version;
+- per-pool mean and variance: count, mean and sum of squared deviations merged
+  with the parallel update of Chan et al., so a pool split across chunks gives
+  the same statistics;
+- TVL-weighted APY: summary_apy.csv and summary_tvl.csv are read in row chunks
+  of dates, and each chunk's weighted sums are complete on their own.
+
+The outputs are the files strategy.py and weighted_apy.py write. The budget
+sizes the batches; it is a target for the working set, not a hard limit.
+
+Usage:
+    python chunked.py --memory-mb 256
+    python cli.py strategy weighted --memory-mb 256
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pool_registry import load_metadata
+from profiling import count, peak_rss_mib, profiled
+from strategy import DATA_DIR, list_pool_files, prepare_pool_frame
+import weighted_apy
+
+DEFAULT_MEMORY_MB = 512
+STATISTICS_DIR = 'statistics'
+APY_TYPES = ['apy', 'apy_base', 'apy_reward', 'apy_total']
+BATCH_SHARE = 0.25          # Share of the budget for one batch; the rest covers concat and groupby copies
+CSV_BYTES_PER_ROW = 100     # Rough size of one pool CSV line, to size row chunks of large files
+SUMMARY_COPIES = 8          # float64 matrices alive per summary chunk (2 frames, products, weights, masks)
+
+
+def budget_bytes(memory_mb):
+    return memory_mb * 2**20 * BATCH_SHARE
+
+
+def iter_pool_chunks(files, budget, metadata=None):
+    """(pool name, cleaned frame) per file, or per row chunk for files larger than the budget"""
+    for path in files:
+        filename = Path(path).stem
+        if len(filename.split('_')) < 3:
+            continue
+        if os.path.getsize(path) * 4 <= budget:
+            chunks = [pd.read_csv(path)]
+        else:
+            chunks = pd.read_csv(path, chunksize=max(int(budget / 4 / CSV_BYTES_PER_ROW), 1000))
+        for chunk in chunks:
+            count('rows', len(chunk))
+            df = prepare_pool_frame(chunk, filename, metadata)
+            if df is None:
+                break
+            if not df.empty:
+                yield filename, df
+        count('files')
+
+
+def iter_batches(files, budget, metadata=None):
+    """Concatenated pool chunks with a 'pool' column, each batch at most about `budget` bytes"""
+    frames, size = [], 0
+    for pool, df in iter_pool_chunks(files, budget, metadata):
+        df = df.assign(pool=pool)
+        frames.append(df)
+        size += df.memory_usage(index=False).sum()
+        if size >= budget:
+            yield pd.concat(frames, ignore_index=True)
+            frames, size = [], 0
+    if frames:
+        yield pd.concat(frames, ignore_index=True)
+
+
+class PoolMoments:
+    """Count, mean and sum of squared deviations per pool and APY type, mergeable across chunks"""
+
+    def __init__(self, columns=APY_TYPES):
+        self.columns = columns
+        self.n = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, batch):
+        grouped = batch.groupby('pool', sort=False)[self.columns]
+        n = grouped.count().astype(float)
+        mean = grouped.mean()
+        m2 = grouped.var(ddof=0) * n
+        if self.n is None:
+            self.n, self.mean, self.m2 = n, mean, m2
+            return
+
+        index = self.n.index.append(n.index.difference(self.n.index, sort=False))
+        na, nb = self.n.reindex(index, fill_value=0.0), n.reindex(index, fill_value=0.0)
+        ma, mb = self.mean.reindex(index, fill_value=0.0), mean.reindex(index, fill_value=0.0)
+        m2a, m2b = self.m2.reindex(index, fill_value=0.0), m2.reindex(index, fill_value=0.0)
+        total = na + nb
+        delta = mb - ma
+        self.n = total
+        self.mean = ma + delta * nb / total
+        self.m2 = m2a + m2b + delta ** 2 * na * nb / total
+
+    def statistics(self):
+        """Frame in the layout of strategy.calculate_pool_statistics"""
+        if self.n is None:
+            return pd.DataFrame()
+        var = self.m2 / (self.n - 1).where(self.n > 1)
+        stats = pd.DataFrame({'pool': self.n.index})
+        for column in self.columns:
+            stats[f'avg_{column}'] = self.mean[column].to_numpy()
+        for column in self.columns:
+            stats[f'var_{column}'] = var[column].to_numpy()
+        return stats
+
+
+class BestPerDate:
+    """Running argmax row per date for every APY type"""
+
+    COLUMNS = ['date', 'protocol', 'asset', 'chain', 'tvl', 'apy_base', 'apy_reward']
+
+    def __init__(self, apy_types=APY_TYPES):
+        self.best = dict.fromkeys(apy_types)
+
+    def update(self, batch):
+        for apy_type, running in self.best.items():
+            columns = self.COLUMNS + ([apy_type] if apy_type not in self.COLUMNS else [])
+            rows = batch.loc[batch.groupby('date')[apy_type].idxmax(), columns]
+            if running is not None:
+                # The running best comes first, so earlier pools keep winning ties
+                rows = pd.concat([running, rows], ignore_index=True)
+                rows = rows.loc[rows.groupby('date')[apy_type].idxmax()]
+            self.best[apy_type] = rows.reset_index(drop=True)
+
+    def best_protocols(self):
+        """Frames in the layout of strategy.find_best_protocols"""
+        results = {}
+        for apy_type, best in self.best.items():
+            if best is None:
+                continue
+            results[apy_type] = pd.DataFrame({
+                'date': best['date'],
+                'protocol': best['protocol'],
+                'asset': best['asset'],
+                'chain': best['chain'],
+                f'best_{apy_type}': best[apy_type],
+                'tvl': best['tvl'],
+                'tvl_usd': best['tvl'],
+                'apy_base': best['apy_base'],
+                'apy_reward': best['apy_reward']
+            }).sort_values('date')
+        return results
+
+
+@profiled('best-protocol')
+def chunked_strategy(memory_mb=DEFAULT_MEMORY_MB, data_dir=DATA_DIR):
+    """Pool statistics and best protocols per date, streaming the pool files in batches"""
+    budget = budget_bytes(memory_mb)
+    moments = PoolMoments()
+    best = BestPerDate()
+    batches = 0
+    for batch in iter_batches(list_pool_files(data_dir), budget, load_metadata()):
+        batch['apy_total'] = batch['apy_base'] + batch['apy_reward']
+        moments.update(batch)
+        best.update(batch)
+        batches += 1
+    if moments.n is None:
+        raise ValueError("No valid data was loaded from any files")
+    print(f"Processed {len(moments.n)} pools in {batches} batches")
+    return moments.statistics(), best.best_protocols()
+
+
+@profiled('summarise')
+def chunked_weighted_apy(memory_mb=DEFAULT_MEMORY_MB, statistics_dir=STATISTICS_DIR):
+    """Overall and grouped TVL-weighted APY, reading the summary files in row chunks of dates"""
+    apy_path = Path(statistics_dir) / 'summary_apy.csv'
+    tvl_path = Path(statistics_dir) / 'summary_tvl.csv'
+    if not apy_path.exists() or not tvl_path.exists():
+        raise FileNotFoundError('summary_apy.csv or summary_tvl.csv not found in statistics/')
+
+    allowed_pools = weighted_apy.load_allowed_pools()
+    metadata = weighted_apy.load_pool_metadata()
+    tvl_header = set(pd.read_csv(tvl_path, nrows=0).columns)
+    pool_cols = [col for col in pd.read_csv(apy_path, nrows=0).columns
+                 if col != 'date' and col in allowed_pools and col in tvl_header]
+    columns = ['date'] + pool_cols
+    rows = max(int(budget_bytes(memory_mb) / (max(len(pool_cols), 1) * 8 * SUMMARY_COPIES)), 1)
+    memberships = {by: weighted_apy.build_membership_matrix(pool_cols, metadata, by)
+                   for by in weighted_apy.GROUPINGS}
+
+    overall, grouped = [], {by: [] for by in weighted_apy.GROUPINGS}
+    readers = zip(pd.read_csv(apy_path, usecols=columns, chunksize=rows),
+                  pd.read_csv(tvl_path, usecols=columns, chunksize=rows))
+    for apy_chunk, tvl_chunk in readers:
+        if not apy_chunk['date'].equals(tvl_chunk['date']):
+            raise ValueError('summary_apy.csv and summary_tvl.csv rows are not aligned by date')
+        # usecols keeps file order, the weighted functions expect both frames in the same order
+        apy_chunk, tvl_chunk = apy_chunk[columns], tvl_chunk[columns]
+        count('rows', apy_chunk.shape[0] * len(pool_cols))
+        overall.append(weighted_apy.calculate_weighted_apy(apy_chunk, tvl_chunk))
+        for by, frame in weighted_apy.calculate_grouped_weighted_apy(
+                apy_chunk, tvl_chunk, metadata, memberships=memberships).items():
+            grouped[by].append(frame)
+
+    weighted = pd.concat(overall, ignore_index=True)
+    grouped = {by: pd.concat(frames, ignore_index=True).sort_values(['date', by], ignore_index=True)
+               for by, frames in grouped.items()}
+    print(f"Weighted APY for {len(pool_cols)} pools over {len(weighted)} dates in {len(overall)} chunks")
+    return weighted, grouped
+
+
+def save_strategy(pool_stats, best_protocols, statistics_dir=STATISTICS_DIR):
+    os.makedirs(statistics_dir, exist_ok=True)
+    pool_stats.to_csv(os.path.join(statistics_dir, 'pool_statistics.csv'), index=False)
+    for apy_type, df in best_protocols.items():
+        output_file = os.path.join(statistics_dir, f'best_{apy_type}.csv')
+        df.to_csv(output_file, index=False)
+        print(f"Saved {apy_type} results to {output_file}")
+
+
+def save_weighted(weighted, grouped, statistics_dir=STATISTICS_DIR):
+    os.makedirs(statistics_dir, exist_ok=True)
+    weighted.to_csv(os.path.join(statistics_dir, 'weighted_apy.csv'), index=False)
+    for by, df in grouped.items():
+        df.to_csv(os.path.join(statistics_dir, f'weighted_apy_by_{by}.csv'), index=False)
+    print(f"Saved weighted APY to {statistics_dir}/weighted_apy*.csv "
+          f"(average {np.nanmean(weighted['weighted_apy']):.2f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--memory-mb', type=float, default=DEFAULT_MEMORY_MB, help='memory budget in MiB')
+    parser.add_argument('--skip-weighted', action='store_true', help='only run the strategy step')
+    args = parser.parse_args()
+
+    pool_stats, best_protocols = chunked_strategy(args.memory_mb)
+    save_strategy(pool_stats, best_protocols)
+    if not args.skip_weighted:
+        save_weighted(*chunked_weighted_apy(args.memory_mb))
+    print(f"Peak RSS: {peak_rss_mib():.1f} MiB (budget {args.memory_mb:g} MiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Single entry point that runs any subset of the pipeline stages in one process.
+
+Stages always run in pipeline order (collect, dune, strategy, costs, analyze,
+weighted, report) whatever order they are given in. Pool data, summary frames and strategy
+results are loaded once and handed from stage to stage instead of every script
+re-reading them in a fresh interpreter. Stage modules are only imported when
+their stage runs, so e.g. `python cli.py weighted` never imports matplotlib or
+dune_client.
+
+With --profile every stage and its load/filter/fetch/process/summarise/
+best-protocol/plot steps are timed (wall, CPU, peak RSS, rows, bytes
+downloaded, cache hit rate) and written to a trace-event JSON report, see
+profiling.py. Per-pool progress is logged at DEBUG and only shown with
+--log-level DEBUG. With --memory-mb the strategy and weighted stages stream the
+data in batches under that budget instead of loading it whole (chunked.py).
+With --freq the pool histories and summary frames are first aligned onto a grid
+of that frequency (resample.py), so strategy, analyze, report and weighted run on e.g.
+hourly or weekly buckets; costs still price one rebalance per row. Without
+--freq or --memory-mb the weighted stage refreshes its outputs incrementally
+(weighted_apy_stream.py).
+
+Usage:
+    python cli.py strategy report        # best strategies, then the HTML report
+    python cli.py all                    # every stage except the Dune collector
+    python cli.py all --profile          # also writes profiles/profile_<timestamp>.json
+    python cli.py strategy weighted --freq W --how tvl_mean
+    python cli.py --list
+"""
+
+import argparse
+import importlib
+import sys
+import time
+
+import profiling
+
+STAGES = {
+    'collect': 'Collect DefiLlama pool histories (collect_defi_data.py)',
+    'dune': 'Collect Dune Analytics data (collect_dune_data.py, needs DUNE_API_KEY)',
+    'strategy': 'Pool statistics and best protocol per day (strategy.py)',
+    'costs': 'Per-chain transaction costs and net APY of the strategies (transaction_costs.py)',
+    'analyze': 'Charts, aggregated model and volatility (analyze_data.py)',
+    'weighted': 'TVL-weighted APY overall and per group (weighted_apy.py, weighted_apy_stream.py)',
+    'report': 'Interactive HTML report (report_html.py)',
+}
+# `all` leaves out the Dune collector, which spends credits
+ALL_STAGES = [stage for stage in STAGES if stage != 'dune']
+
+
+class PipelineContext:
+    """Data loaded once per run and shared between stages"""
+
+    def __init__(self, memory_mb=None, freq=None, how='last'):
+        self.memory_mb = memory_mb
+        self.freq = freq
+        self.how = how
+        self._data = {}
+
+    def get(self, name, loader):
+        if name not in self._data:
+            self._data[name] = loader()
+        return self._data[name]
+
+    def set(self, name, value):
+        self._data[name] = value
+
+    def invalidate(self):
+        """Drop everything loaded so far, e.g. after a collector rewrote the inputs"""
+        self._data.clear()
+
+    def all_data(self):
+        strategy = importlib.import_module('strategy')
+        if self.freq is None:
+            return self.get('all_data', strategy.load_all_data)
+        resample = importlib.import_module('resample')
+        return self.get('all_data', lambda: resample.resample_pool_data(strategy.load_all_data(), self.freq, self.how))
+
+    def best_protocols(self):
+        report_html = importlib.import_module('report_html')
+        return self.get('best_protocols', lambda: report_html.load_best_protocols(self.all_data()))
+
+    def summary(self):
+        weighted_apy = importlib.import_module('weighted_apy')
+
+        def load():
+            return weighted_apy.load_summary_data(weighted_apy.load_allowed_pools())
+
+        if self.freq is None:
+            return self.get('summary', load)
+        resample = importlib.import_module('resample')
+        return self.get('summary', lambda: resample.resample_summary(*load(), self.freq, self.how))
+
+
+def run_collect(ctx):
+    importlib.import_module('collect_defi_data').main()
+    ctx.invalidate()
+
+
+def run_dune(ctx):
+    importlib.import_module('collect_dune_data').main()
+
+
+def run_strategy(ctx):
+    if ctx.memory_mb:
+        chunked = importlib.import_module('chunked')
+        pool_stats, best_protocols = chunked.chunked_strategy(ctx.memory_mb)
+        chunked.save_strategy(pool_stats, best_protocols)
+    else:
+        best_protocols = importlib.import_module('strategy').main(ctx.all_data())
+    ctx.set('best_protocols', best_protocols)
+
+
+def run_costs(ctx):
+    importlib.import_module('transaction_costs').main(ctx.best_protocols(), argv=[])
+
+
+def run_analyze(ctx):
+    importlib.import_module('analyze_data').main(ctx.all_data())
+
+
+def run_weighted(ctx):
+    if ctx.memory_mb:
+        chunked = importlib.import_module('chunked')
+        chunked.save_weighted(*chunked.chunked_weighted_apy(ctx.memory_mb))
+        return
+    apy_df, tvl_df = ctx.summary()
+    if ctx.freq is None:
+        # The incremental state holds daily rows, so resampled runs recompute in full
+        importlib.import_module('weighted_apy_stream').update(apy_df, tvl_df)
+        return
+    importlib.import_module('weighted_apy').main(apy_df, tvl_df)
+
+
+def run_report(ctx):
+    importlib.import_module('report_html').main(ctx.all_data(), ctx.best_protocols())
+
+
+RUNNERS = {
+    'collect': run_collect,
+    'dune': run_dune,
+    'strategy': run_strategy,
+    'costs': run_costs,
+    'analyze': run_analyze,
+    'weighted': run_weighted,
+    'report': run_report,
+}
+
+
+def resolve_stages(names):
+    """Expand `all`, drop duplicates and put the stages in pipeline order"""
+    selected = set()
+    for name in names:
+        selected.update(ALL_STAGES if name == 'all' else [name])
+    return [stage for stage in STAGES if stage in selected]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"stages to run: {', '.join(STAGES)} or all")
+    parser.add_argument('--list', action='store_true', help='list the available stages')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='PATH',
+                        help=f'write a per-stage profile (default: {profiling.PROFILE_DIR}/profile_<timestamp>.json)')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='console log level; DEBUG shows per-pool progress')
+    parser.add_argument('--memory-mb', type=float, default=None,
+                        help='run strategy and weighted out of core within this memory budget (MiB)')
+    parser.add_argument('--freq', default=None,
+                        help='align pools onto buckets of this pandas frequency first, e.g. 1h, 1D, W, MS')
+    parser.add_argument('--how', default='last', choices=['last', 'mean', 'tvl_mean'],
+                        help='how observations within a bucket are combined (with --freq)')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for stage, description in STAGES.items():
+            print(f"{stage:<10} {description}")
+        return 0
+    if not args.stages:
+        parser.error('name at least one stage, or all')
+    unknown = [name for name in args.stages if name not in STAGES and name != 'all']
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    if args.memory_mb and args.freq:
+        parser.error('--freq needs the pools in memory and cannot be combined with --memory-mb')
+
+    profiling.configure_logging(args.log_level)
+    if args.profile is not None:
+        profiling.enable()
+
+    ctx = PipelineContext(args.memory_mb, args.freq, args.how)
+    start = time.perf_counter()
+    for stage in resolve_stages(args.stages):
+        print(f"\n=== {stage} ===")
+        stage_start = time.perf_counter()
+        with profiling.stage(stage):
+            RUNNERS[stage](ctx)
+        print(f"=== {stage} finished in {time.perf_counter() - stage_start:.2f}s ===")
+    print(f"\nPipeline finished in {time.perf_counter() - start:.2f}s")
+
+    if args.profile is not None:
+        print(f"\n{profiling.PROFILER.format_table()}")
+        print(f"\nSaved profile to {profiling.PROFILER.write(args.profile or None)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,34 +18,32 @@ Usage:
    python collect_dune_data.py
 
 The script will create a 'data/dune' directory and save CSV files for each protocol-asset-chain
-combination, as well as a summary file.
+combination, as well as a summary file. With BATCH_QUERIES enabled, each protocol's SQL template
+is rewritten to select all target assets and chains with IN (...) lists, so a full collection is
+one execution per protocol and the rows are split into per-pool CSVs locally.
 """
 
+from __future__ import annotations
+
 import os
+import re
 import pandas as pd
 import time
 import logging
-from typing import Dict, List, Optional, Any
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+from typing import TYPE_CHECKING, Dict, List, Optional, Any, Tuple
 
-# Import Dune client libraries
-from dune_client.types import QueryParameter, DuneRecord
-from dune_client.client import DuneClient
-from dune_client.query import DuneQuery
+from dune_cache import DuneResultCache
+from dune_capabilities import CapabilityIndex
+from dune_scheduler import DuneExecutionScheduler, DuneJob
+from dune_stream import LazyPoolFrames, PoolCsvSplitter, stream_latest_result_to_csv
+from pool_registry import PoolRegistry, pool_parts
 
+if TYPE_CHECKING:
+    # dune_client is only imported once a client or query is actually built
+    from dune_client.client import DuneClient
+    from dune_client.types import QueryParameter
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("dune_data_collection.log"),
-        logging.StreamHandler()
-    ]
-)
+LOG_FILE = "dune_data_collection.log"
 logger = logging.getLogger(__name__)
 
 # Configuration
@@ -54,10 +52,19 @@ TARGET_ASSETS = ["usdc", "usdt", "usds", "susds", "compound usdt", 'usde', 'usdt
 TARGET_CHAINS = ["ethereum", "base", "arbitrum", "avalanche", "bnb", "polygon"]
 START_DATE = "2024-06-06"  # June 6, 2024
 END_DATE = "2025-06-05"    # June 5, 2025
+# Run one query per protocol with IN (...) lists instead of one per protocol-asset-chain
+BATCH_QUERIES = True
+MAX_IN_FLIGHT = 3          # Concurrent Dune executions
+CREDIT_BUDGET = None       # Maximum credits per run, None for no limit
+# Split result pages into per-pool CSVs as they arrive instead of holding whole results in memory
+STREAM_RESULTS = False
+# Dune date_trunc unit of the rows: 'day', or 'hour' for intraday data (resample.py aligns either)
+TIME_BUCKET = 'day'
+BUCKET_DATE_FORMATS = {'day': '%Y-%m-%d', 'hour': '%Y-%m-%d %H:%M:%S', 'minute': '%Y-%m-%d %H:%M:%S'}
+# Saved query whose latest result is exported on every run
+LATEST_RESULT_QUERY_ID = 5266260
 
-# Create output directory
 OUTPUT_DIR = "data/dune"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Dune Analytics query IDs and SQL templates
 # These are example query IDs and would need to be replaced with actual query IDs from Dune
@@ -67,7 +74,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             symbol as asset,
             '{{chain}}' as chain,
             avg(liquidity_rate) * 100 as apy_base,
@@ -90,7 +97,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             symbol as asset,
             '{{chain}}' as chain,
             avg(liquidity_rate) * 100 as apy_base,
@@ -114,7 +121,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             token_symbol as asset,
             '{{chain}}' as chain,
             avg(supply_apy) as apy_base,
@@ -137,7 +144,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             token_symbol as asset,
             '{{chain}}' as chain,
             avg(supply_apy) as apy_base,
@@ -160,7 +167,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             token_symbol as asset,
             '{{chain}}' as chain,
             avg(supply_apy) as apy_base,
@@ -184,7 +191,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             token_symbol as asset,
             '{{chain}}' as chain,
             avg(supply_apy) as apy_base,
@@ -208,7 +215,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             token_symbol as asset,
             '{{chain}}' as chain,
             avg(supply_apy) as apy_base,
@@ -232,7 +239,7 @@ DUNE_QUERIES = {
         "query_id": None,  # Replace with actual query ID
         "sql_template": """
         SELECT
-            date_trunc('day', block_time) as date,
+            date_trunc('{{bucket}}', block_time) as date,
             token_symbol as asset,
             '{{chain}}' as chain,
             avg(apy) as apy_base,
@@ -253,9 +260,26 @@ DUNE_QUERIES = {
     }
 }
 
+# Function to configure logging for a collection run
+def configure_logging() -> None:
+    """Log to the console and to dune_data_collection.log"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+
 # Function to initialize Dune client
 def init_dune_client() -> DuneClient:
     """Initialize and return a Dune Analytics client"""
+    from dotenv import load_dotenv
+    from dune_client.client import DuneClient
+
+    # Load environment variables from .env file
+    load_dotenv()
     # Get API key from environment variable
     api_key = os.environ.get("DUNE_API_KEY")
     
@@ -267,6 +291,8 @@ def init_dune_client() -> DuneClient:
 # Function to execute a Dune query with SQL
 def execute_dune_sql_query(client: DuneClient, sql: str, parameters: List[QueryParameter] = None) -> Optional[List[Dict[str, Any]]]:
     """Execute a SQL query on Dune Analytics and return the results"""
+    from dune_client.query import DuneQuery
+
     logger.info(f"Executing Dune SQL query with parameters {parameters}")
     try:
         # Use DuneQuery and client.run_query for raw SQL
@@ -301,8 +327,64 @@ def prepare_sql_query(template: str, protocol: str, asset: str, chain: str, star
     sql = sql.replace("{{chain}}", chain)
     sql = sql.replace("{{start_date}}", start_date)
     sql = sql.replace("{{end_date}}", end_date)
+    sql = sql.replace("{{bucket}}", TIME_BUCKET)
     return sql
 
+# Function to prepare a batched SQL query covering several assets and chains
+def prepare_batched_sql_query(template: str, protocol: str, assets: List[str], chains: List[str],
+                              start_date: str, end_date: str) -> str:
+    """Rewrite a single-pool SQL template to select all given assets and chains at once"""
+    def sql_list(values: List[str]) -> str:
+        return ", ".join("'" + value.replace("'", "''") + "'" for value in values)
+
+    # The chain is no longer a constant, so take it from the blockchain column
+    sql = re.sub(r"'\{\{chain\}\}'\s+as\s+chain", "blockchain as chain", template, flags=re.IGNORECASE)
+    sql = re.sub(r"(\w+)\s*=\s*'\{\{asset\}\}'", r"\1 IN ({{assets}})", sql)
+    sql = re.sub(r"(\w+)\s*=\s*'\{\{chain\}\}'", r"\1 IN ({{chains}})", sql)
+    sql = sql.replace("{{protocol}}", protocol)
+    sql = sql.replace("{{assets}}", sql_list([asset.upper() for asset in assets]))
+    sql = sql.replace("{{chains}}", sql_list(chains))
+    sql = sql.replace("{{start_date}}", start_date)
+    sql = sql.replace("{{end_date}}", end_date)
+    sql = sql.replace("{{bucket}}", TIME_BUCKET)
+    return sql
+
+# Function to normalize a Dune result to the per-pool CSV layout
+def normalize_result_frame(df: pd.DataFrame, label: str) -> Optional[pd.DataFrame]:
+    """Format dates and make sure date, tvl, apy, apy_base and apy_reward columns exist"""
+    # Ensure date column is in the correct format
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date']).dt.strftime(BUCKET_DATE_FORMATS[TIME_BUCKET])
+    
+    # Ensure required columns exist
+    required_columns = ['date', 'tvl', 'apy', 'apy_base', 'apy_reward']
+    for col in required_columns:
+        if col not in df.columns:
+            if col in ['apy_base', 'apy_reward']:
+                # If apy_base or apy_reward is missing but apy exists, derive them
+                if 'apy' in df.columns:
+                    if col == 'apy_base':
+                        df['apy_base'] = df['apy']
+                    else:
+                        df['apy_reward'] = 0
+            else:
+                logger.warning(f"Column {col} missing in result for {label}")
+                return None
+    
+    return df
+
+# Function to build the parameters of a single-pool query
+def build_query_parameters(asset: str, chain: str, start_date: str, end_date: str) -> List[QueryParameter]:
+    """Build Dune query parameters for one asset on one chain"""
+    from dune_client.types import QueryParameter
+
+    return [
+        QueryParameter.text_type(name="asset", value=asset.upper()),
+        QueryParameter.text_type(name="chain", value=chain),
+        QueryParameter.date_type(name="start_date", value=start_date),
+        QueryParameter.date_type(name="end_date", value=end_date)
+    ]
+
 # Function to fetch data for a specific protocol, asset, and chain
 def fetch_protocol_data(client: DuneClient, protocol: str, asset: str, chain: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
     """Fetch data for a specific protocol, asset, and chain"""
@@ -316,12 +398,7 @@ def fetch_protocol_data(client: DuneClient, protocol: str, asset: str, chain: st
     query_config = DUNE_QUERIES[protocol]
     
     # Prepare parameters
-    parameters = [
-        QueryParameter.text_type(name="asset", value=asset.upper()),
-        QueryParameter.text_type(name="chain", value=chain),
-        QueryParameter.date_type(name="start_date", value=start_date),
-        QueryParameter.date_type(name="end_date", value=end_date)
-    ]
+    parameters = build_query_parameters(asset, chain, start_date, end_date)
     
     # Execute query
     if query_config["query_id"]:
@@ -346,26 +423,47 @@ def fetch_protocol_data(client: DuneClient, protocol: str, asset: str, chain: st
     # Convert to DataFrame
     df = pd.DataFrame(result)
     
-    # Ensure date column is in the correct format
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+    return normalize_result_frame(df, f"{protocol} - {asset} on {chain}")
+
+# Function to fetch data for one protocol across several assets and chains
+def fetch_protocol_batch(client: DuneClient, protocol: str, assets: List[str], chains: List[str],
+                         start_date: str, end_date: str) -> Dict[Tuple[str, str, str], pd.DataFrame]:
+    """Fetch all assets and chains of a protocol with one execution and split rows per pool"""
+    logger.info(f"Fetching batched data for {protocol}: {len(assets)} assets on {len(chains)} chains")
     
-    # Ensure required columns exist
-    required_columns = ['date', 'tvl', 'apy', 'apy_base', 'apy_reward']
-    for col in required_columns:
-        if col not in df.columns:
-            if col in ['apy_base', 'apy_reward']:
-                # If apy_base or apy_reward is missing but apy exists, derive them
-                if 'apy' in df.columns:
-                    if col == 'apy_base':
-                        df['apy_base'] = df['apy']
-                    else:
-                        df['apy_reward'] = 0
-            else:
-                logger.warning(f"Column {col} missing in result for {protocol} - {asset} on {chain}")
-                return None
+    query_config = DUNE_QUERIES[protocol]
+    sql = prepare_batched_sql_query(query_config["sql_template"], protocol, assets, chains, start_date, end_date)
+    result = execute_dune_sql_query(client, sql)
     
-    return df
+    if not result:
+        logger.warning(f"No data returned for batched {protocol} query")
+        return {}
+    
+    return split_batch_result(pd.DataFrame(result), protocol, assets, chains)
+
+# Function to split a batched result into per-pool frames
+def split_batch_result(df: pd.DataFrame, protocol: str, assets: List[str], chains: List[str]) -> Dict[Tuple[str, str, str], pd.DataFrame]:
+    """Split rows of a batched query on the asset and chain columns into per-pool frames"""
+    if 'asset' not in df.columns or 'chain' not in df.columns:
+        logger.warning(f"Batched result for {protocol} has no asset/chain columns")
+        return {}
+    
+    # Map the returned symbols and chains back to the configured spelling
+    asset_names = {asset.upper(): asset for asset in assets}
+    chain_names = {chain.lower(): chain for chain in chains}
+    
+    pools = {}
+    for (asset_symbol, chain_value), pool_df in df.groupby(['asset', 'chain']):
+        asset = asset_names.get(str(asset_symbol).upper())
+        chain = chain_names.get(str(chain_value).lower())
+        if asset is None or chain is None or not is_valid_combination(protocol, asset, chain):
+            continue
+        pool_df = normalize_result_frame(pool_df.drop(columns=['asset', 'chain']).reset_index(drop=True),
+                                         f"{protocol} - {asset} on {chain}")
+        if pool_df is not None and not pool_df.empty:
+            pools[(protocol, asset, chain)] = pool_df.sort_values('date', ignore_index=True)
+    
+    return pools
 
 # Function to save data to CSV
 def save_to_csv(data: pd.DataFrame, protocol: str, asset: str, chain: str) -> Optional[str]:
@@ -377,7 +475,9 @@ def save_to_csv(data: pd.DataFrame, protocol: str, asset: str, chain: str) -> Op
     filename = f"{protocol}_{asset}_{chain}".replace(' ', '_')
     filepath = os.path.join(OUTPUT_DIR, f"{filename}.csv")
     
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     data.to_csv(filepath, index=False)
+    get_registry().record_dune_pool(protocol, asset, chain)
     logger.info(f"Saved data to {filepath}")
     
     return filepath
@@ -422,14 +522,11 @@ def create_pool_statistics(all_data: Dict[str, pd.DataFrame]) -> None:
         return
     
     stats = []
+    metadata = get_registry().metadata()
     
     for pool_name, df in all_data.items():
         try:
-            # Extract protocol, asset, and chain from pool name
-            parts = pool_name.split('_')
-            protocol = parts[0]
-            asset = parts[1]
-            chain = parts[2]
+            protocol, asset, chain = pool_parts(pool_name, metadata)
             
             # Calculate statistics
             pool_stats = {
@@ -464,8 +561,22 @@ def create_pool_statistics(all_data: Dict[str, pd.DataFrame]) -> None:
     logger.info(f"Pool statistics saved to {stats_file}")
 
 # Function to fetch data for all target combinations
-def fetch_all_data(client: DuneClient) -> Dict[str, pd.DataFrame]:
+def fetch_all_data(client: DuneClient, batched: bool = BATCH_QUERIES,
+                   stream: bool = STREAM_RESULTS) -> Dict[str, pd.DataFrame]:
     """Fetch data for all target protocol, asset, and chain combinations"""
+    try:
+        if stream:
+            return fetch_all_data_streaming(client)
+        if batched:
+            return fetch_all_data_batched(client)
+        return fetch_all_data_sequential(client)
+    finally:
+        # Persist which markets came back empty so later runs skip them
+        get_capabilities().save()
+
+# Function to fetch data one protocol-asset-chain combination at a time
+def fetch_all_data_sequential(client: DuneClient) -> Dict[str, pd.DataFrame]:
+    """Fetch data for all target combinations with one blocking query each"""
     all_data = {}
     
     # Create a list of all protocol-asset-chain combinations to fetch
@@ -485,6 +596,7 @@ def fetch_all_data(client: DuneClient) -> Dict[str, pd.DataFrame]:
         
         # Fetch data
         df = fetch_protocol_data(client, protocol, asset, chain, START_DATE, END_DATE)
+        get_capabilities().record_result(protocol, asset, chain, empty=df is None or df.empty)
         
         if df is not None and not df.empty:
             # Save to CSV
@@ -500,6 +612,183 @@ def fetch_all_data(client: DuneClient) -> Dict[str, pd.DataFrame]:
     
     return all_data
 
+# Function to fetch data for all targets with one execution per protocol
+def fetch_all_data_batched(client: DuneClient, cache: Optional[DuneResultCache] = None) -> Dict[str, pd.DataFrame]:
+    """Fetch data for all target combinations, running one batched query per protocol concurrently"""
+    from dune_client.query import QueryBase
+
+    all_data = {}
+    jobs = []
+    targets = {}
+    lookups = {}
+    cache = cache or DuneResultCache(date_format=BUCKET_DATE_FORMATS[TIME_BUCKET])
+    
+    def handle_rows(key: Tuple[str, Optional[str], Optional[str]], rows: pd.DataFrame) -> None:
+        protocol, asset, chain = key
+        if rows is None or rows.empty:
+            logger.warning(f"No data returned for {key}")
+            rows = pd.DataFrame(columns=['date', 'asset', 'chain', 'apy', 'tvl'])
+        if asset is None:
+            assets, chains = targets[protocol]
+            pools = split_batch_result(rows, protocol, assets, chains)
+            expected = [(protocol, a, c) for a in assets for c in chains if is_valid_combination(protocol, a, c)]
+        else:
+            df = normalize_result_frame(rows, f"{protocol} - {asset} on {chain}")
+            pools = {key: df} if df is not None and not df.empty else {}
+            expected = [key]
+        get_capabilities().record_results(expected, pools.keys())
+        for (protocol, asset, chain), df in pools.items():
+            pool_name = f"{protocol}_{asset}_{chain}".replace(' ', '_')
+            save_to_csv(df, protocol, asset, chain)
+            all_data[pool_name] = df
+            logger.info(f"Successfully processed {pool_name} with {len(df)} data points")
+    
+    def schedule(key, cache_key: str, make_job) -> None:
+        lookup = cache.lookup(cache_key, START_DATE, END_DATE)
+        if lookup.status == 'hit':
+            handle_rows(key, lookup.rows)
+            return
+        lookups[key] = (cache_key, lookup)
+        jobs.append(make_job(lookup.fetch_start or START_DATE))
+    
+    # Batching rewrites SQL templates; saved queries are still run per combination
+    protocols = [protocol for protocol in DUNE_QUERIES
+                 if any(target in protocol for target in TARGET_PROTOCOLS)]
+    
+    for protocol in protocols:
+        assets = [asset for asset in TARGET_ASSETS
+                  if any(is_valid_combination(protocol, asset, chain) for chain in TARGET_CHAINS)]
+        chains = [chain for chain in TARGET_CHAINS
+                  if any(is_valid_combination(protocol, asset, chain) for asset in assets)]
+        targets[protocol] = (assets, chains)
+        
+        query_config = DUNE_QUERIES[protocol]
+        if query_config["query_id"]:
+            for asset in assets:
+                for chain in chains:
+                    if not is_valid_combination(protocol, asset, chain):
+                        continue
+                    key = (protocol, asset, chain)
+                    parameters = build_query_parameters(asset, chain, START_DATE, END_DATE)
+                    # Reuse the saved query's latest result when it is recent enough
+                    latest = cache.latest_result_if_fresh(
+                        client, QueryBase(query_id=query_config["query_id"], params=parameters))
+                    if latest is not None:
+                        handle_rows(key, latest)
+                        continue
+                    cache_key = cache.make_key(query_id=query_config["query_id"], parameters=parameters[:2])
+                    schedule(key, cache_key, lambda fetch_start, key=key, asset=asset, chain=chain: DuneJob(
+                        key=key,
+                        query_id=query_config["query_id"],
+                        parameters=build_query_parameters(asset, chain, fetch_start, END_DATE)
+                    ))
+        else:
+            # Render with date placeholders so the cache key does not depend on the range
+            template = prepare_batched_sql_query(query_config["sql_template"], protocol, assets, chains,
+                                                 "{{start_date}}", "{{end_date}}")
+            key = (protocol, None, None)
+            schedule(key, cache.make_key(sql=template), lambda fetch_start, key=key, template=template: DuneJob(
+                key=key,
+                sql=template.replace("{{start_date}}", fetch_start).replace("{{end_date}}", END_DATE)
+            ))
+    
+    logger.info(f"Submitting {len(jobs)} executions for {len(protocols)} protocols")
+    
+    def on_complete(job: DuneJob) -> None:
+        cache_key, lookup = lookups[job.key]
+        rows = cache.merge_tail(lookup.rows, pd.DataFrame(job.rows or []))
+        cache.store(cache_key, lookup.start_date or START_DATE, END_DATE, rows,
+                    credits=job.credits, previous=lookup)
+        if 'date' in rows.columns:
+            rows = rows[rows['date'] >= START_DATE].reset_index(drop=True)
+        handle_rows(job.key, rows)
+    
+    if jobs:
+        scheduler = DuneExecutionScheduler(client, max_in_flight=MAX_IN_FLIGHT, credit_budget=CREDIT_BUDGET)
+        scheduler.run(jobs, on_complete=on_complete)
+    logger.info(cache.report())
+    
+    return all_data
+
+# Function to stream all targets into per-pool CSVs with bounded memory
+def fetch_all_data_streaming(client: DuneClient) -> Dict[str, pd.DataFrame]:
+    """Run the batched queries and split result pages into per-pool CSVs as they arrive.
+
+    The result cache is bypassed in this mode. The returned mapping reads each pool
+    file only when accessed, so building the summary holds one pool at a time.
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    jobs = []
+    splitters = {}
+    
+    protocols = [protocol for protocol in DUNE_QUERIES
+                 if any(target in protocol for target in TARGET_PROTOCOLS)]
+    
+    for protocol in protocols:
+        assets = [asset for asset in TARGET_ASSETS
+                  if any(is_valid_combination(protocol, asset, chain) for chain in TARGET_CHAINS)]
+        chains = [chain for chain in TARGET_CHAINS
+                  if any(is_valid_combination(protocol, asset, chain) for asset in assets)]
+        splitters[protocol] = PoolCsvSplitter(OUTPUT_DIR, protocol, assets, chains, is_valid=is_valid_combination,
+                                              date_format=BUCKET_DATE_FORMATS[TIME_BUCKET])
+        
+        query_config = DUNE_QUERIES[protocol]
+        if query_config["query_id"]:
+            for asset in assets:
+                for chain in chains:
+                    if is_valid_combination(protocol, asset, chain):
+                        jobs.append(DuneJob(
+                            key=(protocol, asset, chain),
+                            query_id=query_config["query_id"],
+                            parameters=build_query_parameters(asset, chain, START_DATE, END_DATE)
+                        ))
+        else:
+            sql = prepare_batched_sql_query(query_config["sql_template"], protocol, assets, chains, START_DATE, END_DATE)
+            jobs.append(DuneJob(key=(protocol, None, None), sql=sql))
+    
+    def on_page(job: DuneJob, rows: List[Dict[str, Any]]) -> None:
+        protocol, asset, chain = job.key
+        if asset is not None:
+            # Single-pool saved queries: tag rows so the splitter routes them to one file
+            rows = [dict(row, asset=asset.upper(), chain=chain) for row in rows]
+        splitters[protocol].write(rows)
+    
+    logger.info(f"Streaming {len(jobs)} executions for {len(protocols)} protocols")
+    scheduler = DuneExecutionScheduler(client, max_in_flight=MAX_IN_FLIGHT, credit_budget=CREDIT_BUDGET)
+    scheduler.run(jobs, on_page=on_page)
+    
+    capabilities = get_capabilities()
+    for job in jobs:
+        if job.state != "completed":
+            continue
+        protocol, asset, chain = job.key
+        splitter = splitters[protocol]
+        if asset is None:
+            expected = [(protocol, a, c) for a in splitter.asset_names.values() for c in splitter.chain_names.values()
+                        if is_valid_combination(protocol, a, c)]
+        else:
+            expected = [job.key]
+        found = [(protocol, a, c) for a, c in splitter.pools_written]
+        capabilities.record_results(expected, found)
+        for triple in found:
+            get_registry().record_dune_pool(*triple)
+    
+    # Files of a job that did not complete hold a truncated history; drop them
+    for job in jobs:
+        if job.state == "completed":
+            continue
+        protocol, asset, chain = job.key
+        splitter = splitters[protocol]
+        for path in splitter.discard(None if asset is None else [splitter.pool_name(asset, chain)]):
+            logger.warning(f"Removed {path}: the execution for {job.key} did not complete")
+    
+    paths = {}
+    for splitter in splitters.values():
+        for pool_name, count in splitter.rows_written.items():
+            logger.info(f"Streamed {count} rows to {splitter.paths[pool_name]}")
+        paths.update(splitter.paths)
+    return LazyPoolFrames(paths)
+
 # Function to check if a protocol-asset-chain combination is valid
 def is_valid_combination(protocol: str, asset: str, chain: str) -> bool:
     """Check if a protocol-asset-chain combination is valid"""
@@ -518,7 +807,26 @@ def is_valid_combination(protocol: str, asset: str, chain: str) -> bool:
     if asset == "usde" and protocol not in ["aave-v3", "ethena-usde", "morpho-blue"]:
         return False
     
-    return True
+    # Only query markets that exist according to the pool registry and past results
+    return get_capabilities().supports(protocol, asset, chain)
+
+# Capability index shared by all fetches in this process
+_capabilities: Optional[CapabilityIndex] = None
+_registry: Optional[PoolRegistry] = None
+
+def get_capabilities() -> CapabilityIndex:
+    """Load the capability index on first use"""
+    global _capabilities
+    if _capabilities is None:
+        _capabilities = CapabilityIndex.load()
+    return _capabilities
+
+def get_registry() -> PoolRegistry:
+    """Open the pool registry on first use"""
+    global _registry
+    if _registry is None:
+        _registry = PoolRegistry()
+    return _registry
 
 # Function to check Dune API status
 def check_dune_api_status(client: DuneClient) -> bool:
@@ -531,9 +839,19 @@ def check_dune_api_status(client: DuneClient) -> bool:
         logger.error(f"Error connecting to Dune API: {str(e)}")
         return False
 
+# Function to export the latest stored result of a saved query
+def export_latest_result(client: DuneClient, query_id: int = LATEST_RESULT_QUERY_ID) -> None:
+    """Write the latest stored result of a saved query to data/dune/dune_query_{id}.csv"""
+    path = os.path.join(OUTPUT_DIR, f"dune_query_{query_id}.csv")
+    try:
+        stream_latest_result_to_csv(client, query_id, path)
+    except Exception as e:
+        logger.error(f"Error exporting latest result of query {query_id}: {str(e)}")
+
 # Main function
 def main() -> None:
     """Main function to collect data from Dune Analytics"""
+    configure_logging()
     logger.info("Starting Dune Analytics data collection")
     logger.info(f"Target date range: {START_DATE} to {END_DATE}")
     
@@ -562,22 +880,12 @@ def main() -> None:
         else:
             logger.warning("No data was collected. Please check your queries and parameters.")
         
+        export_latest_result(client)
+        
     except Exception as e:
         logger.error(f"Error in data collection: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
 
-from dune_client.client import DuneClient
-import os
-import pandas as pd
-
-dune = DuneClient(os.environ.get("DUNE_API_KEY"))
-query_result = dune.get_latest_result(5266260)
-
-df = pd.DataFrame(query_result.get_rows())
-
-os.makedirs("data/dune", exist_ok=True)
-df.to_csv("data/dune/dune_query_5266260.csv", index=False)
-
 if __name__ == "__main__":
     main()
@@ -3,15 +3,57 @@ EtherScan Gas Tracker API Integration Module
 
 This module provides functions to interact with the EtherScan Gas Tracker API
 to retrieve historical gas fee data for Ethereum and other networks.
+
+Responses are cached in two tiers: an in-process LRU in front of JSON files in
+the cache directory. The disk cache is bounded and evicts the least recently
+written files first. Concurrent callers asking for the same uncached response
+share one upstream request, and the gas oracle is served stale-while-revalidate:
+an expired value is returned immediately while a background refresh runs.
+Multi-network calls query all explorers in parallel with a per-network timeout
+and report failed or slow networks alongside the results that did arrive.
+Historical daily gas prices are fetched and cached in calendar-month chunks, so
+overlapping or extended ranges only request the months that are not cached yet.
 """
 
 import os
 import json
 import time
+import threading
 import requests
 import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from profiling import count
+
+GAS_ORACLE_STALE_TTL = 3600  # Seconds an expired gas oracle value may still be served
+NETWORK_TIMEOUT = 10         # Seconds to wait for each explorer in multi-network calls
+HISTORY_TIMEOUT = 120        # Same for historical multi-network downloads
+REQUEST_TIMEOUT = 30         # Seconds before a single HTTP request is abandoned
+CHUNK_WORKERS = 4            # Parallel requests when fetching missing history chunks
+
+
+def month_chunks(start_date: datetime, end_date: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a date range into calendar-month chunks.
+    
+    Args:
+        start_date: Start date
+        end_date: End date
+        
+    Returns:
+        List of (first second, last second) of every month touching the range
+    """
+    chunks = []
+    month = datetime(start_date.year, start_date.month, 1)
+    while month <= end_date:
+        next_month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        chunks.append((month, next_month - timedelta(seconds=1)))
+        month = next_month
+    return chunks
+
 
 class EtherScanAPI:
     """
@@ -19,15 +61,22 @@ class EtherScanAPI:
     """
     
     def __init__(self, api_key: Optional[str] = None, 
-                cache_dir: str = "data/etherscan"):
+                cache_dir: str = "data/etherscan",
+                memory_cache_size: int = 256,
+                max_cache_mb: float = 100):
         """
         Initialize the EtherScan API client.
         
         Args:
             api_key: EtherScan API key (optional, but recommended for higher rate limits)
             cache_dir: Directory to store cached API responses
+            memory_cache_size: Number of responses kept in the in-process LRU
+            max_cache_mb: Size limit of the cached JSON files in cache_dir; expired and
+                short-lived entries are evicted first, each class least recently used first
         """
         self.cache_dir = cache_dir
+        self.memory_cache_size = memory_cache_size
+        self.max_cache_bytes = int(max_cache_mb * 1024 * 1024)
         self.base_urls = {
             "ethereum": "https://api.etherscan.io/api",
             "arbitrum": "https://api.arbiscan.io/api",
@@ -46,9 +95,20 @@ class EtherScanAPI:
             "optimism": os.environ.get("OPTIMISTIC_ETHERSCAN_API_KEY"),
         }
         os.makedirs(cache_dir, exist_ok=True)
+        
+        # cache_file -> (response, stored_at), most recently used last
+        self._memory_cache: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        # cache_file -> seconds it stays usable (TTL plus stale TTL) and last access in this process
+        self._lifetimes: Dict[str, float] = {}
+        self._accessed: Dict[str, float] = {}
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._disk_usage = sum(entry.stat().st_size for entry in os.scandir(cache_dir)
+                               if entry.is_file() and entry.name.endswith(".json"))
     
     def _make_request(self, network: str, params: Dict, 
-                     cache_file: Optional[str] = None, cache_ttl: int = 3600) -> Dict:
+                     cache_file: Optional[str] = None, cache_ttl: int = 3600,
+                     stale_ttl: int = 0) -> Dict:
         """
         Make a request to the EtherScan API with caching.
         
@@ -57,28 +117,155 @@ class EtherScanAPI:
             params: Query parameters
             cache_file: File name for caching the response
             cache_ttl: Cache time-to-live in seconds (default: 1 hour)
+            stale_ttl: Seconds after expiry during which the cached response is still
+                returned while it is refreshed in the background (default: 0, disabled)
             
         Returns:
             API response as dictionary
         """
         if network not in self.base_urls:
             raise ValueError(f"Unsupported network: {network}")
-            
-        base_url = self.base_urls[network]
         
-        if cache_file:
-            cache_path = os.path.join(self.cache_dir, cache_file)
-            
-            # Check if cache exists and is fresh
-            if os.path.exists(cache_path):
-                file_age = time.time() - os.path.getmtime(cache_path)
-                if file_age < cache_ttl:
-                    try:
-                        with open(cache_path, 'r') as f:
-                            return json.load(f)
-                    except (json.JSONDecodeError, IOError):
-                        # Cache is invalid, continue with request
-                        pass
+        if not cache_file:
+            return self._fetch(network, params)
+        
+        with self._lock:
+            self._lifetimes[cache_file] = cache_ttl + stale_ttl
+        cached = self._cache_get(cache_file)
+        if cached is not None:
+            data, stored_at = cached
+            age = time.time() - stored_at
+            if age < cache_ttl:
+                count('cache_hits')
+                return data
+            if age < cache_ttl + stale_ttl:
+                count('cache_hits')
+                self._refresh_in_background(network, params, cache_file)
+                return data
+        
+        count('cache_misses')
+        return self._fetch_coalesced(network, params, cache_file)
+    
+    def _cache_get(self, cache_file: str) -> Optional[Tuple[Dict, float]]:
+        """Look up a response in memory, then on disk; returns (response, stored_at)"""
+        with self._lock:
+            cached = self._memory_cache.get(cache_file)
+            if cached is not None:
+                self._memory_cache.move_to_end(cache_file)
+                self._accessed[cache_file] = time.time()
+                return cached
+        
+        cache_path = os.path.join(self.cache_dir, cache_file)
+        try:
+            stat = os.stat(cache_path)
+            with open(cache_path, 'r') as f:
+                data = json.load(f)
+            # The access time records the hit for eviction in later runs; the
+            # modification time is when the response was stored and stays as is
+            os.utime(cache_path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except (OSError, json.JSONDecodeError):
+            # Missing or invalid cache file, continue with request
+            return None
+        stored_at = stat.st_mtime
+        self._remember(cache_file, data, stored_at)
+        return data, stored_at
+    
+    def _remember(self, cache_file: str, data: Dict, stored_at: float) -> None:
+        with self._lock:
+            self._accessed[cache_file] = time.time()
+            self._memory_cache[cache_file] = (data, stored_at)
+            self._memory_cache.move_to_end(cache_file)
+            while len(self._memory_cache) > self.memory_cache_size:
+                self._memory_cache.popitem(last=False)
+    
+    def _cache_put(self, cache_file: str, data: Dict) -> None:
+        """Store a response in both tiers and keep the disk cache under its size limit"""
+        self._remember(cache_file, data, time.time())
+        
+        cache_path = os.path.join(self.cache_dir, cache_file)
+        tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        new_size = os.path.getsize(tmp_path)
+        with self._lock:
+            old_size = os.path.getsize(cache_path) if os.path.exists(cache_path) else 0
+            os.replace(tmp_path, cache_path)
+            self._disk_usage += new_size - old_size
+            if self._disk_usage > self.max_cache_bytes:
+                self._evict(keep=cache_file)
+    
+    def _eviction_order(self, entry: os.DirEntry, now: float) -> Tuple[int, float]:
+        """Sort key for eviction: expired, then short-lived, then unknown, then final entries,
+        least recently used first within each"""
+        stat = entry.stat()
+        lifetime = self._lifetimes.get(entry.name)
+        if lifetime is None:
+            rank = 2
+        elif lifetime == float("inf"):
+            rank = 3
+        else:
+            rank = 0 if now - stat.st_mtime > lifetime else 1
+        return rank, self._accessed.get(entry.name, stat.st_atime)
+    
+    def _evict(self, keep: str) -> None:
+        """Delete cached files until the disk cache fits its limit (lock held)"""
+        now = time.time()
+        entries = sorted((entry for entry in os.scandir(self.cache_dir)
+                          if entry.is_file() and entry.name.endswith(".json") and entry.name != keep),
+                         key=lambda entry: self._eviction_order(entry, now))
+        for entry in entries:
+            if self._disk_usage <= self.max_cache_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._disk_usage -= size
+            self._memory_cache.pop(entry.name, None)
+            self._accessed.pop(entry.name, None)
+    
+    def _fetch_coalesced(self, network: str, params: Dict, cache_file: str) -> Dict:
+        """Fetch and cache a response; concurrent callers for the same file share one request"""
+        with self._lock:
+            future = self._in_flight.get(cache_file)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[cache_file] = future
+        if not owner:
+            return future.result()
+        
+        try:
+            data = self._fetch(network, params)
+            self._cache_put(cache_file, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_file, None)
+    
+    def _refresh_in_background(self, network: str, params: Dict, cache_file: str) -> None:
+        """Refresh an expired response without blocking the caller"""
+        with self._lock:
+            if cache_file in self._in_flight:
+                return
+        
+        def refresh():
+            try:
+                self._fetch_coalesced(network, params, cache_file)
+            except Exception as e:
+                print(f"Error refreshing {cache_file}: {e}")
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def _fetch(self, network: str, params: Dict) -> Dict:
+        """Make the actual API request and check the response for errors"""
+        base_url = self.base_urls[network]
+        params = dict(params)
         
         # Add API key if available
         network_api_key = self.api_keys.get(network)
@@ -88,7 +275,7 @@ class EtherScanAPI:
         params["apikey"] = network_api_key
         
         # Make the API request
-        response = requests.get(base_url, params=params)
+        response = requests.get(base_url, params=params, timeout=REQUEST_TIMEOUT)
         
         # Check for API errors
         if response.status_code != 200:
@@ -104,19 +291,15 @@ class EtherScanAPI:
             elif data.get("message") != "No transactions found":
                 raise Exception(f"API error: {error_msg}")
         
-        # Cache the response
-        if cache_file:
-            with open(cache_path, 'w') as f:
-                json.dump(data, f)
-        
         return data
     
-    def get_gas_oracle(self, network: str = "ethereum") -> Dict:
+    def get_gas_oracle(self, network: str = "ethereum", use_cache: bool = True) -> Dict:
         """
         Get current gas prices from the gas oracle.
         
         Args:
             network: Blockchain network
+            use_cache: Set to False to always ask the explorer, e.g. when sampling
             
         Returns:
             Current gas price data
@@ -126,8 +309,13 @@ class EtherScanAPI:
             "action": "gasoracle"
         }
         
+        if not use_cache:
+            return self._make_request(network, params)
+        
         cache_file = f"{network}_gas_oracle.json"
-        data = self._make_request(network, params, cache_file=cache_file, cache_ttl=300)  # Short TTL for current prices
+        # Short TTL for current prices; an expired price is served while it refreshes
+        data = self._make_request(network, params, cache_file=cache_file, cache_ttl=300,
+                                  stale_ttl=GAS_ORACLE_STALE_TTL)
         
         return data
     
@@ -136,6 +324,10 @@ class EtherScanAPI:
         """
         Get daily average gas prices for a date range.
         
+        The range is fetched as calendar-month chunks that are cached separately, and
+        only chunks missing from the cache are requested, in parallel. Months that have
+        ended are cached for good; the current month expires after an hour.
+        
         Args:
             start_date: Start date
             end_date: End date
@@ -148,44 +340,65 @@ class EtherScanAPI:
         if network != "ethereum":
             print(f"Warning: Daily average gas price is only available for Ethereum mainnet, not {network}")
             return pd.DataFrame()
-            
-        # Convert dates to timestamps
-        start_timestamp = int(start_date.timestamp())
-        end_timestamp = int(end_date.timestamp())
         
-        # Prepare cache file name
-        date_range = f"{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}"
-        cache_file = f"{network}_daily_gas_{date_range}.json"
+        chunks = month_chunks(start_date, end_date)
+        rows = []
+        with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks)) or 1) as pool:
+            futures = [pool.submit(self._get_daily_gas_chunk, network, chunk_start, chunk_end)
+                       for chunk_start, chunk_end in chunks]
+            for (chunk_start, _), future in zip(chunks, futures):
+                try:
+                    rows.extend(future.result())
+                except Exception as e:
+                    print(f"Error retrieving daily average gas prices for {chunk_start:%Y-%m}: {e}")
+        
+        if not rows:
+            print(f"No gas price data available for the specified date range on {network}")
+            return pd.DataFrame()
+        
+        # Convert to DataFrame
+        df = pd.DataFrame(rows)
+        
+        # Convert timestamp to datetime
+        df["timestamp"] = pd.to_datetime(pd.to_numeric(df["unixTimeStamp"]), unit="s")
+        
+        # Convert gas price from Wei to Gwei
+        df["gas_price_gwei"] = pd.to_numeric(df["avgGasPrice_Wei"]) / 1e9
+        
+        # Keep the requested days only, in order
+        in_range = (df["timestamp"] >= pd.Timestamp(start_date.date())) & \
+                   (df["timestamp"] < pd.Timestamp(end_date.date()) + pd.Timedelta(days=1))
+        df = df[in_range].drop_duplicates("unixTimeStamp").sort_values("timestamp", ignore_index=True)
+        return df
+    
+    def _get_daily_gas_chunk(self, network: str, chunk_start: datetime, chunk_end: datetime) -> List[Dict]:
+        """
+        Get the daily average gas prices of one month chunk, from cache when possible.
+        
+        Args:
+            network: Blockchain network
+            chunk_start: First second of the month
+            chunk_end: Last second of the month
+            
+        Returns:
+            List of daily rows as returned by the API
+        """
+        cache_file = f"{network}_daily_gas_{chunk_start.strftime('%Y%m')}.json"
+        # A month fetched after it ended will not change any more; one fetched while
+        # it was running is missing its later days and stays on the normal TTL
+        cached = self._cache_get(cache_file)
+        final = cached is not None and cached[1] > chunk_end.timestamp()
         
-        # Prepare API parameters
         params = {
             "module": "stats",
             "action": "dailyavggasprice",
-            "startdate": start_timestamp,
-            "enddate": end_timestamp
+            "startdate": int(chunk_start.timestamp()),
+            "enddate": int(chunk_end.timestamp())
         }
-        
-        try:
-            data = self._make_request(network, params, cache_file=cache_file)
-            
-            if "result" in data and data["result"]:
-                # Convert to DataFrame
-                df = pd.DataFrame(data["result"])
-                
-                # Convert timestamp to datetime
-                df["timestamp"] = pd.to_datetime(df["unixTimeStamp"], unit="s")
-                
-                # Convert gas price from Wei to Gwei
-                df["gas_price_gwei"] = pd.to_numeric(df["avgGasPrice_Wei"]) / 1e9
-                
-                return df
-            else:
-                print(f"No gas price data available for the specified date range on {network}")
-                return pd.DataFrame()
-                
-        except Exception as e:
-            print(f"Error retrieving daily average gas prices: {e}")
-            return pd.DataFrame()
+        data = self._make_request(network, params, cache_file=cache_file,
+                                  cache_ttl=float("inf") if final else 3600)
+        result = data.get("result")
+        return result if isinstance(result, list) else []
     
     def get_historical_gas_prices(self, days: int = 365, 
                                 network: str = "ethereum") -> pd.DataFrame:
@@ -204,48 +417,109 @@ class EtherScanAPI:
         
         return self.get_daily_average_gas_price(start_date, end_date, network)
     
+    def fan_out(self, func: Callable[[str], Any], networks: Optional[List[str]] = None,
+                timeout: float = NETWORK_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+        """
+        Call func(network) for several networks in parallel.
+        
+        Args:
+            func: Function taking a network name
+            networks: Networks to query (defaults to all supported networks)
+            timeout: Seconds to wait for the networks; slower ones are reported as timed out
+            
+        Returns:
+            Dictionary mapping each network to {"data", "error", "elapsed"}; "error" is None
+            on success, and failures never raise
+        """
+        if networks is None:
+            networks = list(self.base_urls.keys())
+        if not networks:
+            return {}
+        
+        def timed(network):
+            start = time.perf_counter()
+            try:
+                return {"data": func(network), "error": None, "elapsed": time.perf_counter() - start}
+            except Exception as e:
+                return {"data": None, "error": str(e), "elapsed": time.perf_counter() - start}
+        
+        pool = ThreadPoolExecutor(max_workers=len(networks))
+        futures = {network: pool.submit(timed, network) for network in networks}
+        # All networks start together, so one deadline is a per-network timeout
+        wait(futures.values(), timeout=timeout)
+        # Do not wait for explorers that are still hanging
+        pool.shutdown(wait=False, cancel_futures=True)
+        
+        results = {}
+        for network, future in futures.items():
+            if future.done():
+                results[network] = future.result()
+            else:
+                results[network] = {"data": None, "error": f"timed out after {timeout}s", "elapsed": timeout}
+        return results
+    
+    def get_gas_oracle_multi_network(self, networks: Optional[List[str]] = None,
+                                     timeout: float = NETWORK_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+        """
+        Get current gas prices from all networks in parallel.
+        
+        Args:
+            networks: Networks to query (defaults to all supported networks)
+            timeout: Seconds to wait for each explorer
+            
+        Returns:
+            Dictionary mapping each network to {"data", "error", "elapsed"}
+        """
+        return self.fan_out(self.get_gas_oracle, networks, timeout)
+    
     def get_gas_prices_multi_network(self, days: int = 365, 
-                                   networks: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+                                   networks: Optional[List[str]] = None,
+                                   timeout: float = HISTORY_TIMEOUT) -> Dict[str, pd.DataFrame]:
         """
         Get historical gas prices for multiple networks.
         
         Args:
             days: Number of days of historical data
             networks: List of networks to query (defaults to all supported networks)
+            timeout: Seconds to wait for each network
             
         Returns:
             Dictionary mapping network names to DataFrames with gas price data
         """
-        if networks is None:
-            networks = list(self.base_urls.keys())
-        
         results = {}
         
-        for network in networks:
-            try:
-                df = self.get_historical_gas_prices(days, network)
-                if not df.empty:
-                    results[network] = df
-            except Exception as e:
-                print(f"Error retrieving gas prices for {network}: {e}")
+        responses = self.fan_out(lambda network: self.get_historical_gas_prices(days, network),
+                                 networks, timeout)
+        for network, response in responses.items():
+            if response["error"]:
+                print(f"Error retrieving gas prices for {network}: {response['error']}")
+            elif not response["data"].empty:
+                results[network] = response["data"]
         
         return results
     
-    def compare_network_fees(self, transaction_type: str = "standard") -> pd.DataFrame:
+    def compare_network_fees(self, transaction_type: str = "standard",
+                             timeout: float = NETWORK_TIMEOUT) -> pd.DataFrame:
         """
         Compare current gas fees across different networks.
         
+        All explorers are queried in parallel, so the comparison takes about as long as
+        the slowest one. Networks that fail or exceed the timeout get an "Error" row.
+        
         Args:
             transaction_type: Type of transaction (standard, fast, fastest)
+            timeout: Seconds to wait for each explorer
             
         Returns:
-            DataFrame comparing gas fees across networks
+            DataFrame comparing gas fees across networks, with an "error" column
         """
         results = []
         
-        for network in self.base_urls.keys():
+        for network, response in self.get_gas_oracle_multi_network(timeout=timeout).items():
             try:
-                data = self.get_gas_oracle(network)
+                if response["error"]:
+                    raise Exception(response["error"])
+                data = response["data"]
                 
                 if "result" in data:
                     result = data["result"]
@@ -263,14 +537,16 @@ class EtherScanAPI:
                     results.append({
                         "network": network,
                         "gas_price_gwei": gas_price,
-                        "timestamp": datetime.now()
+                        "timestamp": datetime.now(),
+                        "error": None
                     })
             except Exception as e:
                 print(f"Error retrieving gas oracle data for {network}: {e}")
                 results.append({
                     "network": network,
                     "gas_price_gwei": "Error",
-                    "timestamp": datetime.now()
+                    "timestamp": datetime.now(),
+                    "error": str(e)
                 })
         
         return pd.DataFrame(results)
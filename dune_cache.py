@@ -0,0 +1,202 @@
+"""
+Content-addressed local cache for Dune Analytics query results.
+
+Entries are keyed by a hash of the rendered SQL (with the date range left as
+placeholders) or of the query ID plus its non-date parameters, so the same query
+over a longer or shorter range maps to the same entry. Each entry remembers the
+date range it covers and when it was fetched:
+
+- rows for days before the fetch date are final and never expire;
+- a range that included the fetch day is only trusted for `ttl_hours`;
+- when only the end date moved, `lookup` asks for just the missing tail, which is
+  merged with the cached rows by `merge_tail`.
+
+The cache also keeps per-run counters so collectors can report credits saved.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, List, Optional
+
+import pandas as pd
+
+from dune_scheduler import fetch_result_pages
+from profiling import count
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "data/dune/cache"
+DEFAULT_TTL_HOURS = 6
+DATE_FORMAT = '%Y-%m-%d'   # Daily buckets; hourly queries use '%Y-%m-%d %H:%M:%S'
+
+
+@dataclass
+class CacheLookup:
+    """Outcome of a cache lookup: 'hit', 'tail' or 'miss'"""
+    status: str
+    rows: Optional[pd.DataFrame] = None
+    fetch_start: Optional[str] = None
+    credits: float = 0.0
+    start_date: Optional[str] = None   # First day covered by the cached rows
+
+
+def _day(value: str) -> date:
+    return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def normalize_dates(rows: pd.DataFrame, date_format: str = DATE_FORMAT) -> pd.DataFrame:
+    """Format the date column with `date_format` so cached and fresh rows line up"""
+    if 'date' in rows.columns and not rows.empty:
+        rows = rows.copy()
+        rows['date'] = pd.to_datetime(rows['date'].astype(str).str[:19]).dt.strftime(date_format)
+    return rows
+
+
+class DuneResultCache:
+    """Local result cache with date-range aware freshness rules"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, ttl_hours: float = DEFAULT_TTL_HOURS,
+                 date_format: str = DATE_FORMAT):
+        self.cache_dir = cache_dir
+        self.ttl_hours = ttl_hours
+        self.date_format = date_format
+        self.hits = 0
+        self.tails = 0
+        self.misses = 0
+        self.credits_saved = 0.0
+
+    @staticmethod
+    def make_key(sql: Optional[str] = None, query_id: Optional[int] = None,
+                 parameters: Optional[List[Any]] = None) -> str:
+        """Hash of the rendered SQL, or of the query ID plus its (non-date) parameters"""
+        params = []
+        for parameter in parameters or []:
+            spec = parameter.to_dict() if hasattr(parameter, 'to_dict') else parameter
+            params.append(spec)
+        material = json.dumps({'sql': sql, 'query_id': query_id, 'params': params},
+                              sort_keys=True, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()[:32]
+
+    def _paths(self, key: str):
+        return (os.path.join(self.cache_dir, f"{key}.json"),
+                os.path.join(self.cache_dir, f"{key}.csv"))
+
+    def _load(self, key: str):
+        meta_path, rows_path = self._paths(key)
+        if not os.path.exists(meta_path) or not os.path.exists(rows_path):
+            return None, None
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            rows = pd.read_csv(rows_path, dtype={'date': str})
+        except (json.JSONDecodeError, IOError, pd.errors.EmptyDataError):
+            return None, None
+        return meta, rows
+
+    def lookup(self, key: str, start_date: str, end_date: str) -> CacheLookup:
+        """Decide whether [start_date, end_date] is served from cache, needs a tail, or a full run"""
+        meta, rows = self._load(key)
+        if meta is None or _day(meta['start_date']) > _day(start_date):
+            self.misses += 1
+            count('cache_misses')
+            return CacheLookup('miss')
+
+        fetched_at = datetime.fromisoformat(meta['fetched_at'])
+        age_hours = (datetime.now(timezone.utc) - fetched_at).total_seconds() / 3600
+        # Days before the fetch day were complete when fetched, so they never expire
+        final_until = min(_day(meta['end_date']), fetched_at.date() - timedelta(days=1))
+        if age_hours < self.ttl_hours:
+            final_until = _day(meta['end_date'])
+
+        if 'date' in rows.columns:
+            # Compare by day, so every hourly bucket of the last day is kept
+            days = rows['date'].str[:10]
+            in_range = rows[(days >= start_date[:10]) & (days <= end_date[:10])]
+        else:
+            in_range = rows
+        if _day(end_date) <= final_until:
+            self.hits += 1
+            count('cache_hits')
+            self.credits_saved += meta.get('credits', 0.0)
+            logger.info(f"Cache hit for {key} ({start_date} to {end_date})")
+            return CacheLookup('hit', rows=in_range.reset_index(drop=True), credits=meta.get('credits', 0.0))
+
+        if final_until >= _day(start_date):
+            self.tails += 1
+            count('cache_misses')
+            fetch_start = (final_until + timedelta(days=1)).strftime('%Y-%m-%d')
+            # Keep everything before the tail, including days earlier than start_date
+            cached = rows[rows['date'] < fetch_start] if 'date' in rows.columns else rows
+            logger.info(f"Cache covers {key} until {final_until}, fetching tail from {fetch_start}")
+            return CacheLookup('tail', rows=cached.reset_index(drop=True), fetch_start=fetch_start,
+                               credits=meta.get('credits', 0.0), start_date=meta['start_date'])
+
+        self.misses += 1
+        count('cache_misses')
+        return CacheLookup('miss')
+
+    def store(self, key: str, start_date: str, end_date: str, rows: pd.DataFrame,
+              credits: float = 0.0, previous: Optional[CacheLookup] = None) -> None:
+        """Save rows covering [start_date, end_date]; `previous` is the lookup a tail was merged into"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta_path, rows_path = self._paths(key)
+        if previous is not None and previous.status == 'tail':
+            # The tail replaced a full re-run of the range
+            self.credits_saved += max(previous.credits - credits, 0.0)
+            credits = max(previous.credits, credits)
+        normalize_dates(rows, self.date_format).to_csv(rows_path, index=False)
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'start_date': start_date,
+                'end_date': end_date,
+                'fetched_at': datetime.now(timezone.utc).isoformat(),
+                'credits': credits,
+                'rows': len(rows)
+            }, f, indent=2)
+
+    def merge_tail(self, cached: Optional[pd.DataFrame], tail: pd.DataFrame) -> pd.DataFrame:
+        """Append freshly fetched tail rows to cached rows, preferring the fresh values"""
+        tail = normalize_dates(tail, self.date_format)
+        if cached is None or cached.empty:
+            return tail.reset_index(drop=True)
+        merged = pd.concat([cached, tail], ignore_index=True)
+        key_columns = [col for col in ['date', 'asset', 'chain'] if col in merged.columns]
+        if key_columns:
+            merged = merged.drop_duplicates(subset=key_columns, keep='last')
+            merged = merged.sort_values(key_columns, ignore_index=True)
+        return merged
+
+    def latest_result_if_fresh(self, client, query, max_age_hours: Optional[float] = None,
+                               estimated_credits: float = 1.0) -> Optional[pd.DataFrame]:
+        """Rows of the query's latest stored result when it is recent enough, without executing it"""
+        max_age_hours = self.ttl_hours if max_age_hours is None else max_age_hours
+        try:
+            # A one-row sample carries the execution time; an unlimited age never triggers a re-run
+            sample = client.get_latest_result(query, max_age_hours=float('inf'), sample_count=1)
+        except Exception as e:
+            logger.warning(f"Could not read latest result for {query}: {e}")
+            return None
+        ended_at = sample.times.execution_ended_at
+        if ended_at is None:
+            return None
+        age_hours = (datetime.now(timezone.utc) - ended_at).total_seconds() / 3600
+        if age_hours > max_age_hours:
+            return None
+        try:
+            rows = [row for page in fetch_result_pages(client, sample.execution_id) for row in page]
+        except Exception as e:
+            logger.warning(f"Could not download latest result of {query}: {e}")
+            return None
+        self.hits += 1
+        count('cache_hits')
+        self.credits_saved += estimated_credits
+        logger.info(f"Using latest result of {query} from {ended_at:%Y-%m-%d %H:%M} UTC")
+        return pd.DataFrame(rows)
+
+    def report(self) -> str:
+        return (f"Dune cache: {self.hits} hits, {self.tails} tail fetches, {self.misses} misses, "
+                f"~{self.credits_saved:.1f} credits saved")
@@ -0,0 +1,142 @@
+"""
+Capability index of (protocol, asset, chain) markets that actually exist.
+
+The index is built from the pool registry (pool_registry.py) kept by the collectors,
+the DefiLlama /pools snapshot (full_pools.json) and the history of Dune queries
+that came back empty. It is persisted to data/dune/capabilities.json and rebuilt
+automatically when one of its sources is newer than the index, so new markets
+are picked up on the next run. `fetch_all_data` only queries triples the index
+supports, which avoids paying for executions that are known to return nothing.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from pool_registry import REGISTRY_FILE, PoolRegistry
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "data/dune/capabilities.json"
+SNAPSHOT_FILE = "full_pools.json"
+EMPTY_RETRY_DAYS = 30   # Re-check a market that came back empty after this many days
+CHAIN_ALIASES = {"bsc": "bnb", "binance": "bnb", "avax": "avalanche", "matic": "polygon"}
+
+Triple = Tuple[str, str, str]
+
+
+def normalize_triple(protocol: str, asset: str, chain: str) -> Triple:
+    chain = chain.strip().lower()
+    return protocol.strip().lower(), asset.strip().lower(), CHAIN_ALIASES.get(chain, chain)
+
+
+def _key(triple: Triple) -> str:
+    return "|".join(triple)
+
+
+class CapabilityIndex:
+    """Which (protocol, asset, chain) triples exist, plus a record of empty Dune results"""
+
+    def __init__(self, path: str = INDEX_FILE, registry_file: str = REGISTRY_FILE,
+                 snapshot_file: str = SNAPSHOT_FILE):
+        self.path = path
+        self.registry_file = registry_file
+        self.snapshot_file = snapshot_file
+        self.markets: Set[Triple] = set()
+        self.empty: Dict[str, Dict] = {}
+        self.built_at: Optional[float] = None
+        self.dirty = False
+
+    def _sources(self):
+        return [source for source in (self.registry_file, self.snapshot_file) if os.path.exists(source)]
+
+    @classmethod
+    def load(cls, path: str = INDEX_FILE, **kwargs) -> "CapabilityIndex":
+        """Load the persisted index, rebuilding it when any source changed since it was built"""
+        index = cls(path, **kwargs)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                index.markets = {tuple(key.split('|')) for key in data.get('markets', [])}
+                index.empty = data.get('empty', {})
+                index.built_at = data.get('built_at')
+            except (json.JSONDecodeError, IOError):
+                logger.warning(f"Capability index {path} is unreadable, rebuilding")
+
+        sources = index._sources()
+        if index.built_at is None or any(os.path.getmtime(s) > index.built_at for s in sources):
+            index.build()
+        return index
+
+    def build(self) -> None:
+        """Rebuild the set of known markets from the pool registry and the DefiLlama snapshot"""
+        with PoolRegistry(self.registry_file) as registry:
+            markets = {normalize_triple(*triple) for triple in registry.markets()}
+
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r') as f:
+                    pools = json.load(f).get('data', [])
+            except (json.JSONDecodeError, IOError):
+                pools = []
+            for pool in pools:
+                project, symbol, chain = pool.get('project'), pool.get('symbol'), pool.get('chain')
+                if not (project and symbol and chain):
+                    continue
+                # Multi-asset pools are listed as e.g. "USDC-USDT"
+                for asset in symbol.split('-'):
+                    markets.add(normalize_triple(project, asset, chain))
+
+        added = len(markets - self.markets)
+        self.markets = markets
+        self.built_at = datetime.now().timestamp()
+        self.dirty = True
+        logger.info(f"Built capability index with {len(markets)} markets ({added} new)")
+
+    def supports(self, protocol: str, asset: str, chain: str) -> bool:
+        """True if the market is known to exist and has not recently come back empty"""
+        if not self.markets:
+            # No registry or snapshot yet: nothing to prune with
+            return True
+        triple = normalize_triple(protocol, asset, chain)
+        if triple not in self.markets:
+            return False
+        empty = self.empty.get(_key(triple))
+        if empty:
+            last_empty = datetime.fromisoformat(empty['last_empty'])
+            if datetime.now() - last_empty < timedelta(days=EMPTY_RETRY_DAYS):
+                return False
+        return True
+
+    def record_result(self, protocol: str, asset: str, chain: str, empty: bool) -> None:
+        """Remember whether a Dune query for this market returned rows"""
+        key = _key(normalize_triple(protocol, asset, chain))
+        if empty:
+            entry = self.empty.setdefault(key, {'count': 0})
+            entry['count'] += 1
+            entry['last_empty'] = datetime.now().isoformat(timespec='seconds')
+            self.dirty = True
+        elif key in self.empty:
+            del self.empty[key]
+            self.dirty = True
+
+    def record_results(self, expected: Iterable[Triple], found: Iterable[Triple]) -> None:
+        """Record a batched query: every expected triple not in `found` came back empty"""
+        found = {normalize_triple(*triple) for triple in found}
+        for triple in expected:
+            self.record_result(*triple, empty=normalize_triple(*triple) not in found)
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({
+                'built_at': self.built_at,
+                'markets': sorted(_key(triple) for triple in self.markets),
+                'empty': self.empty
+            }, f, indent=1)
+        self.dirty = False
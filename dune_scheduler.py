@@ -0,0 +1,210 @@
+"""
+Concurrent execution scheduler for Dune Analytics queries.
+
+Instead of blocking on `client.run_query` for each query in turn, the scheduler
+submits executions up to a cap on in-flight executions, polls their states
+concurrently and fetches each result as soon as its execution completes. Total
+collection time therefore approaches the slowest single query rather than the
+sum of all queries. A credit budget stops new submissions once the estimated
+spend would exceed it.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    from dune_client.client import DuneClient
+    from dune_client.types import QueryParameter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 3
+DEFAULT_POLL_INTERVAL = 2.0      # Seconds between status polls
+DEFAULT_TIMEOUT = 900            # Seconds before an execution is cancelled
+RESULT_PAGE_SIZE = 32_000        # Rows per results page
+
+
+@dataclass
+class DuneJob:
+    """A single Dune execution: raw SQL or a saved query ID with parameters"""
+    key: Any
+    sql: Optional[str] = None
+    query_id: Optional[int] = None
+    parameters: List[QueryParameter] = field(default_factory=list)
+    estimated_credits: float = 1.0
+    # Filled in by the scheduler
+    execution_id: Optional[str] = None
+    state: str = "queued"
+    rows: Optional[List[Dict[str, Any]]] = None
+    row_count: int = 0
+    credits: float = 0.0
+    error: Optional[str] = None
+    submitted_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.submitted_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+
+def fetch_result_pages(client: DuneClient, execution_id: str, page_size: int = RESULT_PAGE_SIZE):
+    """Yield result rows of a completed execution page by page"""
+    offset = 0
+    while True:
+        page = client.get_execution_results(execution_id, limit=page_size, offset=offset)
+        yield page.get_rows()
+        if page.next_offset is None:
+            break
+        offset = page.next_offset
+
+
+class DuneExecutionScheduler:
+    """Submit many Dune executions, poll them concurrently and collect results"""
+
+    def __init__(self, client: DuneClient, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 credit_budget: Optional[float] = None, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 timeout: float = DEFAULT_TIMEOUT, workers: int = 8):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.credit_budget = credit_budget
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.workers = workers
+        self.credits_spent = 0.0
+
+    def _reserved_credits(self, in_flight: Dict[str, DuneJob]) -> float:
+        return sum(job.estimated_credits for job in in_flight.values())
+
+    def _submit(self, job: DuneJob) -> None:
+        from dune_client.query import QueryBase
+
+        if job.query_id:
+            query = QueryBase(query_id=job.query_id, params=job.parameters)
+            response = self.client.execute_query(query)
+        else:
+            response = self.client.execute_sql(job.sql)
+        job.execution_id = response.execution_id
+        job.state = "submitted"
+        job.submitted_at = time.monotonic()
+        logger.info(f"Submitted {job.key} as execution {job.execution_id}")
+
+    def _fetch(self, job: DuneJob, on_page: Optional[Callable[[DuneJob, List[Dict[str, Any]]], None]] = None) -> DuneJob:
+        rows = []
+        for page in fetch_result_pages(self.client, job.execution_id):
+            job.row_count += len(page)
+            if on_page:
+                # Streaming: hand each page over instead of keeping the whole result
+                on_page(job, page)
+            else:
+                rows.extend(page)
+        job.rows = None if on_page else rows
+        return job
+
+    def run(self, jobs: Iterable[DuneJob],
+            on_complete: Optional[Callable[[DuneJob], None]] = None,
+            on_page: Optional[Callable[[DuneJob, List[Dict[str, Any]]], None]] = None) -> Dict[Any, DuneJob]:
+        """Run all jobs and return them by key
+
+        on_complete is called as each result arrives. When on_page is given, results are
+        streamed: it is called from worker threads with each page and job.rows stays None.
+        """
+        from dune_client.models import ExecutionState
+
+        jobs = list(jobs)
+        pending = deque(jobs)
+        in_flight: Dict[str, DuneJob] = {}
+        fetching = {}
+
+        # Polls get their own threads so they (and the timeouts) never wait behind large downloads
+        with ThreadPoolExecutor(max_workers=self.workers) as pool, \
+                ThreadPoolExecutor(max_workers=max(self.max_in_flight, 1)) as poller:
+            while pending or in_flight or fetching:
+                # Top up in-flight executions within the cap and the credit budget
+                while pending and len(in_flight) < self.max_in_flight:
+                    job = pending.popleft()
+                    if self.credit_budget is not None and \
+                            self.credits_spent + self._reserved_credits(in_flight) + job.estimated_credits > self.credit_budget:
+                        job.state = "skipped"
+                        job.error = "credit budget exhausted"
+                        logger.warning(f"Skipping {job.key}: credit budget of {self.credit_budget} exhausted")
+                        continue
+                    try:
+                        self._submit(job)
+                        in_flight[job.execution_id] = job
+                    except Exception as e:
+                        job.state = "failed"
+                        job.error = str(e)
+                        logger.error(f"Error submitting {job.key}: {e}")
+
+                # Poll all in-flight executions at once
+                if in_flight:
+                    statuses = dict(zip(in_flight, poller.map(self._safe_status, list(in_flight))))
+                    now = time.monotonic()
+                    for execution_id, status in statuses.items():
+                        job = in_flight[execution_id]
+                        # A failed poll (status None) still counts against the timeout
+                        if status is not None and status.state in ExecutionState.terminal_states():
+                            del in_flight[execution_id]
+                            job.credits = status.execution_cost_credits or job.estimated_credits
+                            self.credits_spent += job.credits
+                            if status.state == ExecutionState.COMPLETED:
+                                job.state = "fetching"
+                                fetching[pool.submit(self._fetch, job, on_page)] = job
+                            else:
+                                job.state = "failed"
+                                job.error = str(status.error or status.state)
+                                job.finished_at = now
+                                logger.error(f"Execution {execution_id} for {job.key} ended as {status.state}")
+                        elif now - job.submitted_at > self.timeout:
+                            del in_flight[execution_id]
+                            self._cancel(job)
+
+                # Hand over results as they arrive
+                if fetching:
+                    # Only block on downloads when there is nothing left to submit or poll
+                    done, _ = wait(list(fetching), timeout=0 if in_flight or pending else None,
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = fetching.pop(future)
+                        job.finished_at = time.monotonic()
+                        try:
+                            future.result()
+                            job.state = "completed"
+                            logger.info(f"Fetched {job.row_count} rows for {job.key} in {job.elapsed:.1f}s")
+                            if on_complete:
+                                on_complete(job)
+                        except Exception as e:
+                            job.state = "failed"
+                            job.error = str(e)
+                            logger.error(f"Error fetching results for {job.key}: {e}")
+
+                if in_flight:
+                    time.sleep(self.poll_interval)
+
+        logger.info(f"Finished {len(jobs)} executions, {self.credits_spent:.1f} credits spent")
+        return {job.key: job for job in jobs}
+
+    def _safe_status(self, execution_id: str):
+        try:
+            return self.client.get_execution_status(execution_id)
+        except Exception as e:
+            logger.warning(f"Error polling execution {execution_id}: {e}")
+            return None
+
+    def _cancel(self, job: DuneJob) -> None:
+        job.state = "failed"
+        job.error = f"timed out after {self.timeout}s"
+        job.finished_at = time.monotonic()
+        logger.error(f"Execution {job.execution_id} for {job.key} timed out, cancelling")
+        try:
+            self.client.cancel_execution(job.execution_id)
+        except Exception as e:
+            logger.warning(f"Error cancelling execution {job.execution_id}: {e}")
@@ -0,0 +1,158 @@
+"""
+Streaming, paginated ingestion of large Dune Analytics results.
+
+Results are pulled one page at a time, each page is converted to typed columns
+and appended straight to the output CSVs, so peak memory depends on the page
+size rather than on the number of rows a query returns. `PoolCsvSplitter`
+splits the pages of a batched query into per-pool CSVs incrementally.
+"""
+
+import csv
+import logging
+import os
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from dune_scheduler import RESULT_PAGE_SIZE as PAGE_SIZE, fetch_result_pages
+
+logger = logging.getLogger(__name__)
+
+TEXT_COLUMNS = {'asset', 'chain', 'protocol', 'symbol', 'token_symbol', 'blockchain'}
+DATE_FORMAT = '%Y-%m-%d'   # Format of date columns; hourly results use '%Y-%m-%d %H:%M:%S'
+
+
+def iter_latest_result_pages(client, query_id: int, page_size: int = PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the rows of a saved query's latest result page by page, without re-executing it"""
+    # A one-row sample identifies the latest execution; an unlimited age never triggers a re-run
+    execution_id = client.get_latest_result(query_id, max_age_hours=float('inf'), sample_count=1).execution_id
+    yield from fetch_result_pages(client, execution_id, page_size)
+
+
+def page_to_frame(rows: List[Dict[str, Any]], date_format: str = DATE_FORMAT) -> pd.DataFrame:
+    """Convert one page of result rows to typed columns, dates formatted with `date_format`"""
+    df = pd.DataFrame(rows)
+    for col in df.columns:
+        if col == 'date' or col.endswith('_date') or col == 'block_time':
+            df[col] = pd.to_datetime(df[col].astype(str).str[:19], errors='coerce').dt.strftime(date_format)
+        elif col not in TEXT_COLUMNS:
+            converted = pd.to_numeric(df[col], errors='coerce')
+            # Keep genuinely textual columns as they are
+            if converted.notna().sum() >= df[col].notna().sum():
+                df[col] = converted.astype('float64')
+    return df
+
+
+def stream_pages_to_csv(pages, path: str) -> int:
+    """Append typed pages to a single CSV file; returns the number of rows written"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    total = 0
+    columns = None
+    with open(path, 'w', newline='') as f:
+        for rows in pages:
+            if not rows:
+                continue
+            df = page_to_frame(rows)
+            if columns is None:
+                columns = list(df.columns)
+                df.to_csv(f, index=False)
+            else:
+                df.reindex(columns=columns).to_csv(f, index=False, header=False)
+            total += len(df)
+    logger.info(f"Streamed {total} rows to {path}")
+    return total
+
+
+def stream_latest_result_to_csv(client, query_id: int, path: str, page_size: int = PAGE_SIZE) -> int:
+    """Write a saved query's latest result to CSV page by page"""
+    return stream_pages_to_csv(iter_latest_result_pages(client, query_id, page_size), path)
+
+
+class PoolCsvSplitter:
+    """Split pages of a batched result on (asset, chain) and append them to per-pool CSVs"""
+
+    COLUMNS = ['date', 'tvl', 'apy', 'apy_base', 'apy_reward']
+
+    def __init__(self, output_dir: str, protocol: str, assets: List[str], chains: List[str],
+                 is_valid=None, date_format: str = DATE_FORMAT):
+        self.output_dir = output_dir
+        self.date_format = date_format
+        self.protocol = protocol
+        self.asset_names = {asset.upper(): asset for asset in assets}
+        self.chain_names = {chain.lower(): chain for chain in chains}
+        self.is_valid = is_valid
+        self.rows_written: Dict[str, int] = {}
+        self.paths: Dict[str, str] = {}
+        self.pools_written = set()   # (asset, chain) pairs that received rows
+        self._lock = threading.Lock()
+
+    def pool_name(self, asset: str, chain: str) -> str:
+        return f"{self.protocol}_{asset}_{chain}".replace(' ', '_')
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        """Append one page of rows to the matching pool files"""
+        if not rows:
+            return
+        df = page_to_frame(rows, self.date_format)
+        if 'asset' not in df.columns or 'chain' not in df.columns:
+            logger.warning(f"Batched result for {self.protocol} has no asset/chain columns")
+            return
+        if 'apy_base' not in df.columns and 'apy' in df.columns:
+            df['apy_base'] = df['apy']
+        if 'apy_reward' not in df.columns:
+            df['apy_reward'] = 0.0
+
+        with self._lock:
+            for (asset_symbol, chain_value), pool_df in df.groupby(['asset', 'chain']):
+                asset = self.asset_names.get(str(asset_symbol).upper())
+                chain = self.chain_names.get(str(chain_value).lower())
+                if asset is None or chain is None:
+                    continue
+                if self.is_valid is not None and not self.is_valid(self.protocol, asset, chain):
+                    continue
+                pool_name = self.pool_name(asset, chain)
+                path = os.path.join(self.output_dir, f"{pool_name}.csv")
+                first = pool_name not in self.rows_written
+                # The first page of this run replaces any file left from a previous run
+                pool_df.reindex(columns=self.COLUMNS).to_csv(
+                    path, mode='w' if first else 'a', header=first, index=False,
+                    quoting=csv.QUOTE_MINIMAL)
+                self.rows_written[pool_name] = self.rows_written.get(pool_name, 0) + len(pool_df)
+                self.paths[pool_name] = path
+                self.pools_written.add((asset, chain))
+
+    def discard(self, pool_names=None) -> List[str]:
+        """Delete the files of the given pools (default: all written so far); returns their paths"""
+        with self._lock:
+            names = list(self.paths) if pool_names is None else [name for name in pool_names if name in self.paths]
+            removed = []
+            for pool_name in names:
+                path = self.paths.pop(pool_name)
+                self.rows_written.pop(pool_name, None)
+                if os.path.exists(path):
+                    os.remove(path)
+                removed.append(path)
+            return removed
+
+    def load(self, pool_name: str) -> Optional[pd.DataFrame]:
+        """Read back one finished pool file"""
+        path = self.paths.get(pool_name)
+        return pd.read_csv(path) if path else None
+
+
+class LazyPoolFrames(Mapping):
+    """Read-only {pool_name: DataFrame} mapping that loads each pool CSV only when accessed"""
+
+    def __init__(self, paths: Dict[str, str]):
+        self.paths = dict(paths)
+
+    def __getitem__(self, pool_name: str) -> pd.DataFrame:
+        return pd.read_csv(self.paths[pool_name])
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Script to sample the EtherScan gas oracle on an interval and keep an intra-day gas history.
+
+Each sample is one fixed-width 20-byte record (uint32 unix time and four float32
+prices in gwei: safe, propose, fast and base fee) appended to
+data/etherscan/samples/{network}.bin. The files have no header, so they are read
+as memory-mapped numpy arrays, and since samples are appended in time order a
+time range is found with a binary search. A year of per-minute samples is about
+10 MB per network.
+
+Usage:
+    python gas_sampler.py run --interval 60                 # sample all networks until stopped
+    python gas_sampler.py summary ethereum --freq 1h        # hourly percentiles
+    python gas_sampler.py summary ethereum --freq 1D --export-daily
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from collect_etherscan import EtherScanAPI
+
+SAMPLES_DIR = "data/etherscan/samples"
+DAILY_DIR = "data/etherscan"
+DEFAULT_INTERVAL = 60  # Seconds between samples
+FIELDS = ["safe", "propose", "fast", "base_fee"]
+ORACLE_FIELDS = {"safe": "SafeGasPrice", "propose": "ProposeGasPrice",
+                 "fast": "FastGasPrice", "base_fee": "suggestBaseFee"}
+RECORD = np.dtype([("ts", "<u4")] + [(field, "<f4") for field in FIELDS])
+PERCENTILES = [10, 50, 90]
+
+
+def sample_path(network: str, directory: str = SAMPLES_DIR) -> str:
+    return os.path.join(directory, f"{network}.bin")
+
+
+def oracle_to_record(data: Dict, timestamp: Optional[float] = None) -> np.ndarray:
+    """Convert a gas oracle response into one storage record; missing prices become NaN"""
+    result = data.get("result") if isinstance(data, dict) else None
+    record = np.zeros(1, dtype=RECORD)
+    record["ts"] = int(timestamp if timestamp is not None else time.time())
+    for field, key in ORACLE_FIELDS.items():
+        try:
+            record[field] = float(result[key])
+        except (TypeError, KeyError, ValueError):
+            record[field] = np.nan
+    return record
+
+
+def append_records(network: str, records: np.ndarray, directory: str = SAMPLES_DIR) -> None:
+    """Append records to a network's sample file, dropping a partial record left by an interrupted write"""
+    os.makedirs(directory, exist_ok=True)
+    with open(sample_path(network, directory), "ab") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size % RECORD.itemsize:
+            f.truncate(size // RECORD.itemsize * RECORD.itemsize)
+        f.write(np.ascontiguousarray(records, dtype=RECORD).tobytes())
+
+
+def load_samples(network: str, directory: str = SAMPLES_DIR) -> np.ndarray:
+    """Memory-mapped view of all samples of a network (empty if none)"""
+    path = sample_path(network, directory)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=RECORD)
+    # Ignore a trailing partial record left by an interrupted write
+    count = os.path.getsize(path) // RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", shape=(count,))
+
+
+def read_samples(network: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 directory: str = SAMPLES_DIR) -> pd.DataFrame:
+    """Samples of a network between start and end as a DataFrame indexed by time"""
+    samples = load_samples(network, directory)
+    lo = np.searchsorted(samples["ts"], int(start.timestamp())) if start else 0
+    hi = np.searchsorted(samples["ts"], int(end.timestamp()), side="right") if end else len(samples)
+    window = np.asarray(samples[lo:hi])
+    df = pd.DataFrame({field: window[field] for field in FIELDS},
+                      index=pd.to_datetime(window["ts"], unit="s"))
+    df.index.name = "timestamp"
+    return df
+
+
+def resample_samples(network: str, freq: str = "1h", field: str = "propose",
+                     percentiles: List[int] = PERCENTILES, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None, directory: str = SAMPLES_DIR) -> pd.DataFrame:
+    """Percentiles, mean and sample count of one price field per period"""
+    samples = read_samples(network, start, end, directory)[field].dropna()
+    if samples.empty:
+        return pd.DataFrame(columns=[f"p{p}" for p in percentiles] + ["mean", "samples"])
+    periods = samples.index.floor(freq)
+    grouped = samples.groupby(periods)
+    summary = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    summary.columns = [f"p{p}" for p in percentiles]
+    summary["mean"] = grouped.mean()
+    summary["samples"] = grouped.size()
+    summary.index.name = "timestamp"
+    return summary
+
+
+def export_daily(network: str, field: str = "propose", directory: str = SAMPLES_DIR,
+                 output_dir: str = DAILY_DIR) -> str:
+    """Write the daily median as {network}_daily_gas.csv, the format transaction_costs.py reads"""
+    daily = resample_samples(network, "1D", field, [50], directory=directory)
+    path = os.path.join(output_dir, f"{network}_daily_gas.csv")
+    pd.DataFrame({"date": daily.index.strftime("%Y-%m-%d"), "gas_price_gwei": daily["p50"].round(6)}) \
+        .to_csv(path, index=False)
+    return path
+
+
+class GasSampler:
+    """Poll the gas oracle of several networks on a fixed interval and append the samples"""
+
+    def __init__(self, api: EtherScanAPI, networks: Optional[List[str]] = None,
+                 interval: float = DEFAULT_INTERVAL, directory: str = SAMPLES_DIR):
+        self.api = api
+        self.networks = networks or [n for n, key in api.api_keys.items() if key]
+        if not self.networks:
+            raise ValueError("No networks to sample: pass --networks or set an Etherscan API key")
+        self.interval = interval
+        self.directory = directory
+
+    def sample_once(self) -> Dict[str, Optional[str]]:
+        """Take one sample of every network in parallel; returns the error per network"""
+        timestamp = time.time()
+        responses = self.api.fan_out(lambda network: self.api.get_gas_oracle(network, use_cache=False),
+                                     self.networks, timeout=self.interval / 2)
+        errors = {}
+        for network, response in responses.items():
+            errors[network] = response["error"]
+            if response["error"] is None:
+                append_records(network, oracle_to_record(response["data"], timestamp), self.directory)
+        return errors
+
+    def run(self, samples: Optional[int] = None) -> None:
+        """Sample on interval boundaries until stopped, or `samples` times"""
+        print(f"Sampling {', '.join(self.networks)} every {self.interval:g}s into {self.directory}")
+        taken = 0
+        while samples is None or taken < samples:
+            # Sleep to the next interval boundary so samples stay evenly spaced
+            time.sleep(self.interval - time.time() % self.interval)
+            errors = self.sample_once()
+            taken += 1
+            failed = {network: error for network, error in errors.items() if error}
+            if failed:
+                print(f"{datetime.now():%H:%M:%S} errors: {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="sample the gas oracle until stopped")
+    run.add_argument("--networks", nargs="+", help="networks to sample (default: all with an API key)")
+    run.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between samples")
+    run.add_argument("--samples", type=int, default=None, help="stop after this many samples")
+
+    summary = subparsers.add_parser("summary", help="print percentiles of the stored samples")
+    summary.add_argument("network")
+    summary.add_argument("--freq", default="1h", help="pandas frequency, e.g. 15min, 1h, 1D")
+    summary.add_argument("--field", default="propose", choices=FIELDS)
+    summary.add_argument("--export-daily", action="store_true",
+                         help=f"also write the daily median to {DAILY_DIR}/<network>_daily_gas.csv")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        try:
+            sampler = GasSampler(EtherScanAPI(), args.networks, args.interval)
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            sampler.run(args.samples)
+        except KeyboardInterrupt:
+            print("\nStopped")
+        return
+
+    start = time.perf_counter()
+    stats = resample_samples(args.network, args.freq, args.field)
+    elapsed = time.perf_counter() - start
+    print(stats.round(4).to_string())
+    print(f"\n{int(stats['samples'].sum()) if not stats.empty else 0} samples summarized in {elapsed * 1000:.1f} ms")
+    if args.export_daily:
+        print(f"Saved daily medians to {export_daily(args.network, args.field)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Record/replay harness for benchmarking the collectors without network access.
+
+All three collectors (collect_defi_data, collect_dune_data through dune_client,
+and EtherScanAPI) go through `requests.Session.request`, so patching that one
+method captures every request they make:
+
+- `record` runs a collector against the live APIs and appends each exchange
+  (method, URL, body, status code, latency, response body) to a JSONL cassette.
+  API keys are stripped from the recorded URLs.
+- `replay` starts a local HTTP server that serves the cassette back and points
+  the collector at it. Latency is the recorded one unless overridden, can be
+  jittered, and a request-rate limit answers excess requests with 429 the way
+  the real APIs do. Recorded 429s are served as recorded.
+
+Repeated requests for the same URL (e.g. Dune status polls) are answered with
+the recorded responses in order, then the last one again.
+
+Options of the harness come before `--`; everything after it is passed to the script.
+
+Usage:
+    python http_replay.py record cassettes/defillama.jsonl collect_defi_data.py
+    python http_replay.py replay cassettes/defillama.jsonl collect_defi_data.py --latency 0.05 --jitter 0.2
+    python http_replay.py replay cassettes/dune.jsonl cli.py --rate-limit 5 -- dune
+    python http_replay.py serve cassettes/etherscan.jsonl --port 8765
+"""
+
+import argparse
+import json
+import os
+import random
+import runpy
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+SECRET_PARAMS = {'apikey', 'api_key'}
+KEPT_HEADERS = {'content-type', 'retry-after'}
+
+
+def strip_secrets(url):
+    """URL without API key query parameters, with the query sorted"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in SECRET_PARAMS)
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+def request_key(method, url, body=None):
+    """Match key of a request: method, host and path, sorted query without keys, and body"""
+    parts = urlsplit(strip_secrets(url))
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    return f"{method.upper()} {parts.netloc}{parts.path}?{parts.query} {body or ''}"
+
+
+def load_cassette(path):
+    """Recorded exchanges grouped by request key, in recording order"""
+    exchanges = defaultdict(list)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                exchanges[request_key(entry['method'], entry['url'], entry.get('request_body'))].append(entry)
+    return exchanges
+
+
+class Recorder:
+    """Append request/response pairs to a JSONL cassette"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def record(self, response, latency):
+        request = response.request
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='replace')
+        entry = {
+            'method': request.method,
+            'url': strip_secrets(request.url),
+            'request_body': body,
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            'body': response.text,
+            'latency': round(latency, 4),
+            'recorded_at': time.time()
+        }
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.count += 1
+
+
+class ReplayServer:
+    """Local HTTP server answering requests from a cassette"""
+
+    def __init__(self, cassette, host='127.0.0.1', port=0, latency=None, jitter=0.0,
+                 rate_limit=None, seed=None):
+        """
+        Args:
+            cassette: Path of a JSONL cassette written by `record`
+            latency: Seconds per response; None replays the recorded latency
+            jitter: Relative jitter applied to the latency, e.g. 0.2 for +/-20%
+            rate_limit: Requests per second before answering 429, None for no limit
+            seed: Seed for the jitter, for reproducible runs
+        """
+        self.exchanges = load_cassette(cassette)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.misses = 0
+        self._served = defaultdict(int)
+        self._tokens = float(rate_limit or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _take_token(self):
+        """Token bucket: False when the request exceeds the configured rate"""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def respond(self, method, path, body):
+        """(status, headers, body, delay) for a request whose path starts with the original host"""
+        url = f"https://{path.lstrip('/')}"
+        key = request_key(method, url, body)
+        with self._lock:
+            self.requests += 1
+            if not self._take_token():
+                self.throttled += 1
+                return 429, {'Content-Type': 'application/json', 'Retry-After': '1'}, \
+                    json.dumps({'status': '0', 'message': 'Max rate limit reached'}), 0.0
+            entries = self.exchanges.get(key)
+            if not entries:
+                self.misses += 1
+                return 404, {'Content-Type': 'application/json'}, \
+                    json.dumps({'error': f'not recorded: {key}'}), 0.0
+            index = min(self._served[key], len(entries) - 1)
+            self._served[key] += 1
+            entry = entries[index]
+            delay = entry.get('latency', 0.0) if self.latency is None else self.latency
+            if self.jitter:
+                delay *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return entry['status'], entry.get('headers', {}), entry['body'], max(delay, 0.0)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else None
+                status, headers, payload, delay = server.respond(self.command, self.path, body)
+                if delay:
+                    time.sleep(delay)
+                data = payload.encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def report(self):
+        return (f"Replay server: {self.requests} requests, {self.throttled} throttled, "
+                f"{self.misses} not in cassette")
+
+
+@contextmanager
+def recording(path):
+    """Record every request made through requests while the block runs"""
+    recorder = Recorder(path)
+    original = requests.Session.request
+
+    def request(session, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        response = original(session, method, url, *args, **kwargs)
+        recorder.record(response, time.perf_counter() - start)
+        return response
+
+    requests.Session.request = request
+    try:
+        yield recorder
+    finally:
+        requests.Session.request = original
+
+
+@contextmanager
+def replaying(server):
+    """Send every request made through requests to a running ReplayServer"""
+    original = requests.Session.request
+
+    def request(session, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        local = f"{server.url}/{parts.netloc}{parts.path}"
+        if parts.query:
+            local += f"?{parts.query}"
+        return original(session, method, local, *args, **kwargs)
+
+    requests.Session.request = request
+    try:
+        yield server
+    finally:
+        requests.Session.request = original
+
+
+def run_script(script, script_args):
+    """Run a collector script as __main__ in this process; returns the wall-clock time"""
+    argv = sys.argv
+    sys.argv = [script] + list(script_args)
+    start = time.perf_counter()
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            print(f"{script} exited with {e.code}")
+    finally:
+        sys.argv = argv
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help='run a script against the live APIs and record it')
+    record.add_argument('cassette')
+    record.add_argument('script')
+
+    for name, help_text in [('replay', 'run a script against a replay server'),
+                            ('serve', 'only start the replay server')]:
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('cassette')
+        if name == 'replay':
+            sub.add_argument('script')
+        else:
+            sub.add_argument('--port', type=int, default=8765)
+        sub.add_argument('--latency', type=float, default=None,
+                         help='seconds per response (default: recorded latency)')
+        sub.add_argument('--jitter', type=float, default=0.0, help='relative latency jitter, e.g. 0.2')
+        sub.add_argument('--rate-limit', type=float, default=None, help='requests per second before 429')
+        sub.add_argument('--seed', type=int, default=None, help='random seed for the jitter')
+
+    argv = sys.argv[1:]
+    script_args = argv[argv.index('--') + 1:] if '--' in argv else []
+    args = parser.parse_args(argv[:argv.index('--')] if '--' in argv else argv)
+
+    if args.command == 'record':
+        with recording(args.cassette) as recorder:
+            elapsed = run_script(args.script, script_args)
+        print(f"\nRecorded {recorder.count} requests to {args.cassette} in {elapsed:.2f}s")
+        return
+
+    server = ReplayServer(args.cassette, port=getattr(args, 'port', 0), latency=args.latency,
+                          jitter=args.jitter, rate_limit=args.rate_limit, seed=args.seed).start()
+    try:
+        if args.command == 'serve':
+            print(f"Serving {args.cassette} on {server.url} (requests go to {server.url}/<original host>/<path>)")
+            while True:
+                time.sleep(3600)
+        with replaying(server):
+            elapsed = run_script(args.script, script_args)
+        print(f"\nReplayed {args.script} in {elapsed:.2f}s")
+        print(server.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
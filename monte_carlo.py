@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Block-bootstrap Monte Carlo of strategy outcomes.
+
+report.md and strategy.analyze_strategy judge the strategies on the one history
+that was collected. This script resamples it: a synthetic path is a sequence of
+blocks of BLOCK_DAYS consecutive historical days drawn with replacement, and
+every day is a whole row of the dates x pools APY matrix (summary_apy.csv, a
+pool counting only on days it has TVL), so the correlation between pools and
+the persistence of yields within a block are kept.
+
+Every path is run through three policies:
+
+- best: hold the highest-APY pool of each day, as strategy.find_best_protocols;
+- top_k: hold the TOP_K highest-APY pools of each day in equal parts;
+- fee_aware: keep the current pool until the day's best pool would earn back the
+  cost of switching within HOLD_DAYS, or until the current pool has no data.
+
+Entering a pool pays a deposit and leaving it a withdraw, priced per chain and
+historical day by transaction_costs.build_cost_matrix, so net APY and the
+drawdown of the account value are reported per deposit size.
+
+The daily choices of the best and top_k policies only depend on the historical
+row and are computed once. Paths are generated and evaluated as (paths x days)
+arrays of row indices, PATHS_PER_BATCH at a time, and the batches run on a
+process pool. Each batch gets its own seed from one SeedSequence, so results do
+not depend on the number of workers.
+
+Usage:
+    python monte_carlo.py --paths 10000 --days 365 --sizes 10000 100000 1000000
+    python monte_carlo.py --block-days 14 --top-k 3 --workers 8
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from pool_registry import pool_parts
+from range_index import load_summary
+from transaction_costs import build_cost_matrix, normalize_chain
+from weighted_apy import load_pool_metadata, weighted_sums
+
+STATISTICS_DIR = 'statistics'
+OUTPUT_FILE = 'statistics/monte_carlo_summary.csv'
+N_PATHS = 10_000
+PATH_DAYS = 365
+BLOCK_DAYS = 30          # Consecutive historical days per bootstrap block
+TOP_K = 5
+HOLD_DAYS = 30           # Horizon within which the fee-aware policy must earn back a switch
+PATHS_PER_BATCH = 250
+DEPOSIT_SIZES = [10_000, 100_000, 1_000_000]
+POLICIES = ['best', 'top_k', 'fee_aware']
+PERCENTILES = [5, 25, 50, 75, 95]
+SEED = 0
+
+
+@dataclass
+class Market:
+    """Historical days x pools arrays that every path is drawn from"""
+    dates: np.ndarray
+    pools: List[str]
+    apys: np.ndarray         # NaN where the pool has no TVL
+    deposit: np.ndarray      # USD cost of entering each pool on each day
+    withdraw: np.ndarray     # USD cost of leaving each pool on each day
+    top_k: int = TOP_K
+
+    def __post_init__(self):
+        available = ~np.isnan(self.apys)
+        ranked = np.where(available, self.apys, -np.inf)
+        days = np.arange(len(ranked))
+        self.best_idx = ranked.argmax(axis=1)
+        self.best_apy = self.apys[days, self.best_idx]
+        k = min(self.top_k, ranked.shape[1])
+        top = np.argpartition(-ranked, k - 1, axis=1)[:, :k]
+        # Days with fewer than k pools leave slots empty (-1)
+        self.top_idx = np.where(available[days[:, None], top], top, -1)
+        with np.errstate(invalid='ignore'):
+            self.top_apy = np.nanmean(np.where(self.top_idx >= 0, self.apys[days[:, None], top], np.nan), axis=1)
+
+
+def load_market(statistics_dir=STATISTICS_DIR, top_k=TOP_K, gas_history=None, native_prices=None):
+    """Market from the summary files, with costs per pool from the chain of each pool"""
+    apy_df, tvl_df = load_summary(statistics_dir)
+    order = np.argsort(apy_df['date'].to_numpy(dtype=str), kind='stable')
+    apy_df, tvl_df = apy_df.iloc[order], tvl_df.iloc[order]
+    _, weights, pools = weighted_sums(apy_df, tvl_df)
+    apys = np.where(weights > 0, apy_df[pools].to_numpy(dtype=float), np.nan)
+    # Days without any pool cannot be held
+    keep = (weights > 0).any(axis=1)
+    dates = apy_df['date'].to_numpy(dtype=str)[keep]
+
+    metadata = load_pool_metadata()
+    chains = [pool_parts(pool, metadata)[2] for pool in pools]
+    costs = []
+    for action in ('deposit', 'withdraw'):
+        matrix = build_cost_matrix(dates, chains, action, gas_history, native_prices)
+        rows = matrix.index.get_indexer(pd.to_datetime(pd.Series(dates)).dt.normalize())
+        cols = matrix.columns.get_indexer([normalize_chain(chain) for chain in chains])
+        costs.append(matrix.to_numpy()[np.ix_(rows, cols)])
+    return Market(dates, pools, apys[keep], costs[0], costs[1], top_k)
+
+
+def bootstrap_rows(rng, n_days, n_paths, path_days=PATH_DAYS, block_days=BLOCK_DAYS):
+    """(paths x path_days) historical row indices made of random blocks of consecutive days"""
+    block_days = min(block_days, n_days)
+    n_blocks = -(-path_days // block_days)
+    starts = rng.integers(0, n_days - block_days + 1, size=(n_paths, n_blocks))
+    return (starts[:, :, None] + np.arange(block_days)).reshape(n_paths, -1)[:, :path_days]
+
+
+def _single_pool_costs(market, rows, held):
+    """USD cost per path and day of holding one pool a day: a deposit on entry, a withdraw on exit"""
+    costs = market.deposit[rows, held]
+    switched = held[:, 1:] != held[:, :-1]
+    costs[:, 1:] = np.where(switched, costs[:, 1:] + market.withdraw[rows[:, 1:], held[:, :-1]], 0.0)
+    return costs
+
+
+def _top_k_costs(market, rows):
+    """USD cost per path and day of the top-k policy; each pool entered or left pays its own gas"""
+    top = market.top_idx[rows]
+    r = rows[:, :, None]
+    previous, current = top[:, :-1], top[:, 1:]
+    entered = (current >= 0) & ~(current[..., :, None] == previous[..., None, :]).any(axis=-1)
+    left = (previous >= 0) & ~(previous[..., :, None] == current[..., None, :]).any(axis=-1)
+    costs = np.where(top >= 0, market.deposit[r, top], 0.0)
+    costs[:, 1:] = np.where(entered, costs[:, 1:], 0.0)
+    costs = costs.sum(axis=-1)
+    costs[:, 1:] += np.where(left, market.withdraw[r[:, 1:], previous], 0.0).sum(axis=-1)
+    return costs
+
+
+def _fee_aware_held(market, rows, sizes, hold_days=HOLD_DAYS):
+    """Pool held by the fee-aware policy per size, path and day (sizes x paths x days)"""
+    n_paths, n_days = rows.shape
+    held = np.empty((len(sizes), n_paths, n_days), dtype=np.int64)
+    current = np.tile(market.best_idx[rows[:, 0]], (len(sizes), 1))
+    held[:, :, 0] = current
+    # USD earned over the horizon per APY point, per size
+    horizon = np.asarray(sizes, dtype=float)[:, None] * hold_days / 365 / 100
+    for t in range(1, n_days):
+        row = rows[:, t]
+        best = market.best_idx[row]
+        current_apy = market.apys[row, current]
+        switch_cost = market.deposit[row, best] + market.withdraw[row, current]
+        gain = (market.best_apy[row] - current_apy) * horizon
+        current = np.where(np.isnan(current_apy) | (gain > switch_cost), best, current)
+        held[:, :, t] = current
+    return held
+
+
+def path_outcomes(gross, costs, sizes):
+    """Net APY and max drawdown of the account value (%, sizes x paths)
+
+    gross holds the daily APYs and costs the USD costs per path and day, either
+    shared by all sizes (paths x days) or per size (sizes x paths x days).
+    """
+    n_days = gross.shape[-1]
+    drag = costs / np.asarray(sizes, dtype=float)[:, None, None]
+    # Daily cost charged as an annualized drag, as transaction_costs.net_apy
+    net = gross.mean(axis=-1) - drag.sum(axis=-1) * 365 / n_days * 100
+    # Value of one unit deposited: V_t = V_(t-1) * g_t - c_t, solved with cumulative products
+    growth = np.cumprod(1 + gross / 100 / 365, axis=-1)
+    value = growth * (1 - np.cumsum(drag / growth, axis=-1))
+    peak = np.maximum(np.maximum.accumulate(value, axis=-1), 1.0)
+    drawdown = (1 - value / peak).max(axis=-1) * 100
+    return np.broadcast_to(net, drawdown.shape), drawdown
+
+
+def evaluate(market, rows, sizes=DEPOSIT_SIZES, hold_days=HOLD_DAYS):
+    """{policy: (net APY, max drawdown)}, each sizes x paths, for paths of historical row indices"""
+    held = market.best_idx[rows]
+    outcomes = {
+        'best': path_outcomes(market.best_apy[rows], _single_pool_costs(market, rows, held), sizes),
+        'top_k': path_outcomes(market.top_apy[rows], _top_k_costs(market, rows), sizes),
+    }
+    held = _fee_aware_held(market, rows, sizes, hold_days)
+    costs = np.stack([_single_pool_costs(market, rows, size_held) for size_held in held])
+    outcomes['fee_aware'] = path_outcomes(market.apys[rows, held], costs, sizes)
+    return outcomes
+
+
+_market = None
+
+
+def _init_worker(market):
+    global _market
+    _market = market
+
+
+def simulate_batch(seed, n_paths, path_days, block_days, sizes, hold_days, market=None):
+    """Outcomes of one batch of bootstrapped paths"""
+    market = market if market is not None else _market
+    rows = bootstrap_rows(np.random.default_rng(seed), len(market.dates), n_paths, path_days, block_days)
+    return evaluate(market, rows, sizes, hold_days)
+
+
+def simulate(market, n_paths=N_PATHS, path_days=PATH_DAYS, block_days=BLOCK_DAYS, sizes=DEPOSIT_SIZES,
+             hold_days=HOLD_DAYS, workers=None, seed=SEED):
+    """{policy: (net APY, max drawdown)}, each sizes x n_paths, over bootstrapped paths"""
+    batches = [min(PATHS_PER_BATCH, n_paths - start) for start in range(0, n_paths, PATHS_PER_BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    args = [(batch_seed, batch, path_days, block_days, sizes, hold_days) for batch_seed, batch in zip(seeds, batches)]
+    if workers == 1:
+        results = [simulate_batch(*batch_args, market=market) for batch_args in args]
+    else:
+        # The market is sent to each worker once rather than with every batch
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(market,)) as pool:
+            results = list(pool.map(simulate_batch, *zip(*args)))
+    return {policy: tuple(np.concatenate([result[policy][i] for result in results], axis=1) for i in range(2))
+            for policy in POLICIES}
+
+
+def summarize(outcomes, sizes, historical=None):
+    """Distribution of net APY and max drawdown per policy and deposit size"""
+    rows = []
+    for policy, (net, drawdown) in outcomes.items():
+        for i, size in enumerate(sizes):
+            row = {'policy': policy, 'deposit_usd': size, 'paths': net.shape[1], 'mean_net_apy': net[i].mean()}
+            row.update({f'net_apy_p{q}': value for q, value in zip(PERCENTILES, np.percentile(net[i], PERCENTILES))})
+            row.update({
+                'mean_max_drawdown': drawdown[i].mean(),
+                'max_drawdown_p50': np.percentile(drawdown[i], 50),
+                'max_drawdown_p95': np.percentile(drawdown[i], 95),
+                'worst_max_drawdown': drawdown[i].max(),
+            })
+            if historical is not None:
+                row['historical_net_apy'] = historical[policy][0][i, 0]
+                row['historical_max_drawdown'] = historical[policy][1][i, 0]
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--paths', type=int, default=N_PATHS)
+    parser.add_argument('--days', type=int, default=PATH_DAYS, help='length of each path')
+    parser.add_argument('--block-days', type=int, default=BLOCK_DAYS)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--hold-days', type=float, default=HOLD_DAYS,
+                        help='horizon within which the fee-aware policy must earn back a switch')
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEPOSIT_SIZES, help='deposit sizes in USD')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes (1: run in this process)')
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes]
+
+    market = load_market(top_k=args.top_k)
+    print(f"Loaded {len(market.pools)} pools over {len(market.dates)} days "
+          f"({market.dates[0]} to {market.dates[-1]})")
+    historical = evaluate(market, np.arange(len(market.dates))[None, :], sizes, args.hold_days)
+
+    start = time.perf_counter()
+    outcomes = simulate(market, args.paths, args.days, args.block_days, sizes, args.hold_days, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Simulated {args.paths} paths of {args.days} days (blocks of {args.block_days}) "
+          f"on {args.workers} workers in {elapsed:.2f}s")
+
+    summary = summarize(outcomes, sizes, historical)
+    os.makedirs(STATISTICS_DIR, exist_ok=True)
+    summary.to_csv(OUTPUT_FILE, index=False)
+    print(f"\nSaved summary to {OUTPUT_FILE}")
+    columns = ['policy', 'deposit_usd', 'historical_net_apy', 'net_apy_p5', 'net_apy_p50', 'net_apy_p95',
+               'max_drawdown_p50', 'max_drawdown_p95']
+    print(summary[columns].round(3).to_string(index=False))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Incremental pipeline runner: reruns only the stages whose inputs changed.
+
+Every stage of cli.py is declared below with the files it reads, the files it
+writes and the scripts it runs. Before a stage runs, its inputs and scripts are
+fingerprinted by content (SHA-256, re-hashed only when a file's size or mtime
+changed); if the fingerprint matches the last successful run and the outputs
+are still the ones that run produced, the stage is skipped. Because downstream
+stages fingerprint the outputs rather than the fact that a stage ran, a stage
+that reran but wrote identical files does not invalidate anything after it.
+
+Stages run as `python cli.py <stage>` subprocesses as soon as the stages they
+depend on are done, so independent stages (costs, analyze, weighted, report)
+run in parallel. Each stage's output goes to .pipeline/logs/<stage>.log and
+the fingerprints to .pipeline/state.json.
+
+The collectors read live APIs rather than files, so they only run when named.
+
+Usage:
+    python pipeline.py                   # everything after the collectors, if stale
+    python pipeline.py collect           # nightly: collect, then whatever it changed
+    python pipeline.py report --force    # report and its dependencies, report always rerun
+    python pipeline.py --dry-run         # show what is stale without running anything
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+STATE_DIR = '.pipeline'
+STATE_FILE = os.path.join(STATE_DIR, 'state.json')
+LOG_DIR = os.path.join(STATE_DIR, 'logs')
+HASH_BLOCK_SIZE = 1 << 20
+# Run by every stage: the cli.py entry point and the modules it imports for all of them
+COMMON_CODE = ['cli.py', 'profiling.py', 'resample.py']
+
+
+@dataclass
+class Stage:
+    name: str
+    inputs: List[str]                      # Glob patterns of the files read
+    outputs: List[str]                     # Glob patterns of the files written
+    code: List[str]                        # Scripts whose source is part of the fingerprint
+    deps: List[str] = field(default_factory=list)
+    external: bool = False                 # Reads live APIs; only runs when named
+
+
+STAGES = [
+    Stage('collect', inputs=[], external=True,
+          outputs=['data/defillama/*.csv', 'statistics/summary_apy.csv', 'statistics/summary_tvl.csv',
+                   'data/pool_registry.db'],
+          code=COMMON_CODE + ['collect_defi_data.py', 'pool_registry.py']),
+    Stage('dune', inputs=[], external=True,
+          outputs=['data/dune/*.csv', 'data/pool_registry.db'],
+          code=COMMON_CODE + ['collect_dune_data.py', 'dune_cache.py', 'dune_capabilities.py', 'dune_stream.py',
+                         'dune_scheduler.py', 'pool_registry.py']),
+    Stage('strategy', deps=['collect'],
+          inputs=['data/defillama/*.csv', 'data/pool_registry.db'],
+          outputs=['statistics/pool_statistics.csv', 'statistics/best_*.csv'],
+          code=COMMON_CODE + ['strategy.py', 'chunked.py', 'weighted_apy.py', 'pool_registry.py']),
+    Stage('costs', deps=['strategy'],
+          inputs=['statistics/best_*.csv', 'data/etherscan/*_daily_gas_*.json', 'data/etherscan/*_daily_gas.csv',
+                  'data/prices/*.csv'],
+          outputs=['statistics/net_apy_*.csv'],
+          code=COMMON_CODE + ['transaction_costs.py']),
+    Stage('analyze', deps=['collect'],
+          inputs=['data/defillama/*.csv', 'data/pool_registry.db'],
+          outputs=['graphs/apy_*.png', 'graphs/tvl_*.png', 'graphs/aggregated_model*', 'graphs/volatility_*'],
+          code=COMMON_CODE + ['analyze_data.py', 'strategy.py', 'pool_registry.py']),
+    Stage('weighted', deps=['collect'],
+          inputs=['statistics/summary_apy.csv', 'statistics/summary_tvl.csv', 'data/pool_registry.db'],
+          outputs=['statistics/weighted_apy.csv', 'statistics/weighted_apy_by_*.csv',
+                   'statistics/weighted_apy_state.db'],
+          code=COMMON_CODE + ['weighted_apy.py', 'weighted_apy_stream.py', 'chunked.py', 'strategy.py',
+                              'pool_registry.py']),
+    Stage('report', deps=['strategy'],
+          inputs=['data/defillama/*.csv', 'statistics/best_*.csv', 'data/pool_registry.db'],
+          outputs=['graphs/report.html'],
+          code=COMMON_CODE + ['report_html.py', 'strategy.py', 'pool_registry.py']),
+]
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def expand(patterns):
+    """Sorted files matching any of the glob patterns"""
+    return sorted({path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)})
+
+
+class FileHasher:
+    """SHA-256 of file contents, cached by (size, mtime) across runs"""
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+        self._lock = threading.Lock()
+        self.hashed = 0
+
+    def digest(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            entry = self.known.get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha.update(block)
+        with self._lock:
+            self.known[path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+            self.hashed += 1
+        return sha.hexdigest()
+
+    def snapshot(self):
+        """Copy of the known hashes, safe to serialize while other threads hash"""
+        with self._lock:
+            return dict(self.known)
+
+    def combined(self, paths):
+        """One digest over the names and contents of several files"""
+        sha = hashlib.sha256()
+        for path in paths:
+            sha.update(f"{path}\0{self.digest(path)}\n".encode())
+        return sha.hexdigest()
+
+
+def fingerprint(stage, hasher):
+    """Digest of the stage's scripts and input files"""
+    files = expand(stage.inputs)
+    return hasher.combined(expand(stage.code) + files), len(files)
+
+
+def select(names):
+    """The named stages plus the non-external stages they depend on, in declaration order"""
+    if not names:
+        selected = {stage.name for stage in STAGES if not stage.external}
+    else:
+        selected = set()
+        # `all` includes the DefiLlama collector but, like cli.py, not the Dune one
+        pending = [name for name in names if name != 'all']
+        if 'all' in names:
+            pending += [stage.name for stage in STAGES if stage.name != 'dune']
+        while pending:
+            name = pending.pop()
+            if name in selected:
+                continue
+            selected.add(name)
+            pending.extend(dep for dep in STAGES_BY_NAME[name].deps if not STAGES_BY_NAME[dep].external)
+    return [stage.name for stage in STAGES if stage.name in selected]
+
+
+class PipelineRunner:
+    """Run the selected stages in dependency order, in parallel where possible"""
+
+    def __init__(self, stages, jobs=4, force=(), dry_run=False, state_file=STATE_FILE, cli_args=()):
+        self.stages = stages
+        self.cli_args = list(cli_args)
+        self.jobs = jobs
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state_file = state_file
+        self.state = self._load_state()
+        self.hasher = FileHasher(self.state.get('files'))
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {'stages': {}, 'files': {}}
+
+    def _save_state(self):
+        with self._lock:
+            self.state['files'] = self.hasher.snapshot()
+            os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+            tmp_path = f"{self.state_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=1)
+            os.replace(tmp_path, self.state_file)
+
+    def is_fresh(self, stage, digest):
+        previous = self.state['stages'].get(stage.name)
+        if not previous or previous.get('fingerprint') != digest:
+            return False
+        outputs = expand(stage.outputs)
+        return bool(outputs) and self.hasher.combined(outputs) == previous.get('outputs')
+
+    def run_stage(self, name):
+        """Fingerprint, then run or skip one stage; returns its status"""
+        stage = STAGES_BY_NAME[name]
+        digest, n_inputs = fingerprint(stage, self.hasher)
+        if name not in self.force and not stage.external and self.is_fresh(stage, digest):
+            return 'up to date', 0.0
+        if self.dry_run:
+            return 'stale', 0.0
+
+        os.makedirs(LOG_DIR, exist_ok=True)
+        log_path = os.path.join(LOG_DIR, f"{name}.log")
+        print(f"[{datetime.now():%H:%M:%S}] {name}: running ({n_inputs} input files)")
+        start = time.perf_counter()
+        with open(log_path, 'w') as log:
+            returncode = subprocess.run([sys.executable, 'cli.py', name] + self.cli_args, stdout=log, stderr=subprocess.STDOUT,
+                                        env={**os.environ, 'MPLBACKEND': 'Agg'}).returncode
+        elapsed = time.perf_counter() - start
+        if returncode != 0:
+            return f"failed (exit {returncode}, see {log_path})", elapsed
+
+        # External stages changed their inputs by running, so fingerprint them afterwards
+        if stage.external:
+            digest, _ = fingerprint(stage, self.hasher)
+        with self._lock:
+            self.state['stages'][name] = {
+                'fingerprint': digest,
+                'outputs': self.hasher.combined(expand(stage.outputs)),
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'seconds': round(elapsed, 3),
+            }
+        self._save_state()
+        return 'ran', elapsed
+
+    def run(self):
+        """Schedule every stage once the stages it depends on are done; returns status per stage"""
+        pending = list(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(self.jobs, 1)) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = [dep for dep in STAGES_BY_NAME[name].deps if dep in self.stages]
+                    if any(dep in self.results and self.results[dep][0] not in ('ran', 'up to date', 'stale')
+                           for dep in deps):
+                        self.results[name] = ('blocked by a failed dependency', 0.0)
+                        pending.remove(name)
+                    elif all(dep in self.results for dep in deps):
+                        running[pool.submit(self.run_stage, name)] = name
+                        pending.remove(name)
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        self.results[name] = (f"failed ({e})", 0.0)
+                    status, elapsed = self.results[name]
+                    suffix = f" in {elapsed:.2f}s" if status == 'ran' else ''
+                    print(f"[{datetime.now():%H:%M:%S}] {name}: {status}{suffix}")
+        if not self.dry_run:
+            self._save_state()
+        return self.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"stages to bring up to date: {', '.join(STAGES_BY_NAME)} or all "
+                             "(default: all but the collectors)")
+    parser.add_argument('--force', nargs='*', metavar='stage', default=None,
+                        help='rerun these stages even if up to date (no names: every selected stage)')
+    parser.add_argument('--jobs', type=int, default=4, help='stages run in parallel')
+    parser.add_argument('--dry-run', action='store_true', help='only report which stages are stale')
+    parser.add_argument('--memory-mb', type=float, default=None,
+                        help='passed to cli.py: run strategy and weighted out of core within this budget')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.stages + (args.force or []) if name not in STAGES_BY_NAME and name != 'all']
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    stages = select(args.stages)
+    force = stages if args.force == [] else (args.force or [])
+    cli_args = ['--memory-mb', str(args.memory_mb)] if args.memory_mb else []
+    runner = PipelineRunner(stages, jobs=args.jobs, force=force, dry_run=args.dry_run, cli_args=cli_args)
+    start = time.perf_counter()
+    results = runner.run()
+    print(f"\nPipeline finished in {time.perf_counter() - start:.2f}s "
+          f"({sum(status == 'ran' for status, _ in results.values())} of {len(results)} stages ran, "
+          f"{runner.hasher.hashed} files hashed)")
+    if args.dry_run:
+        print("Stages after a stale one may become stale once it reruns")
+    return 0 if all(status in ('ran', 'up to date', 'stale') for status, _ in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+SQLite registry of the pools the pipeline tracks.
+
+One row per pool: the DefiLlama pool UUID, the '{protocol}_{asset}_{chain}'
+name used for its data file, protocol, asset, chain, stablecoin flag, current
+TVL, the underlying token address and the first and last day the pool was
+seen by a collector. Protocol, asset, chain, TVL, stablecoin flag, address and
+name are indexed, so selecting pools (e.g. all stablecoin pools on Base above
+$10M) and joining metadata onto data files are indexed queries rather than
+re-parsing a CSV and splitting file names on '_', which breaks for assets such
+as 'COMPOUND USDT'.
+
+collect_defi_data.py and collect_dune_data.py record the pools they collect.
+The first time the registry is opened, the legacy pools_*.txt files are
+imported, so existing checkouts keep their pool list.
+
+Usage:
+    python pool_registry.py                                  # counts per protocol and chain
+    python pool_registry.py --chain Base --min-tvl 10000000  # matching pools
+    python pool_registry.py --import pools_1000000.txt
+"""
+
+import argparse
+import csv
+import glob
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILE = 'data/pool_registry.db'
+LEGACY_POOLS_GLOB = 'pools_*.txt'
+COLUMNS = ['uuid', 'name', 'protocol', 'asset', 'chain', 'is_stablecoin', 'tvl_usd', 'address',
+           'source', 'first_seen', 'last_seen']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    uuid TEXT PRIMARY KEY,                  -- DefiLlama pool UUID, 'dune:<name>' for Dune-only pools
+    name TEXT NOT NULL,                     -- '{protocol}_{asset}_{chain}', the data file stem
+    protocol TEXT NOT NULL COLLATE NOCASE,
+    asset TEXT NOT NULL COLLATE NOCASE,
+    chain TEXT NOT NULL COLLATE NOCASE,
+    is_stablecoin INTEGER NOT NULL DEFAULT 0,
+    tvl_usd REAL,
+    address TEXT COLLATE NOCASE,
+    source TEXT NOT NULL DEFAULT 'defillama',
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pools_name ON pools (name);
+CREATE INDEX IF NOT EXISTS pools_protocol ON pools (protocol);
+CREATE INDEX IF NOT EXISTS pools_chain ON pools (chain);
+CREATE INDEX IF NOT EXISTS pools_asset ON pools (asset);
+CREATE INDEX IF NOT EXISTS pools_tvl ON pools (tvl_usd);
+CREATE INDEX IF NOT EXISTS pools_stablecoin ON pools (is_stablecoin);
+CREATE INDEX IF NOT EXISTS pools_address ON pools (address);
+"""
+
+UPSERT = f"""
+INSERT INTO pools ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + column for column in COLUMNS)})
+ON CONFLICT (uuid) DO UPDATE SET
+    name = excluded.name,
+    protocol = excluded.protocol,
+    asset = excluded.asset,
+    chain = excluded.chain,
+    is_stablecoin = excluded.is_stablecoin,
+    tvl_usd = COALESCE(excluded.tvl_usd, pools.tvl_usd),
+    address = COALESCE(NULLIF(excluded.address, ''), pools.address),
+    source = excluded.source,
+    first_seen = MIN(pools.first_seen, excluded.first_seen),
+    last_seen = MAX(pools.last_seen, excluded.last_seen)
+"""
+
+
+def pool_name(protocol, asset, chain):
+    """Name of a pool's data file, as written by the collectors"""
+    return f"{protocol}_{asset}_{chain}".replace(' ', '_')
+
+
+def split_pool_name(name):
+    """(protocol, asset, chain) guessed from a name, for pools that are not registered
+
+    Protocols and chains contain no '_', so everything between the first and the
+    last part is the asset.
+    """
+    parts = name.split('_')
+    if len(parts) >= 3:
+        return parts[0], '_'.join(parts[1:-1]), parts[-1]
+    return (parts[0] or 'unknown'), (parts[1] if len(parts) > 1 else 'unknown'), 'unknown'
+
+
+def pool_parts(name, metadata=None):
+    """(protocol, asset, chain) of a pool from registry metadata, falling back to its name"""
+    if metadata is not None and name in metadata.index:
+        row = metadata.loc[name]
+        return row['protocol'], row['asset'], row['chain']
+    return split_pool_name(name)
+
+
+class PoolRegistry:
+    """Indexed pool metadata backed by SQLite"""
+
+    def __init__(self, path=REGISTRY_FILE, legacy_glob=LEGACY_POOLS_GLOB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Collectors record pools from their worker threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+        if legacy_glob and len(self) == 0:
+            for pools_file in sorted(glob.glob(legacy_glob)):
+                self.import_pools_file(pools_file)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM pools").fetchone()[0]
+
+    def upsert(self, rows, seen=None):
+        """Insert or update pools; each row is a dict with at least uuid, protocol, asset and chain"""
+        seen = (seen or date.today()).isoformat()
+        records = []
+        for row in rows:
+            record = {column: row.get(column) for column in COLUMNS}
+            record['name'] = record['name'] or pool_name(row['protocol'], row['asset'], row['chain'])
+            record['is_stablecoin'] = int(bool(record['is_stablecoin']))
+            record['source'] = record['source'] or 'defillama'
+            record['first_seen'] = record['first_seen'] or seen
+            record['last_seen'] = record['last_seen'] or seen
+            records.append(record)
+        with self._lock, self.conn:
+            self.conn.executemany(UPSERT, records)
+        return len(records)
+
+    def record_defillama_pools(self, pools, seen=None):
+        """Record pools from the DefiLlama /pools listing"""
+        return self.upsert(({
+            'uuid': pool['pool'],
+            'protocol': pool['project'],
+            'asset': pool['symbol'],
+            'chain': pool['chain'],
+            'is_stablecoin': pool.get('stablecoin', False),
+            'tvl_usd': pool.get('tvlUsd'),
+            # The first underlying token stands for the pool
+            'address': pool['underlyingTokens'][0] if pool.get('underlyingTokens') else None,
+        } for pool in pools), seen)
+
+    def record_dune_pool(self, protocol, asset, chain, seen=None):
+        """Record a pool found by a Dune query; Dune pools have no DefiLlama UUID"""
+        name = pool_name(protocol, asset, chain)
+        return self.upsert([{'uuid': f"dune:{name}", 'name': name, 'protocol': protocol,
+                             'asset': asset, 'chain': chain, 'is_stablecoin': True, 'source': 'dune'}], seen)
+
+    def import_pools_file(self, path):
+        """Import a legacy pools_*.txt file (name, pool_id, market, coin, chain, is_stablecoin, address)"""
+        seen = datetime.fromtimestamp(os.path.getmtime(path)).date()
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if None in row or not row.get('pool_id'):
+                    # Unquoted commas in a symbol shift the columns
+                    logger.warning(f"Skipping malformed line for {row.get('name')} in {path}")
+                    continue
+                rows.append({
+                    'uuid': row['pool_id'].rstrip('/').rsplit('/', 1)[-1],
+                    'name': row['name'],
+                    'protocol': row['market'],
+                    'asset': row['coin'],
+                    'chain': row['chain'],
+                    'is_stablecoin': row['is_stablecoin'] == 'True',
+                    'address': row['address'],
+                })
+        imported = self.upsert(rows, seen)
+        logger.info(f"Imported {imported} pools from {path} into {self.path}")
+        return imported
+
+    def select(self, protocol=None, asset=None, chain=None, stablecoin=None, min_tvl=None, source=None,
+               seen_since=None, exclude_protocols=None, exclude_assets=None):
+        """Registered pools matching every given filter, in registration order
+
+        exclude_protocols and exclude_assets drop pools whose protocol or asset
+        contains any of the given strings, ignoring case (e.g. 'dai' also drops sDAI).
+        """
+        clauses, params = [], []
+        for column, value in (('protocol', protocol), ('asset', asset), ('chain', chain), ('source', source)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        for column, excluded in (('protocol', exclude_protocols), ('asset', exclude_assets)):
+            for value in excluded or []:
+                clauses.append(f"instr(lower({column}), ?) = 0")
+                params.append(value.lower())
+        if stablecoin is not None:
+            clauses.append("is_stablecoin = ?")
+            params.append(int(bool(stablecoin)))
+        if min_tvl is not None:
+            clauses.append("tvl_usd >= ?")
+            params.append(min_tvl)
+        if seen_since is not None:
+            clauses.append("last_seen >= ?")
+            params.append(str(seen_since))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        return pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM pools{where} ORDER BY rowid",
+                                 self.conn, params=params)
+
+    def names(self, **filters):
+        """Set of pool names matching the filters of `select`"""
+        return set(self.select(**filters)['name'])
+
+    def metadata(self, **filters):
+        """Protocol, chain and asset per pool name; the first registered pool wins for shared names"""
+        pools = self.select(**filters)
+        return pools.drop_duplicates('name').set_index('name')[['protocol', 'chain', 'asset']] \
+            .rename_axis('pool')
+
+    def get(self, name):
+        """The first pool registered under a name, as a dict, or None"""
+        row = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM pools WHERE name = ? ORDER BY rowid LIMIT 1",
+                                (name,)).fetchone()
+        return dict(row) if row else None
+
+    def markets(self):
+        """Distinct (protocol, asset, chain) triples"""
+        return {tuple(row) for row in self.conn.execute("SELECT DISTINCT protocol, asset, chain FROM pools")}
+
+
+def load_metadata(path=REGISTRY_FILE, **filters):
+    """Pool metadata frame (index: pool name) from the registry"""
+    with PoolRegistry(path) as registry:
+        return registry.metadata(**filters)
+
+
+def load_names(path=REGISTRY_FILE, **filters):
+    """Registered pool names matching the filters"""
+    with PoolRegistry(path) as registry:
+        return registry.names(**filters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--registry', default=REGISTRY_FILE)
+    parser.add_argument('--import', dest='import_files', nargs='+', metavar='FILE',
+                        help='import legacy pools_*.txt files')
+    parser.add_argument('--protocol')
+    parser.add_argument('--asset')
+    parser.add_argument('--chain')
+    parser.add_argument('--min-tvl', type=float)
+    parser.add_argument('--stablecoin', action='store_true', default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with PoolRegistry(args.registry) as registry:
+        for path in args.import_files or []:
+            registry.import_pools_file(path)
+        pools = registry.select(protocol=args.protocol, asset=args.asset, chain=args.chain,
+                                stablecoin=args.stablecoin, min_tvl=args.min_tvl)
+        print(f"{len(pools)} of {len(registry)} pools in {args.registry}")
+        if any(value is not None for value in (args.protocol, args.asset, args.chain, args.min_tvl, args.stablecoin)):
+            print(pools[['name', 'uuid', 'tvl_usd', 'address', 'first_seen', 'last_seen']].to_string(index=False))
+        else:
+            print(pools.groupby(['protocol', 'chain']).size().unstack(fill_value=0).to_string())
+
+
+if __name__ == "__main__":
+    main()
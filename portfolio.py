@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Mean-variance allocation across pools with an incrementally updated covariance.
+
+Expected APY and the covariance of the daily APY series are estimated from the
+data/defillama histories, aligned on one daily grid (resample.align_pools).
+Pools have different start dates and gaps, so every pair uses the days on which
+both have data: the estimator keeps, for all pairs at once, the number of shared
+days and the sums of x_i, x_i*x_j and (x_i*x_j)^2, with x the APY minus a fixed
+per-pool reference. Adding days adds their outer products, so a daily update
+costs O(pools^2) per new day instead of a pass over the whole history, and the
+sums are saved to COVARIANCE_STATE between runs. Pairs sharing fewer than
+MIN_OVERLAP_DAYS days get no covariance, and if the pairwise estimates do not
+form a positive semi-definite matrix its negative eigenvalues are clipped.
+
+The covariance is shrunk towards its diagonal, with the intensity estimated from
+the same sums (Schafer & Strimmer's diagonal target) unless one is given.
+
+Allocations are long-only and fully invested, and a pool's weight is capped so
+the deposit is at most MAX_TVL_SHARE of its current TVL (and at most MAX_WEIGHT).
+Only pools with data on the last day are eligible. The mean-variance problem
+max mu'w - gamma/2 w'Cw is solved by accelerated projected gradient for a whole
+batch of risk aversions gamma at once (one matrix product per iteration), which
+traces the efficient frontier; minimum variance is the same problem with mu = 0.
+
+Usage:
+    python portfolio.py --capital 1000000                  # update, optimize, write statistics/portfolio_*.csv
+    python portfolio.py --risk-aversion 0.5 --levels 100 --shrinkage 0.2
+    python portfolio.py --rebuild                          # recompute the sums from the full history
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from resample import align_pools
+from strategy import load_all_data
+
+COVARIANCE_STATE = 'statistics/covariance_state.npz'
+WEIGHTS_FILE = 'statistics/portfolio_weights.csv'
+FRONTIER_FILE = 'statistics/efficient_frontier.csv'
+CAPITAL = 1_000_000
+MAX_TVL_SHARE = 0.05     # Largest share of a pool's TVL the deposit may take
+MAX_WEIGHT = 0.25
+MIN_DAYS = 30            # Days of history a pool needs to be eligible
+MIN_OVERLAP_DAYS = 10    # Shared days a pair needs for a covariance estimate
+MIN_EIGENVALUE = 1e-8    # Floor of the covariance spectrum when pairwise estimates are inconsistent
+RISK_AVERSION = 1.0      # gamma of the single mean-variance allocation
+FRONTIER_LEVELS = 50
+FRONTIER_RANGE = (1e-3, 1e3)
+MAX_ITERATIONS = 5000
+TOLERANCE = 1e-7       # Largest weight change of a converged allocation
+POWER_ITERATIONS = 100
+SUMS = ['count', 'sums', 'products', 'fourth']
+
+
+class CovarianceEstimator:
+    """Pairwise sums over days of the APY of every pool pair, updated a batch of days at a time"""
+
+    def __init__(self):
+        self.dates = np.array([], dtype=str)
+        self.pools = []
+        self.positions = {}
+        self.shift = np.zeros(0)
+        self.count = np.zeros((0, 0))       # Days on which both pools have data
+        self.sums = np.zeros((0, 0))        # Sum of x_i over the days both pools have data
+        self.products = np.zeros((0, 0))    # Sum of x_i * x_j
+        self.fourth = np.zeros((0, 0))      # Sum of (x_i * x_j)^2, for the shrinkage intensity
+
+    def _add_pools(self, pools, apys, present):
+        new = [pool for pool in pools if pool not in self.positions]
+        if not new:
+            return
+        for pool in new:
+            self.positions[pool] = len(self.pools)
+            self.pools.append(pool)
+        columns = [pools.index(pool) for pool in new]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reference = np.where(present[:, columns], apys[:, columns], 0.0).sum(axis=0) \
+                / present[:, columns].sum(axis=0)
+        self.shift = np.concatenate([self.shift, np.nan_to_num(reference)])
+        size = len(self.pools)
+        for name in SUMS:
+            old = getattr(self, name)
+            grown = np.zeros((size, size))
+            grown[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, grown)
+
+    def _accumulate(self, x, m, skip=None):
+        """Add the outer products of days x pools arrays; pairs within `skip` are left unchanged"""
+        blocks = {'count': m.T @ m, 'sums': x.T @ m, 'products': x.T @ x, 'fourth': (x * x).T @ (x * x)}
+        for name, block in blocks.items():
+            if skip is not None:
+                block[np.ix_(skip, skip)] = 0.0
+            getattr(self, name)[...] += block
+
+    def update(self, dates, pools, apys, present):
+        """Add the days (rows) of a days x pools APY array that are not in the estimate yet
+
+        Pools seen for the first time also get their history on days already
+        added, paired with every pool; revisions of added days are ignored.
+        Returns the number of days added.
+        """
+        dates = np.asarray(dates, dtype=str)
+        known = len(self.pools)
+        self._add_pools(list(pools), apys, present)
+        columns = np.array([self.positions[pool] for pool in pools], dtype=int)
+        x = np.zeros((len(dates), len(self.pools)))
+        m = np.zeros((len(dates), len(self.pools)))
+        x[:, columns] = np.where(present, apys - self.shift[columns], 0.0)
+        m[:, columns] = present
+
+        new_days = ~np.isin(dates, self.dates)
+        self._accumulate(x[new_days], m[new_days])
+        if known < len(self.pools) and (~new_days).any():
+            self._accumulate(x[~new_days], m[~new_days], skip=np.arange(known))
+        self.dates = np.union1d(self.dates, dates[new_days])
+        return int(new_days.sum())
+
+    def mean(self):
+        """Mean APY of every pool over its days with data"""
+        days = np.diag(self.count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(days > 0, self.shift + np.diag(self.sums) / days, np.nan)
+
+    def covariance(self, shrinkage=None, min_overlap=MIN_OVERLAP_DAYS, columns=None):
+        """(covariance, shrinkage intensity) of the pools at `columns` (default all)
+
+        The intensity is estimated when not given.
+        """
+        columns = np.arange(len(self.pools)) if columns is None else np.asarray(columns)
+        block = np.ix_(columns, columns)
+        n, sums, products, fourth = self.count[block], self.sums[block], self.products[block], self.fourth[block]
+        valid = n >= max(min_overlap, 2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # sums[i, j] / n[i, j] is the mean of pool i over the days shared with pool j
+            cross = products / n - (sums / n) * (sums / n).T
+            cov = np.where(valid, cross * n / (n - 1), 0.0)
+            variance = np.diag(cov).copy()
+            limit = np.sqrt(np.outer(variance, variance))
+            # Pairwise estimates over different days can imply |correlation| > 1
+            cov = np.clip(cov, -limit, limit)
+            if shrinkage is None:
+                off_diagonal = valid & ~np.eye(len(n), dtype=bool)
+                # Variance of each pairwise estimate, from the spread of x_i * x_j about its mean
+                spread = np.where(valid, fourth / n - (products / n) ** 2, 0.0)
+                estimate_variance = np.where(valid, spread * n ** 2 / (n - 1) ** 3, 0.0)
+                distance = (cov[off_diagonal] ** 2).sum()
+                shrinkage = estimate_variance[off_diagonal].sum() / distance if distance > 0 else 1.0
+        shrinkage = float(np.clip(shrinkage, 0.0, 1.0))
+        shrunk = (1 - shrinkage) * cov
+        np.fill_diagonal(shrunk, variance)
+        try:
+            np.linalg.cholesky(shrunk + MIN_EIGENVALUE * np.eye(len(shrunk)))
+        except np.linalg.LinAlgError:
+            # Pairs estimated over different days need not form a valid covariance; clip its spectrum
+            eigenvalues, eigenvectors = np.linalg.eigh(shrunk)
+            shrunk = (eigenvectors * np.maximum(eigenvalues, MIN_EIGENVALUE)) @ eigenvectors.T
+        return shrunk, shrinkage
+
+    def save(self, path=COVARIANCE_STATE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, dates=self.dates.astype(str), pools=np.array(self.pools, dtype=str), shift=self.shift,
+                 **{name: getattr(self, name) for name in SUMS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=COVARIANCE_STATE):
+        estimator = cls()
+        with np.load(path) as data:
+            estimator.dates = data['dates']
+            estimator.pools = list(data['pools'])
+            estimator.shift = data['shift']
+            for name in SUMS:
+                setattr(estimator, name, data[name])
+        estimator.positions = {pool: j for j, pool in enumerate(estimator.pools)}
+        return estimator
+
+
+def tvl_caps(tvl, capital=CAPITAL, max_tvl_share=MAX_TVL_SHARE, max_weight=MAX_WEIGHT):
+    """Largest weight of each pool: the deposit may take at most max_tvl_share of its TVL"""
+    return np.minimum(max_tvl_share * np.nan_to_num(np.asarray(tvl, dtype=float)) / capital, max_weight)
+
+
+def project_capped_simplex(v, caps):
+    """Row-wise Euclidean projection onto {w: 0 <= w <= caps, sum(w) = 1}
+
+    The projection is clip(v - tau, 0, caps) with tau such that the row sums to 1.
+    The row sum is piecewise linear in tau with breakpoints at v - caps and v, so
+    tau is found exactly from the sorted breakpoints of all rows at once.
+    """
+    v = np.atleast_2d(v)
+    caps = np.broadcast_to(caps, v.shape)
+    rows = np.arange(len(v))[:, None]
+    breakpoints = np.concatenate([v - caps, v], axis=1)
+    # Moving tau past v - cap starts lowering that weight, past v it stays at 0
+    slopes = np.concatenate([-np.ones_like(v), np.ones_like(v)], axis=1)
+    order = np.argsort(breakpoints, axis=1)
+    breakpoints, slopes = breakpoints[rows, order], slopes[rows, order]
+    slope = np.cumsum(slopes, axis=1)
+    # Row sum at each breakpoint, starting from every weight at its cap
+    totals = caps.sum(axis=1, keepdims=True) + np.concatenate(
+        [np.zeros((len(v), 1)), np.cumsum(slope[:, :-1] * np.diff(breakpoints, axis=1), axis=1)], axis=1)
+    k = np.clip((totals >= 1).sum(axis=1, keepdims=True) - 1, 0, breakpoints.shape[1] - 2)
+    total_k = np.take_along_axis(totals, k, axis=1)
+    slope_k = np.take_along_axis(slope, k, axis=1)
+    offset = np.where(slope_k < 0, (1 - total_k) / np.minimum(slope_k, -1), 0.0)
+    tau = np.take_along_axis(breakpoints, k, axis=1) + offset
+    return np.clip(v - tau, 0.0, caps)
+
+
+def largest_eigenvalue(cov, iterations=POWER_ITERATIONS):
+    """Largest eigenvalue of a covariance by power iteration, with a safety margin, at most its Frobenius norm"""
+    vector = np.ones(len(cov)) / np.sqrt(len(cov))
+    for _ in range(iterations):
+        product = cov @ vector
+        norm = np.linalg.norm(product)
+        if norm == 0:
+            return 0.0
+        vector = product / norm
+    # The Rayleigh quotient approaches the eigenvalue from below
+    return min(1.05 * vector @ cov @ vector, np.linalg.norm(cov))
+
+
+def solve(mu, cov, caps, risk_aversion, start=None, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """Weights maximizing mu'w - gamma/2 w'Cw under the caps, one row per gamma in risk_aversion
+
+    Accelerated projected gradient with adaptive restart; rows stop iterating
+    once their weights move less than the tolerance. `start` (e.g. yesterday's
+    weights) warm-starts every row.
+    """
+    if caps.sum() < 1:
+        raise ValueError(f"pool caps sum to {caps.sum():.2%}; lower the capital or raise the TVL share")
+    gammas = np.atleast_1d(np.asarray(risk_aversion, dtype=float))[:, None]
+    step = 1 / np.maximum(gammas * largest_eigenvalue(cov), 1e-12)
+    if start is None:
+        start = caps / caps.sum()
+    weights = project_capped_simplex(np.tile(np.asarray(start, dtype=float), (len(gammas), 1)), caps)
+    momentum, t = weights.copy(), np.ones((len(gammas), 1))
+    active = np.arange(len(gammas))
+    for _ in range(max_iterations):
+        previous, y = weights[active], momentum[active]
+        updated = project_capped_simplex(y + step[active] * (mu - gammas[active] * (y @ cov)), caps)
+        # Restart the momentum of rows where it points against the progress
+        restart = ((y - updated) * (updated - previous)).sum(axis=1, keepdims=True) > 0
+        t_active = np.where(restart, 1.0, t[active])
+        t_next = (1 + np.sqrt(1 + 4 * t_active ** 2)) / 2
+        weights[active] = updated
+        momentum[active] = updated + np.where(restart, 0.0, (t_active - 1) / t_next) * (updated - previous)
+        t[active] = t_next
+        active = active[np.abs(updated - previous).max(axis=1) >= tolerance]
+        if not len(active):
+            break
+    return weights
+
+
+def portfolio_moments(weights, mu, cov):
+    """Expected APY and APY standard deviation of each row of weights"""
+    weights = np.atleast_2d(weights)
+    return weights @ mu, np.sqrt(np.maximum(((weights @ cov) * weights).sum(axis=1), 0.0))
+
+
+def efficient_frontier(mu, cov, caps, levels=FRONTIER_LEVELS, risk_range=FRONTIER_RANGE):
+    """(frontier frame, weights) for risk aversions spaced logarithmically over risk_range"""
+    gammas = np.geomspace(*risk_range, levels)
+    weights = solve(mu, cov, caps, gammas)
+    expected, std = portfolio_moments(weights, mu, cov)
+    frontier = pd.DataFrame({'risk_aversion': gammas, 'expected_apy': expected, 'std_apy': std,
+                             'pools': (weights > 1e-6).sum(axis=1)})
+    return frontier, weights
+
+
+def load_panel():
+    """Dates, pools, APYs, presence, TVLs and metadata of the data/defillama histories on a daily grid"""
+    panel = align_pools(load_all_data(), '1D', 'last', columns=['apy', 'tvl'])
+    apys, tvls = panel.values['apy'], panel.values['tvl']
+    present = ~np.isnan(apys) & (np.nan_to_num(tvls) > 0)
+    dates = pd.Series(panel.times).dt.strftime('%Y-%m-%d').to_numpy(dtype=str)
+    return dates, panel.pools, apys, present, tvls, panel.metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--capital', type=float, default=CAPITAL, help='deposit in USD, for the TVL caps')
+    parser.add_argument('--max-tvl-share', type=float, default=MAX_TVL_SHARE)
+    parser.add_argument('--max-weight', type=float, default=MAX_WEIGHT)
+    parser.add_argument('--min-days', type=int, default=MIN_DAYS)
+    parser.add_argument('--risk-aversion', type=float, default=RISK_AVERSION)
+    parser.add_argument('--levels', type=int, default=FRONTIER_LEVELS, help='points on the efficient frontier')
+    parser.add_argument('--shrinkage', type=float, default=None, help='intensity in [0, 1] (default: estimated)')
+    parser.add_argument('--state', default=COVARIANCE_STATE)
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved sums')
+    args = parser.parse_args()
+
+    dates, pools, apys, present, tvls, metadata = load_panel()
+    start = time.perf_counter()
+    estimator = CovarianceEstimator() if args.rebuild or not os.path.exists(args.state) \
+        else CovarianceEstimator.load(args.state)
+    added = estimator.update(dates, pools, apys, present)
+    estimator.save(args.state)
+    print(f"Added {added} days to the covariance of {len(estimator.pools)} pools "
+          f"({len(estimator.dates)} days) in {time.perf_counter() - start:.3f}s")
+
+    # Eligible: data on the last day, enough history and a positive mean APY
+    start = time.perf_counter()
+    columns = np.array([estimator.positions[pool] for pool in pools])
+    means = estimator.mean()[columns]
+    eligible = present[-1] & (np.diag(estimator.count)[columns] >= args.min_days) & (means > 0)
+    mu = means[eligible]
+    cov, shrinkage = estimator.covariance(args.shrinkage, columns=columns[eligible])
+    caps = tvl_caps(tvls[-1, eligible], args.capital, args.max_tvl_share, args.max_weight)
+
+    names = np.array(pools)[eligible]
+    # Yesterday's allocations warm-start today's
+    previous = pd.read_csv(WEIGHTS_FILE).set_index('pool') if os.path.exists(WEIGHTS_FILE) else None
+    starts = {column: previous[column].reindex(names).fillna(0.0).to_numpy() if previous is not None else None
+              for column in ('mean_variance', 'min_variance')}
+    mean_variance = solve(mu, cov, caps, args.risk_aversion, starts['mean_variance'])[0]
+    min_variance = solve(np.zeros_like(mu), cov, caps, 1.0, starts['min_variance'])[0]
+    frontier, _ = efficient_frontier(mu, cov, caps, args.levels)
+    print(f"Optimized {eligible.sum()} eligible pools (shrinkage {shrinkage:.3f}, "
+          f"{args.levels} frontier points) in {time.perf_counter() - start:.3f}s")
+
+    weights = pd.DataFrame({
+        'pool': names,
+        'protocol': metadata['protocol'].to_numpy()[eligible],
+        'asset': metadata['asset'].to_numpy()[eligible],
+        'chain': metadata['chain'].to_numpy()[eligible],
+        'expected_apy': mu,
+        'std_apy': np.sqrt(np.diag(cov)),
+        'tvl': tvls[-1, eligible],
+        'cap': caps,
+        'mean_variance': mean_variance,
+        'min_variance': min_variance,
+    })
+    os.makedirs(os.path.dirname(WEIGHTS_FILE), exist_ok=True)
+    weights.to_csv(WEIGHTS_FILE, index=False)
+    frontier.to_csv(FRONTIER_FILE, index=False)
+    print(f"Saved weights to {WEIGHTS_FILE} and the frontier to {FRONTIER_FILE}")
+
+    for label, column in (('Mean-variance', 'mean_variance'), ('Minimum variance', 'min_variance')):
+        expected, std = portfolio_moments(weights[column].to_numpy(), mu, cov)
+        held = weights[weights[column] > 1e-6].sort_values(column, ascending=False)
+        print(f"\n{label}: expected APY {expected[0]:.3f}%, std {std[0]:.3f}, {len(held)} pools")
+        print(held[['pool', 'expected_apy', 'std_apy', 'cap', column]].head(10).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
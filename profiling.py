@@ -0,0 +1,247 @@
+"""
+Lightweight per-stage instrumentation for the pipeline scripts.
+
+Stages are marked with `with stage('load'):` or the `@profiled('load')`
+decorator; while profiling is off both cost a single flag check. When enabled
+(`python cli.py ... --profile`) every stage call records wall time, CPU time and
+how far it raised the process's peak RSS, and code inside a stage can add
+counters with `count('rows', n)`. Nested stages are reported by path, e.g.
+`strategy/load`, and each call is attributed to the innermost stage of its own
+thread. Requests made through `requests` are counted with their response size,
+and the EtherScan and Dune caches report `cache_hits` / `cache_misses`.
+
+The report is one JSON file in Chrome trace-event format: `traceEvents` holds
+one complete event per stage call (open it in chrome://tracing or Perfetto)
+and `summary` holds the per-stage totals, so the nightly runs can be compared
+with plain JSON tooling as well.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_DIR = 'profiles'
+LOG_FORMAT = '%(message)s'
+QUIET_LOGGERS = ['urllib3', 'matplotlib', 'PIL']  # Kept at WARNING even with --log-level DEBUG
+MAX_TRACE_EVENTS = 100_000
+
+
+def peak_rss_mib():
+    """High-water mark of the process's resident memory in MiB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def configure_logging(level='INFO'):
+    """Console logging for the pipeline; per-pool messages are logged at DEBUG"""
+    logging.basicConfig(level=getattr(logging, str(level).upper()), format=LOG_FORMAT)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+class Profiler:
+    """Per-stage wall time, CPU time, peak RSS and counters, plus a trace of every call"""
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self.dropped_events = 0
+        self._start = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self._start = time.perf_counter()
+
+    def _thread_state(self):
+        """Stage names and counter dicts of the stages open on the calling thread"""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+            self._local.counters = []
+        return self._local.stack, self._local.counters
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        stack, open_counters = self._thread_state()
+        stack.append(name)
+        path = '/'.join(stack)
+        counters = {}
+        open_counters.append(counters)
+        rss_before = peak_rss_mib()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            rss_after = peak_rss_mib()
+            stack.pop()
+            open_counters.pop()
+            self._record(path, name, start, wall, cpu, rss_before, rss_after, counters)
+
+    def _record(self, path, name, start, wall, cpu, rss_before, rss_after, counters):
+        with self._lock:
+            totals = self.stages.get(path)
+            if totals is None:
+                totals = self.stages[path] = {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                              'peak_rss_mib': None, 'rss_growth_mib': None,
+                                              'first_start_s': start - self._start, 'counters': {}}
+            totals['calls'] += 1
+            totals['wall_s'] += wall
+            totals['cpu_s'] += cpu
+            if rss_after is not None:
+                totals['peak_rss_mib'] = max(totals['peak_rss_mib'] or 0.0, rss_after)
+                totals['rss_growth_mib'] = (totals['rss_growth_mib'] or 0.0) + rss_after - rss_before
+            for counter, value in counters.items():
+                totals['counters'][counter] = totals['counters'].get(counter, 0) + value
+
+            if len(self.events) >= MAX_TRACE_EVENTS:
+                self.dropped_events += 1
+                return
+            self.events.append({
+                'name': name, 'cat': path.rsplit('/', 1)[0] if '/' in path else 'pipeline', 'ph': 'X',
+                'ts': round((start - self._start) * 1e6), 'dur': round(wall * 1e6),
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+                'args': {'cpu_ms': round(cpu * 1e3, 3), **counters},
+            })
+
+    def count(self, counter, value=1):
+        """Add to a run-wide counter and to the innermost stage of the calling thread"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+        _, open_counters = self._thread_state()
+        if open_counters:
+            current = open_counters[-1]
+            current[counter] = current.get(counter, 0) + value
+
+    def summary(self):
+        stages = []
+        for path, totals in sorted(self.stages.items(), key=lambda item: item[1]['first_start_s']):
+            entry = {'stage': path, **{key: value for key, value in totals.items() if key != 'counters'}}
+            entry.update(totals['counters'])
+            entry.update(_hit_rate(totals['counters']))
+            stages.append(entry)
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'argv': sys.argv,
+            'wall_s': time.perf_counter() - self._start,
+            'cpu_s': time.process_time(),
+            'peak_rss_mib': peak_rss_mib(),
+            'counters': {**self.counters, **_hit_rate(self.counters)},
+            'stages': stages,
+            'dropped_trace_events': self.dropped_events,
+        }
+
+    def write(self, path=None):
+        """Write the trace events and the summary to a JSON file; returns its path"""
+        if path is None:
+            path = os.path.join(PROFILE_DIR, f"profile_{datetime.now():%Y%m%d_%H%M%S}.json")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'summary': self.summary()},
+                      f, indent=1, default=float)
+        return path
+
+    def format_table(self):
+        """Per-stage totals as a fixed-width text table"""
+        lines = [f"{'stage':<36} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'peak MiB':>9} {'+MiB':>7}  counters"]
+        for entry in self.summary()['stages']:
+            extras = {key: value for key, value in entry.items()
+                      if key not in ('stage', 'calls', 'wall_s', 'cpu_s', 'peak_rss_mib',
+                                     'rss_growth_mib', 'first_start_s')}
+            lines.append(
+                f"{entry['stage']:<36} {entry['calls']:>6} {entry['wall_s']:>9.3f} {entry['cpu_s']:>9.3f} "
+                f"{_mib(entry['peak_rss_mib']):>9} {_mib(entry['rss_growth_mib']):>7}  "
+                + ', '.join(f"{key}={_number(value)}" for key, value in extras.items()))
+        return '\n'.join(lines)
+
+
+def _hit_rate(counters):
+    lookups = counters.get('cache_hits', 0) + counters.get('cache_misses', 0)
+    return {'cache_hit_rate': round(counters.get('cache_hits', 0) / lookups, 4)} if lookups else {}
+
+
+def _mib(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def _number(value):
+    return f"{value:,.4g}" if isinstance(value, float) else f"{value:,}"
+
+
+PROFILER = Profiler()
+
+
+def stage(name):
+    """Context manager timing a pipeline stage on the shared profiler"""
+    return PROFILER.stage(name)
+
+
+def count(counter, value=1):
+    PROFILER.count(counter, value)
+
+
+def profiled(name):
+    """Decorator running a function as a pipeline stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_http_requests():
+    """Count requests and downloaded bytes of everything sent through `requests`"""
+    import requests
+
+    original = requests.Session.request
+    if getattr(original, '_profiled', False):
+        return
+
+    def request(session, method, url, *args, **kwargs):
+        response = original(session, method, url, *args, **kwargs)
+        count('http_requests')
+        count('bytes_downloaded', len(response.content))
+        return response
+
+    request._profiled = True
+    requests.Session.request = request
+
+
+def enable(http=True):
+    """Turn profiling on for this process"""
+    PROFILER.enable()
+    if http:
+        try:
+            count_http_requests()
+        except ImportError:
+            pass
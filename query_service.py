@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Local HTTP query service over the precomputed pipeline outputs.
+
+The best-pool files (statistics/best_*.csv), pool_statistics.csv and the
+summary panel (summary_apy.csv / summary_tvl.csv with protocol, chain and asset
+from the pool registry) are loaded into numpy arrays once. Date lookups are
+binary searches on the sorted date column, and group and window aggregates are
+differences of per-pool prefix sums (range_index.RangeIndex), so a window
+query costs O(pools) whatever its length, microseconds in process instead of a
+CSV parse. Weighted APY uses the masking of weighted_apy.weighted_sums.
+
+A watcher thread polls the sizes and mtimes of the source files. When they
+change and then stay unchanged for one poll interval (the pipeline writes the
+outputs one by one), a new snapshot is loaded and swapped in; requests in
+flight finish on the old one. If loading fails the old snapshot keeps serving.
+
+Endpoints (GET, JSON):
+    /health                                        loaded files and snapshot time
+    /best?date=2025-01-15&type=apy                 best pool on a date (type: apy, apy_base, ...)
+    /best?start=2025-01-01&end=2025-01-31          best pool per date in a range
+    /weighted?protocol=aave-v3&chain=Base&start=2025-01-01&end=2025-03-31[&daily=1]
+    /top?n=10&start=2025-01-01&min_tvl=10000000&min_days=30
+                                                   pools ranked by mean APY / APY std
+    /pool?name=aave-v3_USDC_Base                   registry row and pool statistics
+
+Usage:
+    python query_service.py --port 8765
+    python query_service.py --bench                # in-process latency of each query
+"""
+
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from pool_registry import REGISTRY_FILE, PoolRegistry, pool_parts
+from range_index import RangeIndex, date_bounds
+
+logger = logging.getLogger(__name__)
+
+STATISTICS_DIR = 'statistics'
+DEFAULT_PORT = 8765
+POLL_SECONDS = 2.0
+MIN_APY_STD = 0.1        # APY std floor (percentage points), so flat pools do not rank infinitely high
+DEFAULT_TOP_N = 10
+MAX_RANGE_ROWS = 10_000  # Rows returned by a range query before it is truncated
+
+
+def _number(value):
+    """JSON-safe float: None for NaN and infinities"""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+class Snapshot:
+    """All query data of one version of the outputs, never modified after loading"""
+
+    def __init__(self, statistics_dir=STATISTICS_DIR, registry_file=REGISTRY_FILE):
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.best = {}
+        for path in sorted(glob.glob(os.path.join(statistics_dir, 'best_*.csv'))):
+            apy_type = os.path.basename(path)[len('best_'):-len('.csv')]
+            df = pd.read_csv(path, dtype={'date': str}).sort_values('date', kind='stable')
+            # Rows are kept as ready-to-serialise dicts, a range query only slices the list
+            records = [{key: (_number(value) if isinstance(value, float) else value) for key, value in row.items()}
+                       for row in df.to_dict('records')]
+            self.best[apy_type] = (df['date'].to_numpy(dtype=str), records)
+
+        with PoolRegistry(registry_file) as registry:
+            self.metadata = registry.metadata()
+            pools = registry.select().drop_duplicates('name').set_index('name')
+        self.registry = {name: {key: (_number(value) if isinstance(value, float) else value)
+                                for key, value in row.items()}
+                         for name, row in pools.to_dict('index').items()}
+
+        apy_df = pd.read_csv(os.path.join(statistics_dir, 'summary_apy.csv'), dtype={'date': str})
+        tvl_df = pd.read_csv(os.path.join(statistics_dir, 'summary_tvl.csv'), dtype={'date': str})
+        pools = [col for col in apy_df.columns if col != 'date' and col in tvl_df.columns]
+        apy_df, tvl_df = apy_df[['date'] + pools], tvl_df[['date'] + pools]
+        self.index = RangeIndex.from_summary(apy_df, tvl_df)
+        self.dates = self.index.dates
+        self.pools = np.array(self.index.pools, dtype=object)
+        # Lower-cased, so group filters are case-insensitive like the registry
+        parts = [[part.lower() for part in pool_parts(pool, self.metadata)] for pool in pools]
+        self.groups = {
+            'protocol': np.array([p[0] for p in parts], dtype=object),
+            'asset': np.array([p[1] for p in parts], dtype=object),
+            'chain': np.array([p[2] for p in parts], dtype=object),
+        }
+
+        stats_path = os.path.join(statistics_dir, 'pool_statistics.csv')
+        statistics = pd.read_csv(stats_path).set_index('pool') if os.path.exists(stats_path) else pd.DataFrame()
+        self.pool_statistics = {name: {key: _number(value) for key, value in row.items()}
+                                for name, row in statistics.to_dict('index').items()}
+
+    def pool_mask(self, protocol=None, chain=None, asset=None):
+        mask = np.ones(len(self.pools), dtype=bool)
+        for by, value in (('protocol', protocol), ('chain', chain), ('asset', asset)):
+            if value is not None:
+                mask &= self.groups[by] == value.lower()
+        if not mask.any():
+            raise LookupError(f"no pools match protocol={protocol} chain={chain} asset={asset}")
+        return mask
+
+    def best_on(self, date, apy_type='apy'):
+        dates, records = self._best(apy_type)
+        i = int(np.searchsorted(dates, date, side='left'))
+        if i == len(dates) or dates[i][:len(date)] != date:
+            raise LookupError(f"no best pool for {date}")
+        return records[i]
+
+    def best_between(self, start=None, end=None, apy_type='apy'):
+        dates, records = self._best(apy_type)
+        lo, hi = date_bounds(dates, start, end)
+        return records[lo:min(hi, lo + MAX_RANGE_ROWS)]
+
+    def _best(self, apy_type):
+        if apy_type not in self.best:
+            raise LookupError(f"no best_{apy_type}.csv; available: {', '.join(self.best)}")
+        return self.best[apy_type]
+
+    def weighted(self, protocol=None, chain=None, asset=None, start=None, end=None, daily=False):
+        """TVL-weighted APY of the matching pools over the window, pooled over all (date, pool) cells"""
+        lo, hi = date_bounds(self.dates, start, end)
+        mask = self.pool_mask(protocol, chain, asset)
+        sums = self.index.sums(start, end)
+        total = sums['tvl'][mask].sum()
+        result = {
+            'pools': int(mask.sum()),
+            'start': self.dates[lo],
+            'end': self.dates[hi - 1],
+            'days': hi - lo,
+            'weighted_apy': _number(sums['apy_tvl'][mask].sum() / total) if total > 0 else None,
+            'average_tvl': _number(total / (hi - lo)),
+        }
+        if daily:
+            products = self.index.products[lo:hi, mask].sum(axis=1)
+            weights = self.index.tvls[lo:hi, mask].sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                series = np.where(weights > 0, products / weights, np.nan)
+            result['daily'] = [{'date': date, 'weighted_apy': _number(value), 'total_tvl': _number(tvl)}
+                               for date, value, tvl in zip(self.dates[lo:hi], series, weights)]
+        return result
+
+    def top(self, n=DEFAULT_TOP_N, start=None, end=None, min_tvl=0.0, protocol=None, chain=None, asset=None,
+            min_days=2):
+        """Pools ranked by mean APY over APY standard deviation (ddof=1) within the window"""
+        mask = self.pool_mask(protocol, chain, asset)
+        stats = self.index.stats(start, end)
+        days, mean, std = stats['days'][mask], stats['mean_apy'][mask], stats['std_apy'][mask]
+        mean_tvl = np.nan_to_num(stats['mean_tvl'][mask])
+        score = mean / np.maximum(np.nan_to_num(std), MIN_APY_STD)
+        eligible = (days >= max(min_days, 2)) & (mean_tvl >= min_tvl)
+        score = np.where(eligible, score, -np.inf)
+        n = min(n, int(eligible.sum()))
+        ranked = np.argpartition(-score, n - 1)[:n] if n > 0 else np.array([], dtype=int)
+        ranked = ranked[np.argsort(-score[ranked], kind='stable')]
+        pools = self.pools[mask]
+        return [{'pool': pools[j], 'risk_adjusted': _number(score[j]), 'mean_apy': _number(mean[j]),
+                 'std_apy': _number(std[j]), 'mean_tvl': _number(mean_tvl[j]), 'days': int(days[j])}
+                for j in ranked]
+
+    def pool(self, name):
+        if name not in self.registry and name not in self.pool_statistics:
+            raise LookupError(f"unknown pool {name}")
+        result = {'pool': name, **self.registry.get(name, {})}
+        if name in self.pool_statistics:
+            result['statistics'] = self.pool_statistics[name]
+        return result
+
+
+class ResultStore:
+    """The current snapshot, replaced by a watcher thread when the outputs change"""
+
+    def __init__(self, statistics_dir=STATISTICS_DIR, registry_file=REGISTRY_FILE, poll_seconds=POLL_SECONDS):
+        self.statistics_dir = statistics_dir
+        self.registry_file = registry_file
+        self.poll_seconds = poll_seconds
+        self.reloads = 0
+        self._signature = self.signature()
+        self.snapshot = Snapshot(statistics_dir, registry_file)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def signature(self):
+        """(path, size, mtime) of every source file"""
+        paths = sorted(glob.glob(os.path.join(self.statistics_dir, 'best_*.csv'))) + [
+            os.path.join(self.statistics_dir, name)
+            for name in ('summary_apy.csv', 'summary_tvl.csv', 'pool_statistics.csv')] + [self.registry_file]
+        signature = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def reload(self):
+        """Load a new snapshot and swap it in; the old one keeps serving if loading fails"""
+        signature = self.signature()
+        try:
+            snapshot = Snapshot(self.statistics_dir, self.registry_file)
+        except Exception as e:
+            logger.warning(f"Reload failed, still serving the snapshot from {self.snapshot.loaded_at}: {e}")
+            return False
+        self.snapshot, self._signature = snapshot, signature
+        self.reloads += 1
+        logger.info(f"Reloaded outputs ({len(snapshot.pools)} pools, {len(snapshot.dates)} dates)")
+        return True
+
+    def watch(self):
+        pending = None
+        while not self._stop.wait(self.poll_seconds):
+            signature = self.signature()
+            if signature == self._signature:
+                pending = None
+            elif signature == pending:
+                # Unchanged for a whole interval: the pipeline has finished writing
+                self.reload()
+                pending = None
+            else:
+                pending = signature
+
+    def start(self):
+        self._thread = threading.Thread(target=self.watch, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+ROUTES = {
+    '/best': lambda snapshot, q: (
+        snapshot.best_on(q['date'], q.get('type', 'apy')) if 'date' in q
+        else snapshot.best_between(q.get('start'), q.get('end'), q.get('type', 'apy'))),
+    '/weighted': lambda snapshot, q: snapshot.weighted(
+        q.get('protocol'), q.get('chain'), q.get('asset'), q.get('start'), q.get('end'),
+        daily=q.get('daily') in ('1', 'true')),
+    '/top': lambda snapshot, q: snapshot.top(
+        int(q.get('n', DEFAULT_TOP_N)), q.get('start'), q.get('end'), float(q.get('min_tvl', 0)),
+        q.get('protocol'), q.get('chain'), q.get('asset'), int(q.get('min_days', 2))),
+    '/pool': lambda snapshot, q: snapshot.pool(q['name']),
+}
+
+
+class QueryService:
+    """Answers route queries from the current snapshot; used by the HTTP handler and in process"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def query(self, path, params):
+        """(status, payload) for a route and its query parameters"""
+        start = time.perf_counter()
+        snapshot = self.store.snapshot
+        if path == '/health':
+            result = {'loaded_at': snapshot.loaded_at, 'reloads': self.store.reloads,
+                      'pools': len(snapshot.pools), 'dates': len(snapshot.dates),
+                      'best_types': list(snapshot.best)}
+            status = 200
+        elif path not in ROUTES:
+            return 404, {'error': f"unknown route {path}; routes: /health, {', '.join(ROUTES)}"}
+        else:
+            try:
+                result, status = ROUTES[path](snapshot, params), 200
+            except KeyError as e:
+                return 400, {'error': f"missing parameter {e}"}
+            except ValueError as e:
+                return 400, {'error': str(e)}
+            except LookupError as e:
+                return 404, {'error': str(e)}
+        return status, {'result': result, 'took_us': round((time.perf_counter() - start) * 1e6, 1)}
+
+    def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, payload = service.query(url.path.rstrip('/') or '/', dict(parse_qsl(url.query)))
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
+
+
+def benchmark(service, repeat=2000):
+    """Median in-process latency of a representative query per route"""
+    snapshot = service.store.snapshot
+    first, last = snapshot.dates[0], snapshot.dates[-1]
+    middle = snapshot.dates[len(snapshot.dates) // 2]
+    protocol, chain = snapshot.groups['protocol'][0], snapshot.groups['chain'][0]
+    queries = [
+        ('/best', {'date': middle}),
+        ('/best', {'start': first, 'end': middle}),
+        ('/weighted', {'protocol': protocol, 'chain': chain, 'start': first, 'end': last}),
+        ('/top', {'n': '10', 'start': middle}),
+        ('/pool', {'name': snapshot.pools[0]}),
+    ]
+    for path, params in queries:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            status, _ = service.query(path, params)
+            timings.append(time.perf_counter() - start)
+        print(f"{path:<10} {json.dumps(params):<70} {status}  {np.median(timings) * 1e6:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between output checks')
+    parser.add_argument('--bench', action='store_true', help='print in-process query latency and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    store = ResultStore(poll_seconds=args.poll)
+    service = QueryService(store)
+    if args.bench:
+        benchmark(service)
+        return
+
+    store.start()
+    server = service.serve(args.host, args.port)
+    print(f"Serving {len(store.snapshot.pools)} pools on http://{args.host}:{server.server_address[1]} "
+          f"(reloading every {args.poll:g}s when outputs change)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
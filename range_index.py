@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Prefix-sum index for range aggregates over the pool APY and TVL histories.
+
+The index uses the dates x pools alignment of weighted_apy.py (summary_apy.csv
+and summary_tvl.csv, a cell counting only where the pool has TVL). For every
+pool it keeps cumulative sums over dates of the cell count, APY, APY squared,
+TVL and APY*TVL, with one leading row of zeros, so the sums over any date range
+are the difference of two rows. Mean, variance, mean TVL and TVL-weighted APY
+of every pool over a range then take one vectorized subtraction, and group
+weighted APY one extra product with the pool -> group membership matrix.
+
+APY is summed as its difference from a fixed per-pool reference (the pool's
+mean when it was first indexed), so the variance from sums of squares does not
+lose precision on long histories.
+
+New days extend the index: their rows are inserted into the stored cells and
+only the cumulative sums from the earliest changed date onwards are
+recomputed. Rows for dates already indexed replace the old values, which is
+how revisions of recent days are picked up.
+
+Usage:
+    python range_index.py build                               # from statistics/summary_*.csv
+    python range_index.py update                              # add new days, re-read the last REVISION_DAYS
+    python range_index.py query --start 2025-01-01 --end 2025-03-31 --by chain
+    python range_index.py query --pool aave-v3_USDC_Base --start 2025-04-01
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from weighted_apy import build_membership_matrix, load_pool_metadata, weighted_sums
+
+INDEX_FILE = 'statistics/range_index.npz'
+STATISTICS_DIR = 'statistics'
+REVISION_DAYS = 3       # Trailing indexed days re-read on update, collectors revise recent values
+FIELDS = ['count', 'apy', 'apy_sq', 'tvl', 'apy_tvl']
+
+
+def date_bounds(dates, start=None, end=None):
+    """Row slice [lo, hi) of the sorted date strings within [start, end]; a day bound covers its timestamps"""
+    lo = 0 if start is None else int(np.searchsorted(dates, start, side='left'))
+    # U+FFFF sorts after any time of day, so an end date includes every timestamp on it
+    hi = len(dates) if end is None else int(np.searchsorted(dates, end + '\uffff', side='right'))
+    if lo >= hi:
+        raise LookupError(f"no data between {start or 'the start'} and {end or 'the end'}")
+    return lo, hi
+
+
+class RangeIndex:
+    """Cumulative per-pool sums over dates, answering range aggregates in O(1) per pool"""
+
+    def __init__(self):
+        self.dates = np.array([], dtype=str)
+        self.pools = []
+        self.positions = {}
+        self.shift = np.zeros(0)
+        # Stored cells: presence, APY and TVL (0 where absent), APY*TVL as in weighted_sums
+        self.present = np.zeros((0, 0), dtype=bool)
+        self.apys = np.zeros((0, 0))
+        self.tvls = np.zeros((0, 0))
+        self.products = np.zeros((0, 0))
+        self.prefix = {field: np.zeros((1, 0)) for field in FIELDS}
+
+    @classmethod
+    def from_summary(cls, apy_df, tvl_df):
+        index = cls()
+        index.extend(apy_df, tvl_df)
+        return index
+
+    def _add_pools(self, pools, apys, present):
+        new = [pool for pool in pools if pool not in self.positions]
+        if not new:
+            return
+        for pool in new:
+            self.positions[pool] = len(self.pools)
+            self.pools.append(pool)
+        columns = [pools.index(pool) for pool in new]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reference = (apys[:, columns] * present[:, columns]).sum(axis=0) / present[:, columns].sum(axis=0)
+        self.shift = np.concatenate([self.shift, np.nan_to_num(reference)])
+        width = len(new)
+        self.present = np.hstack([self.present, np.zeros((len(self.dates), width), dtype=bool)])
+        for name in ('apys', 'tvls', 'products'):
+            setattr(self, name, np.hstack([getattr(self, name), np.zeros((len(self.dates), width))]))
+        for field in FIELDS:
+            self.prefix[field] = np.hstack([self.prefix[field], np.zeros((len(self.dates) + 1, width))])
+
+    def _add_dates(self, dates):
+        merged = np.union1d(self.dates, dates)
+        if len(merged) == len(self.dates):
+            return
+        rows = np.searchsorted(merged, self.dates)
+        first_new = int(np.flatnonzero(~np.isin(merged, self.dates))[0])
+        for name in ('present', 'apys', 'tvls', 'products'):
+            old = getattr(self, name)
+            grown = np.zeros((len(merged), old.shape[1]), dtype=old.dtype)
+            grown[rows] = old
+            setattr(self, name, grown)
+        for field in FIELDS:
+            # Rows up to the first inserted date stay valid; later ones are recomputed by the caller
+            old = self.prefix[field]
+            grown = np.zeros((len(merged) + 1, old.shape[1]))
+            grown[:first_new + 1] = old[:first_new + 1]
+            self.prefix[field] = grown
+        self.dates = merged
+
+    def extend(self, apy_df, tvl_df):
+        """Add or replace the rows of summary frames (date + one column per pool); returns rows applied"""
+        pools = [col for col in apy_df.columns if col != 'date' and col in tvl_df.columns]
+        if apy_df.empty or not pools:
+            return 0
+        apy_df, tvl_df = apy_df[['date'] + pools], tvl_df[['date'] + pools]
+        products, weights, _ = weighted_sums(apy_df, tvl_df)
+        present = weights > 0
+        apys = np.where(present, apy_df[pools].to_numpy(dtype=float), 0.0)
+        dates = apy_df['date'].to_numpy(dtype=str)
+
+        self._add_pools(pools, apys, present)
+        self._add_dates(dates)
+        rows = np.searchsorted(self.dates, dates)[:, None]
+        columns = np.array([self.positions[pool] for pool in pools])[None, :]
+        self.present[rows, columns] = present
+        self.apys[rows, columns] = apys
+        self.tvls[rows, columns] = weights
+        self.products[rows, columns] = products
+        self._accumulate(int(rows.min()))
+        return len(dates)
+
+    def _accumulate(self, first):
+        """Recompute the cumulative sums from stored row `first` onwards"""
+        present = self.present[first:]
+        shifted = np.where(present, self.apys[first:] - self.shift, 0.0)
+        cells = {
+            'count': present.astype(float),
+            'apy': shifted,
+            'apy_sq': shifted ** 2,
+            'tvl': self.tvls[first:],
+            'apy_tvl': self.products[first:],
+        }
+        for field, values in cells.items():
+            prefix = self.prefix[field]
+            prefix[first + 1:] = prefix[first] + np.cumsum(values, axis=0)
+
+    def sums(self, start=None, end=None):
+        """Per-pool sums of every field over [start, end]"""
+        lo, hi = date_bounds(self.dates, start, end)
+        return {field: prefix[hi] - prefix[lo] for field, prefix in self.prefix.items()}
+
+    def stats(self, start=None, end=None):
+        """Per-pool arrays of days, mean, variance (ddof=1) and std of APY, mean TVL and TVL-weighted APY"""
+        sums = self.sums(start, end)
+        n, s1, s2 = sums['count'], sums['apy'], sums['apy_sq']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = np.where(n > 1, np.maximum(s2 - s1 ** 2 / n, 0.0) / (n - 1), np.nan)
+            return {
+                'days': n.astype(int),
+                'mean_apy': np.where(n > 0, self.shift + s1 / n, np.nan),
+                'var_apy': var,
+                'std_apy': np.sqrt(var),
+                'mean_tvl': np.where(n > 0, sums['tvl'] / n, np.nan),
+                'weighted_apy': np.where(sums['tvl'] > 0, sums['apy_tvl'] / sums['tvl'], np.nan),
+            }
+
+    def pool_stats(self, start=None, end=None, pools=None):
+        """`stats` as a frame indexed by pool, optionally for some pools only"""
+        stats = pd.DataFrame(self.stats(start, end), index=pd.Index(self.pools, name='pool'))
+        return stats if pools is None else stats.loc[list(pools)]
+
+    def weighted_apy(self, start=None, end=None, mask=None):
+        """TVL-weighted APY over all (date, pool) cells of the range, optionally for a pool mask"""
+        sums = self.sums(start, end)
+        apy_tvl, tvl = sums['apy_tvl'], sums['tvl']
+        if mask is not None:
+            apy_tvl, tvl = apy_tvl[mask], tvl[mask]
+        total = tvl.sum()
+        return apy_tvl.sum() / total if total > 0 else np.nan
+
+    def group_weighted_apy(self, by, metadata, start=None, end=None):
+        """TVL-weighted APY and TVL per protocol, chain or asset over the range"""
+        sums = self.sums(start, end)
+        membership = build_membership_matrix(self.pools, metadata, by)
+        apy_tvl = sums['apy_tvl'] @ membership.to_numpy()
+        tvl = sums['tvl'] @ membership.to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weighted = np.where(tvl > 0, apy_tvl / tvl, np.nan)
+        return pd.DataFrame({'weighted_apy': weighted, 'tvl_days': tvl},
+                            index=pd.Index(membership.columns, name=by))
+
+    def save(self, path=INDEX_FILE):
+        """Write the stored cells; the cumulative sums are rebuilt on load"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, dates=self.dates, pools=np.array(self.pools, dtype=str), shift=self.shift,
+                 present=self.present, apys=self.apys, tvls=self.tvls, products=self.products)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        index = cls()
+        with np.load(path) as data:
+            index.dates = data['dates']
+            index.pools = list(data['pools'])
+            index.shift = data['shift']
+            index.present, index.apys = data['present'], data['apys']
+            index.tvls, index.products = data['tvls'], data['products']
+        index.positions = {pool: j for j, pool in enumerate(index.pools)}
+        index.prefix = {field: np.zeros((len(index.dates) + 1, len(index.pools))) for field in FIELDS}
+        index._accumulate(0)
+        return index
+
+
+def load_summary(statistics_dir=STATISTICS_DIR):
+    """(apy_df, tvl_df) summary frames written by collect_defi_data.py"""
+    apy_df = pd.read_csv(os.path.join(statistics_dir, 'summary_apy.csv'), dtype={'date': str})
+    tvl_df = pd.read_csv(os.path.join(statistics_dir, 'summary_tvl.csv'), dtype={'date': str})
+    if not apy_df['date'].equals(tvl_df['date']):
+        raise ValueError('summary_apy.csv and summary_tvl.csv rows are not aligned by date')
+    return apy_df, tvl_df
+
+
+def update(index, apy_df, tvl_df, revision_days=REVISION_DAYS):
+    """Extend the index with the summary rows after its last date, re-reading the last few indexed days;
+    pools not yet in the index are added with their full history"""
+    if not len(index.dates):
+        return index.extend(apy_df, tvl_df)
+    since = index.dates[max(len(index.dates) - revision_days, 0)]
+    keep = apy_df['date'].astype(str).to_numpy() >= since
+    pools = [col for col in apy_df.columns if col != 'date' and col in tvl_df.columns]
+    new = ['date'] + [pool for pool in pools if pool not in index.positions]
+    known = ['date'] + [pool for pool in pools if pool in index.positions]
+    applied = index.extend(apy_df[new], tvl_df[new])
+    return max(applied, index.extend(apy_df.loc[keep, known], tvl_df.loc[keep, known]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('command', choices=['build', 'update', 'query'])
+    parser.add_argument('--index', default=INDEX_FILE)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--pool', nargs='+', help='pools to report (default: all)')
+    parser.add_argument('--by', choices=['protocol', 'chain', 'asset'], help='report weighted APY per group')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        index = RangeIndex.from_summary(*load_summary())
+        index.save(args.index)
+        print(f"Indexed {len(index.pools)} pools over {len(index.dates)} dates in "
+              f"{time.perf_counter() - start:.3f}s, saved to {args.index}")
+        return
+    if args.command == 'update':
+        index = RangeIndex.load(args.index) if os.path.exists(args.index) else RangeIndex()
+        before = len(index.dates)
+        applied = update(index, *load_summary())
+        index.save(args.index)
+        print(f"Applied {applied} rows ({len(index.dates) - before} new dates) in "
+              f"{time.perf_counter() - start:.3f}s; {len(index.pools)} pools over {len(index.dates)} dates")
+        return
+
+    index = RangeIndex.load(args.index)
+    query_start = time.perf_counter()
+    if args.by:
+        result = index.group_weighted_apy(args.by, load_pool_metadata(), args.start, args.end)
+    else:
+        result = index.pool_stats(args.start, args.end, args.pool)
+    elapsed = time.perf_counter() - query_start
+    print(result.round(4).to_string())
+    print(f"\nOverall weighted APY {index.weighted_apy(args.start, args.end):.4f}% "
+          f"(query {elapsed * 1e3:.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
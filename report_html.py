@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Script to build a self-contained interactive HTML report from the strategy outputs.
+
+The report embeds TVL-weighted APY and TVL pre-aggregated per protocol, asset and
+chain at daily, weekly and monthly resolution, together with the best-pool
+strategy series from statistics/best_*.csv. The chart picks the coarsest
+resolution that still gives enough points for the visible window, so zooming in
+switches to finer data without shipping every pool's history.
+"""
+
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from profiling import profiled
+from strategy import load_all_data, find_best_protocols, calculate_pool_statistics
+
+# Configuration
+OUTPUT_FILE = "graphs/report.html"
+STATISTICS_DIR = "statistics"
+RESOLUTIONS = {"daily": "D", "weekly": "W-MON", "monthly": "MS"}
+VIEWS = ["protocol", "asset", "chain"]
+MAX_SERIES_PER_VIEW = 12      # Smaller groups are folded into "other"
+MAX_DAILY_POINTS = 730        # Older history is only embedded at weekly/monthly resolution
+MAX_POOL_ROWS = 50            # Pool statistics table: the largest pools by average TVL
+TVL_SIGNIFICANT_DIGITS = 4    # TVL in millions is rounded relative to its magnitude
+APY_TYPES = ['apy', 'apy_base', 'apy_reward', 'apy_total']
+
+
+def build_panel(all_data):
+    """Combine per-pool frames into one long frame with apy*tvl precomputed"""
+    panel = pd.concat(all_data.values(), ignore_index=True)
+    panel = panel[['date', 'protocol', 'asset', 'chain', 'apy', 'tvl']].copy()
+    panel['apy_tvl'] = panel['apy'] * panel['tvl']
+    return panel
+
+
+def series_groups(panel, view, max_series=MAX_SERIES_PER_VIEW):
+    """Largest groups by average TVL, then 'other' if any are left over
+
+    Computed once from the full-range panel and used at every resolution, so a
+    series keeps its group and color when the chart switches resolution.
+    """
+    avg_tvl = panel.groupby(view)['tvl'].mean().sort_values(ascending=False)
+    groups = list(avg_tvl.index[:max_series])
+    return groups + ['other'] if len(avg_tvl) > max_series else groups
+
+
+def fold_small_groups(panel, view, groups):
+    """Group of each row, with groups outside `groups` folded into 'other'"""
+    return panel[view].where(panel[view].isin(groups), 'other')
+
+
+def aggregate_view(panel, view, freq, groups):
+    """TVL-weighted APY and average TVL per group at the given resolution"""
+    keys = fold_small_groups(panel, view, groups)
+    # Daily totals per group first, so TVL is summed across pools, not averaged
+    daily = (panel.assign(group=keys)
+             .groupby(['date', 'group'])[['apy_tvl', 'tvl']].sum()
+             .reset_index())
+    grouped = daily.groupby(['group', pd.Grouper(key='date', freq=freq)])
+    agg = grouped.agg(apy_tvl=('apy_tvl', 'sum'), tvl_sum=('tvl', 'sum'), tvl=('tvl', 'mean'))
+    agg['apy'] = agg['apy_tvl'] / agg['tvl_sum'].where(agg['tvl_sum'] > 0)
+    return agg[['apy', 'tvl']]
+
+
+def aggregate_best(best_protocols, freq):
+    """Average best APY of each strategy at the given resolution"""
+    frames = {}
+    for apy_type, df in best_protocols.items():
+        series = df.set_index(pd.to_datetime(df['date']))[f'best_{apy_type}']
+        frames[apy_type] = series.resample(freq).mean()
+    return pd.DataFrame(frames)
+
+
+def round_significant(value, digits=TVL_SIGNIFICANT_DIGITS):
+    """Round to a number of significant digits, so small values do not round to 0"""
+    if value == 0:
+        return 0.0
+    return round(value, digits - 1 - math.floor(math.log10(abs(value))))
+
+
+def to_columnar(frame_by_group, dates, groups):
+    """Encode {group: DataFrame(apy, tvl)} as compact arrays aligned on dates, in the order of `groups`"""
+    series = {}
+    for group in groups:
+        df = frame_by_group.get(group, pd.DataFrame(columns=['apy', 'tvl'], dtype=float)).reindex(dates)
+        series[group] = {
+            'apy': [None if pd.isna(v) else round(float(v), 2) for v in df['apy']],
+            'tvl': [None if pd.isna(v) else round_significant(float(v) / 1e6) for v in df['tvl']],
+        }
+    return series
+
+
+@profiled('summarise')
+def build_report_data(all_data, best_protocols, pool_stats):
+    """Pre-aggregate everything the report needs into a JSON-serialisable dict"""
+    panel = build_panel(all_data)
+    groups = {view: series_groups(panel, view) for view in VIEWS}
+    data = {'generated': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M'),
+            'resolutions': {}}
+
+    for name, freq in RESOLUTIONS.items():
+        level_panel = panel
+        if name == 'daily':
+            cutoff = panel['date'].max() - pd.Timedelta(days=MAX_DAILY_POINTS)
+            level_panel = panel[panel['date'] > cutoff]
+
+        best = aggregate_best(best_protocols, freq)
+        if name == 'daily':
+            best = best[best.index > level_panel['date'].min() - pd.Timedelta(days=1)]
+        dates = pd.DatetimeIndex(sorted(set(best.index)))
+
+        views = {}
+        for view in VIEWS:
+            agg = aggregate_view(level_panel, view, freq, groups[view])
+            by_group = {g: df.droplevel('group') for g, df in agg.groupby(level='group')}
+            dates = dates.union(agg.index.get_level_values('date').unique())
+            views[view] = by_group
+
+        level = {'dates': [d.strftime('%Y-%m-%d') for d in dates], 'views': {}}
+        for view, by_group in views.items():
+            level['views'][view] = to_columnar(by_group, dates, groups[view])
+        best = best.reindex(dates)
+        level['views']['best'] = {
+            apy_type: {'apy': [None if pd.isna(v) else round(float(v), 2) for v in best[apy_type]],
+                       'tvl': None}
+            for apy_type in best.columns
+        }
+        data['resolutions'][name] = level
+
+    # Only the largest pools are listed, so the file size does not grow with the universe
+    avg_tvl = pd.Series({pool: df['tvl'].mean() for pool, df in all_data.items()})
+    largest = avg_tvl.sort_values(ascending=False).index[:MAX_POOL_ROWS]
+    stats = pool_stats.set_index('pool')[['avg_apy', 'var_apy']]
+    stats = stats.loc[[pool for pool in largest if pool in stats.index]].reset_index()
+    stats['std_apy'] = stats['var_apy'] ** 0.5
+    stats = stats.drop(columns='var_apy').round(2).astype(object)
+    data['pool_statistics'] = stats.where(stats.notna(), None).to_dict(orient='records')
+    data['pool_count'] = len(pool_stats)
+    return data
+
+
+def load_best_protocols(all_data):
+    """Read statistics/best_*.csv written by strategy.py, recomputing if missing"""
+    best_protocols = {}
+    for apy_type in APY_TYPES:
+        path = Path(STATISTICS_DIR) / f'best_{apy_type}.csv'
+        if not path.exists():
+            print(f"{path} not found, recomputing best protocols")
+            return find_best_protocols(all_data)
+        best_protocols[apy_type] = pd.read_csv(path)
+    return best_protocols
+
+
+@profiled('plot')
+def render_html(data):
+    """Render the report data into a single HTML document"""
+    # A '</' inside a string (e.g. a pool name) must not close the <script> element
+    payload = json.dumps(data, separators=(',', ':'), allow_nan=False).replace('</', '<\\/')
+    return HTML_TEMPLATE.replace('__REPORT_DATA__', payload)
+
+
+def main(all_data=None, best_protocols=None):
+    start = time.perf_counter()
+
+    if all_data is None:
+        print("Loading data...")
+        all_data = load_all_data()
+
+    if best_protocols is None:
+        print("\nLoading strategy results...")
+        best_protocols = load_best_protocols(all_data)
+    pool_stats = calculate_pool_statistics(all_data)
+
+    print("\nAggregating report data...")
+    data = build_report_data(all_data, best_protocols, pool_stats)
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    html = render_html(data)
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    elapsed = time.perf_counter() - start
+    print(f"\nSaved report to {OUTPUT_FILE} ({len(html) / 1024:,.1f} KiB) in {elapsed:.2f}s")
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>DeFi Yield Report</title>
+<style>
+  body { font-family: sans-serif; margin: 20px; color: #222; }
+  #controls { margin-bottom: 10px; }
+  #controls select, #controls button { margin-right: 8px; }
+  #chart { border: 1px solid #ccc; cursor: grab; width: 100%; height: 480px; }
+  #legend label { display: inline-block; margin: 4px 12px 4px 0; font-size: 13px; }
+  #legend span { display: inline-block; width: 12px; height: 12px; margin-right: 4px; vertical-align: middle; }
+  #status { color: #666; font-size: 13px; margin-left: 8px; }
+  table { border-collapse: collapse; margin-top: 20px; font-size: 13px; }
+  td, th { border: 1px solid #ddd; padding: 4px 8px; text-align: right; }
+  td:first-child, th:first-child { text-align: left; }
+</style>
+</head>
+<body>
+<h1>DeFi Yield Report</h1>
+<div id="controls">
+  View <select id="view">
+    <option value="best">Best strategy</option>
+    <option value="protocol">Per protocol</option>
+    <option value="asset">Per asset</option>
+    <option value="chain">Per chain</option>
+  </select>
+  Metric <select id="metric">
+    <option value="apy">TVL-weighted APY (%)</option>
+    <option value="tvl">TVL (millions USD)</option>
+  </select>
+  <button id="reset">Reset zoom</button>
+  <span id="status"></span>
+</div>
+<canvas id="chart"></canvas>
+<div id="legend"></div>
+<h2 id="stats-title">Pool statistics</h2>
+<table id="stats"><thead><tr><th>Pool</th><th>Avg APY</th><th>Std APY</th></tr></thead><tbody></tbody></table>
+<script>
+const DATA = __REPORT_DATA__;
+const COLORS = ['#1f77b4','#ff7f0e','#2ca02c','#d62728','#9467bd','#8c564b',
+                '#e377c2','#7f7f7f','#bcbd22','#17becf','#393b79','#637939','#aaaaaa'];
+const DAY = 86400000;
+const canvas = document.getElementById('chart');
+const ctx = canvas.getContext('2d');
+const levels = {};
+for (const [name, level] of Object.entries(DATA.resolutions)) {
+  levels[name] = Object.assign({}, level, {t: level.dates.map(d => Date.parse(d))});
+}
+const full = levels.monthly.t.length ? levels.monthly : levels.daily;
+const lastDaily = levels.daily.t;
+let range = [Math.min(levels.weekly.t[0], full.t[0]), Math.max(lastDaily[lastDaily.length - 1], full.t[full.t.length - 1])];
+const initialRange = range.slice();
+const hidden = new Set();
+
+function pickLevel(r) {
+  // Coarsest resolution that still gives one point per ~8 pixels of width
+  const wanted = canvas.clientWidth / 8;
+  const days = (r[1] - r[0]) / DAY;
+  if (days / 30 >= wanted) return 'monthly';
+  if (days / 7 >= wanted || r[0] < levels.daily.t[0]) return 'weekly';
+  return 'daily';
+}
+
+function currentSeries(level) {
+  const view = document.getElementById('view').value;
+  const metric = view === 'best' ? 'apy' : document.getElementById('metric').value;
+  const out = [];
+  Object.entries(level.views[view] || {}).forEach(([name, s], i) => {
+    if (s[metric]) out.push({name, values: s[metric], color: COLORS[i % COLORS.length]});
+  });
+  return out;
+}
+
+function draw() {
+  canvas.width = canvas.clientWidth * devicePixelRatio;
+  canvas.height = canvas.clientHeight * devicePixelRatio;
+  ctx.setTransform(devicePixelRatio, 0, 0, devicePixelRatio, 0, 0);
+  const w = canvas.clientWidth, h = canvas.clientHeight, pad = 50;
+  ctx.clearRect(0, 0, w, h);
+  const name = pickLevel(range), level = levels[name];
+  const series = currentSeries(level);
+  const lo = level.t.findIndex(t => t >= range[0]);
+  let hi = level.t.length - 1;
+  while (hi > 0 && level.t[hi] > range[1]) hi--;
+  let ymin = Infinity, ymax = -Infinity;
+  for (const s of series) {
+    if (hidden.has(s.name)) continue;
+    for (let i = Math.max(lo, 0); i <= hi; i++) {
+      const v = s.values[i];
+      if (v === null) continue;
+      ymin = Math.min(ymin, v); ymax = Math.max(ymax, v);
+    }
+  }
+  if (!isFinite(ymin)) { ymin = 0; ymax = 1; }
+  if (ymax === ymin) ymax = ymin + 1;
+  const x = t => pad + (t - range[0]) / (range[1] - range[0]) * (w - 2 * pad);
+  const y = v => h - pad - (v - ymin) / (ymax - ymin) * (h - 2 * pad);
+  ctx.strokeStyle = '#999'; ctx.fillStyle = '#444'; ctx.font = '12px sans-serif';
+  ctx.beginPath(); ctx.moveTo(pad, pad); ctx.lineTo(pad, h - pad); ctx.lineTo(w - pad, h - pad); ctx.stroke();
+  for (let k = 0; k <= 4; k++) {
+    const v = ymin + (ymax - ymin) * k / 4;
+    ctx.fillText(String(+v.toPrecision(4)), 4, y(v) + 4);
+    const t = range[0] + (range[1] - range[0]) * k / 4;
+    ctx.fillText(new Date(t).toISOString().slice(0, 10), x(t) - 30, h - pad + 16);
+  }
+  ctx.save(); ctx.beginPath(); ctx.rect(pad, 0, w - 2 * pad, h); ctx.clip();
+  for (const s of series) {
+    if (hidden.has(s.name)) continue;
+    ctx.strokeStyle = s.color; ctx.lineWidth = 1.5; ctx.beginPath();
+    let pen = false;
+    for (let i = Math.max(lo - 1, 0); i <= Math.min(hi + 1, level.t.length - 1); i++) {
+      const v = s.values[i];
+      if (v === null) { pen = false; continue; }
+      if (pen) ctx.lineTo(x(level.t[i]), y(v)); else ctx.moveTo(x(level.t[i]), y(v));
+      pen = true;
+    }
+    ctx.stroke();
+  }
+  ctx.restore();
+  document.getElementById('status').textContent = name + ' resolution';
+  drawLegend(series);
+}
+
+function drawLegend(series) {
+  const legend = document.getElementById('legend');
+  legend.innerHTML = '';
+  for (const s of series) {
+    const label = document.createElement('label');
+    const box = document.createElement('input');
+    box.type = 'checkbox'; box.checked = !hidden.has(s.name);
+    box.onchange = () => { box.checked ? hidden.delete(s.name) : hidden.add(s.name); draw(); };
+    const swatch = document.createElement('span');
+    swatch.style.background = s.color;
+    label.append(box, swatch, s.name);
+    legend.append(label);
+  }
+}
+
+canvas.addEventListener('wheel', e => {
+  e.preventDefault();
+  const frac = (e.offsetX - 50) / (canvas.clientWidth - 100);
+  const center = range[0] + frac * (range[1] - range[0]);
+  const scale = e.deltaY < 0 ? 0.8 : 1.25;
+  const span = Math.max((range[1] - range[0]) * scale, 7 * DAY);
+  range = [Math.max(center - frac * span, initialRange[0]), Math.min(center + (1 - frac) * span, initialRange[1])];
+  draw();
+});
+let drag = null;
+canvas.addEventListener('mousedown', e => { drag = {x: e.clientX, range: range.slice()}; });
+window.addEventListener('mouseup', () => { drag = null; });
+window.addEventListener('mousemove', e => {
+  if (!drag) return;
+  const shift = (drag.x - e.clientX) / (canvas.clientWidth - 100) * (drag.range[1] - drag.range[0]);
+  const span = drag.range[1] - drag.range[0];
+  const start = Math.min(Math.max(drag.range[0] + shift, initialRange[0]), initialRange[1] - span);
+  range = [start, start + span];
+  draw();
+});
+document.getElementById('reset').onclick = () => { range = initialRange.slice(); draw(); };
+document.getElementById('view').onchange = () => { hidden.clear(); draw(); };
+document.getElementById('metric').onchange = draw;
+window.addEventListener('resize', draw);
+
+const tbody = document.querySelector('#stats tbody');
+document.getElementById('stats-title').textContent =
+  `Pool statistics (largest ${DATA.pool_statistics.length} of ${DATA.pool_count} pools by average TVL)`;
+for (const row of DATA.pool_statistics) {
+  const tr = document.createElement('tr');
+  [row.pool, row.avg_apy, row.std_apy].forEach(v => {
+    const td = document.createElement('td'); td.textContent = v; tr.append(td);
+  });
+  tbody.append(tr);
+}
+draw();
+</script>
+</body>
+</html>
+"""
+
+if __name__ == "__main__":
+    main()
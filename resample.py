@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Resampling engine that aligns every pool onto a common time grid in one step.
+
+Pool histories may come at any resolution (daily DefiLlama charts, hourly Dune
+buckets, irregular samples). Each observation is floored to its bucket of the
+requested frequency and all pools are aggregated together with `np.bincount`
+over flat (bucket, pool) indices, giving one buckets x pools matrix per column.
+Per bucket a pool gets:
+
+- `last`: its latest observation in the bucket;
+- `mean`: the mean of its observations;
+- `tvl_mean`: TVL-weighted mean APYs and mean TVL.
+
+The grid holds every bucket that has an observation of any pool. The panel can
+be turned back into per-pool frames (the layout of strategy.load_all_data) or
+into summary frames (the layout of statistics/summary_*.csv), so
+find_best_protocols and the weighted APY step run at any granularity.
+
+Usage:
+    python resample.py --freq 1h --how tvl_mean     # summary of the aligned grid
+    python cli.py strategy weighted --freq 1W       # weekly best pools and weighted APY
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+DATE_FORMAT = '%Y-%m-%d'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+HOW = ['last', 'mean', 'tvl_mean']
+VALUE_COLUMNS = ['tvl', 'apy', 'apy_base', 'apy_reward']
+META_COLUMNS = ['protocol', 'asset', 'chain']
+
+
+def time_format(times):
+    """Dates only when every timestamp is at midnight, full timestamps otherwise"""
+    times = pd.DatetimeIndex(times)
+    return DATE_FORMAT if (times == times.normalize()).all() else TIMESTAMP_FORMAT
+
+
+def floor_times(times, freq):
+    """Start of the bucket of each timestamp"""
+    times = pd.DatetimeIndex(times)
+    offset = to_offset(freq)
+    try:
+        return times.floor(offset)
+    except ValueError:
+        # Calendar frequencies (W, MS, QS, ...) have no fixed length; their anchors are the bucket edges
+        edges = pd.date_range(offset.rollback(times.min().normalize()), times.max(), freq=offset)
+        return edges[np.searchsorted(edges, times, side='right') - 1]
+
+
+@dataclass
+class AlignedPanel:
+    """Buckets x pools matrices of every value column, NaN where a pool has no data"""
+    times: pd.DatetimeIndex
+    pools: List[str]
+    values: Dict[str, np.ndarray]
+    metadata: pd.DataFrame
+    dtypes: Dict[str, np.dtype] = None     # Input dtypes, so integer columns such as TVL stay integer
+
+    def to_pool_frames(self) -> Dict[str, pd.DataFrame]:
+        """Per-pool frames in the layout of strategy.load_all_data, empty buckets dropped"""
+        present = ~np.isnan(self.values['apy'])
+        frames = {}
+        for j, pool in enumerate(self.pools):
+            rows = present[:, j]
+            if not rows.any():
+                continue
+            df = pd.DataFrame({'date': self.times[rows]})
+            for column in self.values:
+                values = self.values[column][rows, j]
+                dtype = (self.dtypes or {}).get(column)
+                if dtype is not None and np.issubdtype(dtype, np.integer) and (values == np.round(values)).all():
+                    values = values.astype(dtype)
+                df[column] = values
+            for column in self.metadata.columns:
+                df[column] = self.metadata.iloc[j][column]
+            frames[pool] = df
+        return frames
+
+    def to_summary_frames(self):
+        """(apy_df, tvl_df) in the layout of statistics/summary_*.csv, missing values as 0"""
+        dates = pd.Series(self.times).dt.strftime(time_format(self.times))
+        frames = []
+        for column in ['apy', 'tvl']:
+            df = pd.DataFrame(np.nan_to_num(self.values[column]), columns=self.pools)
+            df.insert(0, 'date', dates.to_numpy())
+            frames.append(df)
+        return tuple(frames)
+
+
+def aggregate(times, pool_idx, n_pools, values, freq, how='last'):
+    """Aggregate long arrays of observations into buckets x pools matrices
+
+    Args:
+        times: Timestamp of every observation
+        pool_idx: Pool column (0..n_pools-1) of every observation
+        values: Column name -> observation values; NaN values are ignored
+        freq: pandas frequency of the grid, e.g. '1h', '1D', 'W'
+        how: 'last', 'mean' or 'tvl_mean'
+
+    Returns:
+        (bucket times, {column: buckets x pools matrix})
+    """
+    if how not in HOW:
+        raise ValueError(f"how must be one of {HOW}, not {how!r}")
+    buckets = floor_times(times, freq)
+    grid, bucket_idx = np.unique(buckets.to_numpy(), return_inverse=True)
+    size = len(grid) * n_pools
+    flat = bucket_idx.ravel() * n_pools + np.asarray(pool_idx)
+
+    matrices = {}
+    if how == 'last':
+        # Sort by cell, then time; the last row of each cell is its latest observation
+        order = np.lexsort((np.asarray(times, dtype='datetime64[ns]'), flat))
+        for column, column_values in values.items():
+            valid = order[~np.isnan(column_values[order])]
+            cells = flat[valid]
+            last = valid[np.r_[cells[1:] != cells[:-1], True]] if len(valid) else valid
+            matrix = np.full(size, np.nan)
+            matrix[flat[last]] = column_values[last]
+            matrices[column] = matrix
+    else:
+        tvl = values.get('tvl')
+        for column, column_values in values.items():
+            valid = ~np.isnan(column_values)
+            counts = np.bincount(flat[valid], minlength=size)
+            sums = np.bincount(flat[valid], weights=column_values[valid], minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                matrix = np.where(counts > 0, sums / counts, np.nan)
+                if how == 'tvl_mean' and column != 'tvl' and tvl is not None:
+                    weighted = valid & ~np.isnan(tvl) & (tvl > 0)
+                    weight = np.bincount(flat[weighted], weights=tvl[weighted], minlength=size)
+                    numerator = np.bincount(flat[weighted], weights=(column_values * tvl)[weighted], minlength=size)
+                    # Buckets without positive TVL fall back to the plain mean
+                    matrix = np.where(weight > 0, numerator / weight, matrix)
+            matrices[column] = matrix
+    shape = (len(grid), n_pools)
+    return pd.DatetimeIndex(grid), {column: matrix.reshape(shape) for column, matrix in matrices.items()}
+
+
+def align_pools(all_data, freq='1D', how='last', columns=VALUE_COLUMNS):
+    """Align per-pool frames (strategy.load_all_data) onto one grid"""
+    pools = list(all_data)
+    frames = list(all_data.values())
+    pool_idx = np.repeat(np.arange(len(pools)), [len(df) for df in frames])
+    times = pd.DatetimeIndex(np.concatenate([pd.to_datetime(df['date']).to_numpy('datetime64[ns]')
+                                             for df in frames]))
+    values = {column: np.concatenate([pd.to_numeric(df[column], errors='coerce').to_numpy(float)
+                                      for df in frames]) for column in columns}
+    grid, matrices = aggregate(times, pool_idx, len(pools), values, freq, how)
+    metadata = pd.DataFrame([{column: df[column].iloc[0] if column in df.columns and len(df) else None
+                              for column in META_COLUMNS} for df in frames], index=pools)
+    dtypes = {column: np.result_type(*[df[column].dtype for df in frames]) for column in columns}
+    return AlignedPanel(grid, pools, matrices, metadata, dtypes)
+
+
+def align_summary(apy_df, tvl_df, freq='1D', how='last'):
+    """Align summary frames (date + one column per pool, 0 for missing) onto a grid of another frequency"""
+    pools = [col for col in apy_df.columns if col != 'date']
+    apys = apy_df[pools].to_numpy(dtype=float)
+    tvls = tvl_df[pools].to_numpy(dtype=float)
+    # A pool without data on a date has 0 in both files
+    missing = (apys == 0) & (tvls == 0)
+    apys[missing] = np.nan
+    tvls[missing] = np.nan
+    n_rows, n_pools = apys.shape
+    times = pd.DatetimeIndex(np.repeat(pd.to_datetime(apy_df['date']).to_numpy(), n_pools))
+    pool_idx = np.tile(np.arange(n_pools), n_rows)
+    grid, matrices = aggregate(times, pool_idx, n_pools, {'apy': apys.ravel(), 'tvl': tvls.ravel()}, freq, how)
+    metadata = pd.DataFrame(index=pools, columns=META_COLUMNS)
+    return AlignedPanel(grid, pools, matrices, metadata)
+
+
+def resample_pool_data(all_data, freq='1D', how='last'):
+    """all_data at another frequency, same layout"""
+    return align_pools(all_data, freq, how).to_pool_frames()
+
+
+def resample_summary(apy_df, tvl_df, freq='1D', how='last'):
+    """Summary frames at another frequency, same layout"""
+    return align_summary(apy_df, tvl_df, freq, how).to_summary_frames()
+
+
+def main():
+    import time
+    from strategy import load_all_data
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--freq', default='1D', help='pandas frequency, e.g. 15min, 1h, 1D, W, MS')
+    parser.add_argument('--how', default='last', choices=HOW)
+    args = parser.parse_args()
+
+    all_data = load_all_data()
+    start = time.perf_counter()
+    panel = align_pools(all_data, args.freq, args.how)
+    elapsed = time.perf_counter() - start
+    present = ~np.isnan(panel.values['apy'])
+    print(f"\n{len(panel.pools)} pools on {len(panel.times)} buckets of {args.freq} "
+          f"({panel.times.min()} to {panel.times.max()}), {present.mean():.1%} filled, aligned in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
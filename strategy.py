@@ -1,8 +1,14 @@
 import pandas as pd
 import os
+import logging
 from pathlib import Path
-import glob
 
+from pool_registry import REGISTRY_FILE, load_metadata, load_names, pool_parts
+from profiling import count, profiled
+
+logger = logging.getLogger(__name__)
+
+@profiled('summarise')
 def calculate_pool_statistics(all_data):
     """Calculate average APYs and variance for each pool"""
     stats = []
@@ -12,7 +18,7 @@ def calculate_pool_statistics(all_data):
             # Check if required columns exist
             required_columns = ['apy', 'apy_base', 'apy_reward']
             if not all(col in df.columns for col in required_columns):
-                print(f"Missing columns in {pool_name}. Available columns: {df.columns.tolist()}")
+                logger.warning(f"Missing columns in {pool_name}. Available columns: {df.columns.tolist()}")
                 continue
                 
             pool_stats = {
@@ -28,61 +34,78 @@ def calculate_pool_statistics(all_data):
             }
             stats.append(pool_stats)
         except Exception as e:
-            print(f"Error processing {pool_name}: {str(e)}")
+            logger.warning(f"Error processing {pool_name}: {str(e)}")
             continue
     
     return pd.DataFrame(stats)
 
-def load_all_data():
-    """Load all CSV files from the data directory, filtered by pools_{THRESHOLD}.txt if threshold is set"""
-    data_dir = Path('data/defillama')
-    all_data = {}
+DATA_DIR = Path('data/defillama')
+# Protocols and assets left out of the strategy, matched against the registry
+EXCLUDED_PROTOCOLS = ['ethena', 'sky.money', 'ondo', 'elixir', 'openeden']
+EXCLUDED_ASSETS = ['susds', 'dai']
+REQUIRED_COLUMNS = ['date', 'apy', 'apy_base', 'apy_reward', 'tvl']
+
+def select_pools(registry_file=REGISTRY_FILE):
+    """Names of the registered DefiLlama pools the strategy considers"""
+    return load_names(registry_file, source='defillama', exclude_protocols=EXCLUDED_PROTOCOLS,
+                      exclude_assets=EXCLUDED_ASSETS)
 
+def list_pool_files(data_dir=DATA_DIR, registry_file=REGISTRY_FILE):
+    """Data files of the pools selected from the registry, for those that have been collected"""
+    data_dir = Path(data_dir)
     if not data_dir.exists():
         raise FileNotFoundError(f"Data directory not found: {data_dir}")
 
-    # Get all CSV files except summary/statistics and excluded protocols
-    exclude_names = ['ethena', 'sky.money', 'ondo', 'elixir', 'openeden', "susds", 'dai']
-    csv_files = glob.glob(str(data_dir / '*.csv'))
-    csv_files = [f for f in csv_files if not any(x in f for x in ['summary', 'statistics'])]
-    csv_files = [f for f in csv_files if not any(ex in Path(f).stem.lower() for ex in exclude_names)]
+    csv_files = [str(data_dir / f"{name}.csv") for name in sorted(select_pools(registry_file))]
+    csv_files = [f for f in csv_files if os.path.isfile(f)]
 
     if not csv_files:
-        raise FileNotFoundError(f"No CSV files found in {data_dir}")
+        raise FileNotFoundError(f"No CSV files of registered pools found in {data_dir}")
+    return csv_files
 
+def prepare_pool_frame(df, filename, metadata=None):
+    """Add protocol/asset/chain from the pool registry and clean the numeric columns; None if columns are missing"""
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        logger.warning(f"Warning: Missing columns in {filename}: {missing_columns}")
+        return None
+    protocol, asset, chain = pool_parts(filename, metadata)
+    df['protocol'] = protocol
+    df['asset'] = asset
+    df['chain'] = chain
+    df['date'] = pd.to_datetime(df['date'])
+    for col in ['apy', 'apy_base', 'apy_reward', 'tvl']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.dropna(subset=['apy', 'apy_base', 'apy_reward', 'tvl'])
+
+@profiled('load')
+def load_all_data():
+    """Load all CSV files from the data directory, with metadata joined from the pool registry"""
+    all_data = {}
+    csv_files = list_pool_files()
+    metadata = load_metadata()
     print(f"Found {len(csv_files)} CSV files to process")
 
     for file_path in csv_files:
         filename = Path(file_path).stem
         try:
-            parts = filename.split('_')
-            if len(parts) >= 3:
-                protocol = parts[0]
-                asset = parts[1]
-                chain = parts[2]
+            if len(filename.split('_')) >= 3:
                 df = pd.read_csv(file_path)
+                count('files')
+                count('rows', len(df))
                 if df.empty:
-                    print(f"Warning: Empty file: {filename}")
+                    logger.warning(f"Warning: Empty file: {filename}")
                     continue
-                required_columns = ['date', 'apy', 'apy_base', 'apy_reward', 'tvl']
-                missing_columns = [col for col in required_columns if col not in df.columns]
-                if missing_columns:
-                    print(f"Warning: Missing columns in {filename}: {missing_columns}")
+                df = prepare_pool_frame(df, filename, metadata)
+                if df is None:
                     continue
-                df['protocol'] = protocol
-                df['asset'] = asset
-                df['chain'] = chain
-                df['date'] = pd.to_datetime(df['date'])
-                for col in ['apy', 'apy_base', 'apy_reward', 'tvl']:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                df = df.dropna(subset=['apy', 'apy_base', 'apy_reward', 'tvl'])
                 if not df.empty:
                     all_data[filename] = df
-                    print(f"Successfully loaded {filename} with {len(df)} rows")
+                    logger.debug(f"Successfully loaded {filename} with {len(df)} rows")
                 else:
-                    print(f"Warning: No valid data in {filename} after cleaning")
+                    logger.warning(f"Warning: No valid data in {filename} after cleaning")
         except Exception as e:
-            print(f"Error loading {file_path}: {str(e)}")
+            logger.warning(f"Error loading {file_path}: {str(e)}")
             continue
 
     if not all_data:
@@ -91,10 +114,12 @@ def load_all_data():
     print(f"\nSuccessfully loaded data for {len(all_data)} protocols.")
     return all_data
 
+@profiled('best-protocol')
 def find_best_protocols(all_data):
     """Find the best protocol for each date and APY type"""
     # Combine all data into one DataFrame
     combined_data = pd.concat(all_data.values(), ignore_index=True)
+    count('rows', len(combined_data))
     
     # Calculate total APY (base + reward)
     combined_data['apy_total'] = combined_data['apy_base'] + combined_data['apy_reward']
@@ -158,8 +183,10 @@ def analyze_strategy(best_protocols):
     
     return results
 
-def main():
-    all_data = load_all_data()
+def main(all_data=None):
+    """Run the strategy analysis; returns the best protocols per APY type"""
+    if all_data is None:
+        all_data = load_all_data()
     print(f"Loaded data for {len(all_data)} protocols")
     
     # Calculate pool statistics
@@ -200,6 +227,8 @@ def main():
         output_file = f'statistics/best_{apy_type}.csv'
         df.to_csv(output_file, index=False)
         print(f"\nSaved {apy_type} results to {output_file}")
+    
+    return best_protocols
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
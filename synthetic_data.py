@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Script to generate a deterministic synthetic pool universe in the layout of the real data.
+
+A universe directory contains data/defillama/{protocol}_{asset}_{chain}.csv
+(date, tvl, apy, apy_base, apy_reward), statistics/summary_apy.csv and
+summary_tvl.csv (dates x pools, missing values as 0 like collect_defi_data.py)
+and the pool registry data/pool_registry.db, so the analysis scripts run on it unchanged from inside
+the directory. APYs are mean-reverting around a per-pool level with occasional
+spikes, some pools carry rewards, TVL follows a random walk, and a share of the
+pools start late or have missing days and multi-week gaps. The same seed and
+size always produce the same files.
+
+Usage:
+    python synthetic_data.py benchmarks/universes/demo --pools 500 --years 2
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pool_registry import REGISTRY_FILE, PoolRegistry
+
+END_DATE = '2025-06-05'
+BLOCK_SIZE = 1000  # Pools generated at a time
+LAYOUT_VERSION = 2  # Bumped when the generated files change for the same parameters
+
+PROTOCOLS = ['aave-v3', 'morpho-blue', 'fluid-lending', 'euler-v2', 'compound-v3', 'spark',
+             'kamino-lend', 'venus', 'silo-v2', 'maple']
+ASSETS = ['USDC', 'USDT', 'USDE', 'USDS', 'GHO', 'FRAX', 'PYUSD', 'LUSD', 'CRVUSD', 'USDT0']
+CHAINS = ['Ethereum', 'Base', 'Arbitrum', 'Avalanche', 'Polygon', 'Optimism', 'BSC']
+
+LATE_START_SHARE = 0.3   # Pools whose history starts after the first day
+GAP_SHARE = 0.2          # Pools with one multi-day gap
+MISSING_DAY_RATE = 0.01  # Randomly missing single days
+SPIKE_RATE = 0.005       # Days with an APY spike
+REWARD_SHARE = 0.35      # Pools paying reward APY
+
+
+def pool_names(n_pools):
+    """Unique {protocol}_{asset}_{chain} names; protocols vary fastest so small universes mix them,
+    then assets, then chains, and protocol versions are added once combinations run out"""
+    combos = len(PROTOCOLS) * len(ASSETS) * len(CHAINS)
+    names = []
+    for i in range(n_pools):
+        version, rest = divmod(i, combos)
+        rest, p = divmod(rest, len(PROTOCOLS))
+        c, a = divmod(rest, len(ASSETS))
+        protocol = PROTOCOLS[p] if version == 0 else f"{PROTOCOLS[p]}-s{version}"
+        names.append((protocol, ASSETS[a], CHAINS[c]))
+    return names
+
+
+def _mean_reverting(rng, n_days, n_pools, phi, sigma):
+    """AR(1) log-deviation paths (days x pools)"""
+    shocks = rng.normal(0, sigma, size=(n_days, n_pools)).astype(np.float32)
+    paths = np.empty_like(shocks)
+    paths[0] = shocks[0]
+    for t in range(1, n_days):
+        paths[t] = phi * paths[t - 1] + shocks[t]
+    return paths
+
+
+def generate_block(rng, n_days, n_pools):
+    """APY base, APY reward and TVL matrices (days x pools) with NaN where a pool has no data"""
+    level = np.clip(rng.lognormal(np.log(5), 0.5, n_pools), 0.5, 40).astype(np.float32)
+    apy_base = level * np.exp(_mean_reverting(rng, n_days, n_pools, 0.97, 0.08))
+    spikes = rng.random((n_days, n_pools)) < SPIKE_RATE
+    apy_base[spikes] *= rng.uniform(3, 15, spikes.sum()).astype(np.float32)
+
+    has_reward = rng.random(n_pools) < REWARD_SHARE
+    reward_level = np.where(has_reward, rng.uniform(0.2, 3, n_pools), 0).astype(np.float32)
+    apy_reward = reward_level * np.exp(_mean_reverting(rng, n_days, n_pools, 0.95, 0.1))
+
+    tvl_level = rng.lognormal(np.log(2e7), 1.5, n_pools).astype(np.float32)
+    drift = np.cumsum(rng.normal(0, 0.03, size=(n_days, n_pools)).astype(np.float32), axis=0)
+    tvl = np.round(tvl_level * np.exp(drift))
+
+    missing = rng.random((n_days, n_pools)) < MISSING_DAY_RATE
+    starts = np.where(rng.random(n_pools) < LATE_START_SHARE,
+                      rng.integers(0, max(int(n_days * 0.8), 1), n_pools), 0)
+    missing |= np.arange(n_days)[:, None] < starts[None, :]
+    for j in np.flatnonzero(rng.random(n_pools) < GAP_SHARE):
+        length = int(rng.integers(3, 31))
+        begin = int(rng.integers(0, max(n_days - length, 1)))
+        missing[begin:begin + length, j] = True
+
+    for matrix in (apy_base, apy_reward, tvl):
+        matrix[missing] = np.nan
+    return apy_base, apy_reward, tvl
+
+
+def generate_universe(root, n_pools=50, years=1, seed=0, end_date=END_DATE):
+    """Write a synthetic universe to root; skipped if the same one is already there"""
+    root = Path(root)
+    params = {'pools': n_pools, 'years': years, 'seed': seed, 'end_date': end_date,
+              'layout': LAYOUT_VERSION}
+    meta_file = root / 'universe.json'
+    if meta_file.exists() and json.loads(meta_file.read_text()) == params:
+        return params
+
+    pool_dir = root / 'data' / 'defillama'
+    stats_dir = root / 'statistics'
+    pool_dir.mkdir(parents=True, exist_ok=True)
+    stats_dir.mkdir(parents=True, exist_ok=True)
+    for old in pool_dir.glob('*.csv'):
+        old.unlink()
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=end_date, periods=int(round(365 * years)), freq='D')
+    date_strings = dates.strftime('%Y-%m-%d')
+    names = pool_names(n_pools)
+    columns = [f"{p}_{a}_{c}" for p, a, c in names]
+    summary_apy = np.zeros((len(dates), n_pools), dtype=np.float32)
+    summary_tvl = np.zeros((len(dates), n_pools), dtype=np.float32)
+
+    for start in range(0, n_pools, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_pools)
+        apy_base, apy_reward, tvl = generate_block(rng, len(dates), stop - start)
+        apy = apy_base + apy_reward
+        summary_apy[:, start:stop] = np.nan_to_num(apy)
+        summary_tvl[:, start:stop] = np.nan_to_num(tvl)
+        for j in range(stop - start):
+            rows = ~np.isnan(apy[:, j])
+            pd.DataFrame({
+                'date': date_strings[rows],
+                'tvl': tvl[rows, j].astype(np.int64),
+                'apy': apy[rows, j].round(5),
+                'apy_base': apy_base[rows, j].round(5),
+                'apy_reward': apy_reward[rows, j].round(5),
+            }).to_csv(pool_dir / f"{columns[start + j]}.csv", index=False)
+
+    for matrix, name in ((summary_apy, 'summary_apy.csv'), (summary_tvl, 'summary_tvl.csv')):
+        frame = pd.DataFrame(matrix.round(5), columns=columns)
+        frame.insert(0, 'date', date_strings)
+        frame.to_csv(stats_dir / name, index=False)
+
+    pool_ids = rng.integers(0, 2**63, n_pools)
+    registry_path = root / REGISTRY_FILE
+    if registry_path.exists():
+        registry_path.unlink()
+    with PoolRegistry(str(registry_path), legacy_glob=None) as registry:
+        registry.upsert(({
+            'uuid': f"synthetic-{pid:016x}",
+            'name': name,
+            'protocol': protocol,
+            'asset': asset,
+            'chain': chain,
+            'is_stablecoin': True,
+            'tvl_usd': float(summary_tvl[-1, j]),
+            'address': f"0x{pid:040x}",
+        } for j, (name, (protocol, asset, chain), pid) in enumerate(zip(columns, names, pool_ids))),
+            seen=pd.Timestamp(end_date).date())
+
+    meta_file.write_text(json.dumps(params, indent=2))
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('root', help='directory to write the universe to')
+    parser.add_argument('--pools', type=int, default=50)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_universe(args.root, args.pools, args.years, args.seed)
+    print(f"Synthetic universe with {args.pools} pools over {args.years:g} years in {os.path.abspath(args.root)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from gas_sampler import RECORD, append_records, load_samples, oracle_to_record, sample_path
+
+
+def records(start, count):
+    out = np.zeros(count, dtype=RECORD)
+    out['ts'] = np.arange(start, start + count)
+    for i, field in enumerate(['safe', 'propose', 'fast', 'base_fee']):
+        out[field] = out['ts'] % 100 + i
+    return out
+
+
+def test_append_drops_a_partial_record(tmp_path):
+    append_records('ethereum', records(1000, 3), tmp_path)
+    with open(sample_path('ethereum', tmp_path), 'ab') as f:
+        f.write(records(2000, 1).tobytes()[:7])  # Interrupted write
+    assert len(load_samples('ethereum', tmp_path)) == 3
+
+    append_records('ethereum', records(1003, 2), tmp_path)
+    samples = np.asarray(load_samples('ethereum', tmp_path))
+    assert samples.tobytes() == records(1000, 5).tobytes()
+    file_size = (tmp_path / 'ethereum.bin').stat().st_size
+    assert file_size == 5 * RECORD.itemsize
+
+
+def test_load_samples_of_unknown_network_is_empty(tmp_path):
+    assert len(load_samples('base', tmp_path)) == 0
+
+
+def test_oracle_to_record_marks_missing_prices_as_nan():
+    record = oracle_to_record({'result': {'SafeGasPrice': '1.5', 'ProposeGasPrice': 'x',
+                                          'FastGasPrice': '3'}}, timestamp=1700000000)
+    assert record['ts'][0] == 1700000000
+    assert record['safe'][0] == np.float32(1.5) and record['fast'][0] == 3
+    assert np.isnan(record['propose'][0]) and np.isnan(record['base_fee'][0])
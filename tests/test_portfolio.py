@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from portfolio import project_capped_simplex
+
+
+def bisect_projection(v, caps, iterations=200):
+    """Reference projection: bisect on tau until clip(v - tau, 0, caps) sums to 1"""
+    lo, hi = (v - caps).min() - 1, v.max() + 1
+    for _ in range(iterations):
+        tau = (lo + hi) / 2
+        if np.clip(v - tau, 0, caps).sum() > 1:
+            lo = tau
+        else:
+            hi = tau
+    return np.clip(v - (lo + hi) / 2, 0, caps)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_projection_matches_bisection(seed):
+    rng = np.random.default_rng(seed)
+    n_assets = 12
+    v = rng.normal(0, 0.5, (50, n_assets))
+    caps = rng.uniform(1 / n_assets, 0.6, n_assets)
+    w = project_capped_simplex(v, caps)
+    expected = np.array([bisect_projection(row, caps) for row in v])
+    np.testing.assert_allclose(w, expected, atol=1e-9)
+    np.testing.assert_allclose(w.sum(axis=1), 1, atol=1e-9)
+    assert (w >= 0).all() and (w <= caps + 1e-12).all()
+
+
+def test_projection_keeps_feasible_points_and_fills_tight_caps():
+    inside = np.array([0.4, 0.35, 0.25])
+    np.testing.assert_allclose(project_capped_simplex(inside, 0.5)[0], inside, atol=1e-12)
+    caps = np.array([0.5, 0.3, 0.2])
+    # Caps summing to exactly 1 leave a single feasible point
+    np.testing.assert_allclose(project_capped_simplex([5.0, -3.0, 0.0], caps)[0], caps, atol=1e-12)
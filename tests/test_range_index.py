@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from range_index import REVISION_DAYS, RangeIndex, update
+
+POOLS = ['aave-v3_USDC_Ethereum', 'morpho-blue_USDC_Base', 'spark_USDS_Ethereum', 'venus_USDT_BSC']
+
+
+def make_summary(n_days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2025-01-01', periods=n_days).strftime('%Y-%m-%d')
+    apy = pd.DataFrame(rng.uniform(1, 10, (n_days, len(POOLS))), columns=POOLS)
+    tvl = pd.DataFrame(rng.uniform(1e5, 1e8, (n_days, len(POOLS))), columns=POOLS)
+    tvl[rng.random(tvl.shape) < 0.15] = 0  # Missing days are written as 0
+    apy.insert(0, 'date', dates)
+    tvl.insert(0, 'date', dates)
+    return apy, tvl
+
+
+def assert_same_stats(index, expected, start=None, end=None):
+    assert index.pools == expected.pools
+    actual, wanted = index.stats(start, end), expected.stats(start, end)
+    for field in wanted:
+        np.testing.assert_allclose(actual[field], wanted[field], rtol=1e-9, equal_nan=True, err_msg=field)
+
+
+def test_stats_match_pandas_over_a_range():
+    apy_df, tvl_df = make_summary()
+    index = RangeIndex.from_summary(apy_df, tvl_df)
+    stats = index.pool_stats('2025-02-01', '2025-03-15')
+    window = apy_df['date'].between('2025-02-01', '2025-03-15')
+    for pool in POOLS:
+        present = window & (tvl_df[pool] > 0)
+        apy, tvl = apy_df.loc[present, pool], tvl_df.loc[present, pool]
+        assert stats.loc[pool, 'days'] == present.sum()
+        assert stats.loc[pool, 'mean_apy'] == pytest.approx(apy.mean())
+        assert stats.loc[pool, 'var_apy'] == pytest.approx(apy.var())
+        assert stats.loc[pool, 'mean_tvl'] == pytest.approx(tvl.mean())
+        assert stats.loc[pool, 'weighted_apy'] == pytest.approx((apy * tvl).sum() / tvl.sum())
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    apy_df, tvl_df = make_summary()
+    index = RangeIndex()
+    for end in (60, 61, 75, 120):
+        update(index, apy_df.iloc[:end], tvl_df.iloc[:end])
+    assert_same_stats(index, RangeIndex.from_summary(apy_df, tvl_df))
+    assert_same_stats(index, RangeIndex.from_summary(apy_df, tvl_df), '2025-03-01', '2025-03-31')
+
+
+def test_update_picks_up_revisions_of_recent_days():
+    apy_df, tvl_df = make_summary()
+    index = RangeIndex.from_summary(apy_df.iloc[:100], tvl_df.iloc[:100])
+    apy_df.iloc[100 - REVISION_DAYS:100, 1:] += 2.5
+    update(index, apy_df, tvl_df)
+    assert_same_stats(index, RangeIndex.from_summary(apy_df, tvl_df))
+
+
+def test_update_adds_new_pools_with_their_full_history():
+    apy_df, tvl_df = make_summary()
+    early = ['date'] + POOLS[:2]
+    index = RangeIndex.from_summary(apy_df[early].iloc[:100], tvl_df[early].iloc[:100])
+    update(index, apy_df, tvl_df)
+    expected = RangeIndex.from_summary(apy_df[early], tvl_df[early])
+    expected.extend(apy_df, tvl_df)
+    assert_same_stats(index, expected)
+    days = index.pool_stats()['days']
+    assert days[POOLS[3]] == (tvl_df[POOLS[3]] > 0).sum()
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from resample import aggregate
+
+N_POOLS = 4
+
+
+def make_observations(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 40 * 24 * 60, n), unit='min')
+    frame = pd.DataFrame({
+        'time': times,
+        'pool': rng.integers(0, N_POOLS, n),
+        'apy': rng.uniform(1, 10, n),
+        'tvl': rng.uniform(1e5, 1e7, n),
+    })
+    frame.loc[rng.random(n) < 0.1, 'apy'] = np.nan
+    frame.loc[rng.random(n) < 0.1, 'tvl'] = np.nan
+    return frame
+
+
+def bucket_starts(times, freq):
+    """Bucket of each timestamp, computed independently of resample.floor_times"""
+    if freq == '1h':
+        return times.dt.floor('h')
+    if freq == '1D':
+        return times.dt.floor('D')
+    period = {'W': 'W-SAT', 'MS': 'M'}[freq]  # Weeks start on Sunday as pandas anchors 'W'
+    return times.dt.to_period(period).dt.start_time
+
+
+def expected_matrix(frame, column, how, freq):
+    frame = frame.assign(bucket=bucket_starts(frame['time'], freq))
+    valid = frame.dropna(subset=[column])
+    groups = valid.sort_values('time', kind='stable').groupby(['bucket', 'pool'])
+    if how == 'last':
+        result = groups[column].last()
+    elif how == 'mean' or column == 'tvl':
+        result = groups[column].mean()
+    else:
+        weighted = valid[valid['tvl'] > 0]
+        tvl_mean = (weighted[column] * weighted['tvl']).groupby([weighted['bucket'], weighted['pool']]).sum() \
+            / weighted.groupby(['bucket', 'pool'])['tvl'].sum()
+        # Buckets without positive TVL fall back to the plain mean
+        result = tvl_mean.combine_first(groups[column].mean())
+    grid = pd.DatetimeIndex(sorted(frame['bucket'].unique()))
+    return result.unstack('pool').reindex(index=grid, columns=range(N_POOLS))
+
+
+@pytest.mark.parametrize('how', ['last', 'mean', 'tvl_mean'])
+@pytest.mark.parametrize('freq', ['1h', '1D', 'W', 'MS'])
+def test_aggregate_matches_pandas_groupby(freq, how):
+    frame = make_observations()
+    values = {column: frame[column].to_numpy(float) for column in ['apy', 'tvl']}
+    grid, matrices = aggregate(pd.DatetimeIndex(frame['time']), frame['pool'].to_numpy(), N_POOLS,
+                               values, freq, how)
+    for column in values:
+        expected = expected_matrix(frame, column, how, freq)
+        assert list(grid) == list(expected.index)
+        np.testing.assert_allclose(matrices[column], expected.to_numpy(float), rtol=1e-12)
+
+
+def test_aggregate_rejects_unknown_how():
+    frame = make_observations(10)
+    with pytest.raises(ValueError):
+        aggregate(pd.DatetimeIndex(frame['time']), frame['pool'].to_numpy(), N_POOLS,
+                  {'apy': frame['apy'].to_numpy(float)}, '1D', 'median')
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import weighted_apy
+from weighted_apy_stream import WeightedApyState, publish, refresh, summary_to_deltas
+
+POOLS = ['aave-v3_USDC_Ethereum', 'aave-v3_USDT_Base', 'morpho-blue_USDC_Base',
+         'spark_USDS_Ethereum', 'venus_USDT_BSC', 'venus_USDC_BSC']
+OUTPUTS = ['weighted_apy.csv'] + [f'weighted_apy_by_{by}.csv' for by in weighted_apy.GROUPINGS]
+
+
+def make_summary(n_days=30, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2025-01-01', periods=n_days).strftime('%Y-%m-%d')
+    apy = pd.DataFrame(rng.uniform(1, 10, (n_days, len(POOLS))).round(5), columns=POOLS)
+    tvl = pd.DataFrame(rng.uniform(1e5, 1e8, (n_days, len(POOLS))).round(), columns=POOLS)
+    tvl[rng.random(tvl.shape) < 0.15] = 0  # Missing days are written as 0
+    apy.insert(0, 'date', dates)
+    tvl.insert(0, 'date', dates)
+    return apy, tvl
+
+
+def write_batch(apy_df, tvl_df, directory):
+    directory.mkdir()
+    weighted_apy.calculate_weighted_apy(apy_df, tvl_df).to_csv(directory / OUTPUTS[0], index=False)
+    grouped = weighted_apy.calculate_grouped_weighted_apy(apy_df, tvl_df, metadata=None)
+    for by, df in grouped.items():
+        df.to_csv(directory / f'weighted_apy_by_{by}.csv', index=False)
+
+
+def assert_same_outputs(stream_dir, batch_dir):
+    for name in OUTPUTS:
+        stream = pd.read_csv(stream_dir / name, dtype={'date': str})
+        batch = pd.read_csv(batch_dir / name, dtype={'date': str})
+        # Sums accumulated in a different order can round to the neighbouring cent
+        pd.testing.assert_frame_equal(stream, batch, check_exact=False, rtol=0, atol=0.0100001)
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = WeightedApyState(str(tmp_path / 'state.db'), metadata=pd.DataFrame())
+    yield state
+    state.close()
+
+
+def test_refresh_from_empty_state_matches_batch(tmp_path, state):
+    apy_df, tvl_df = make_summary()
+    publish(state, refresh(state, apy_df, tvl_df), tmp_path)
+    write_batch(apy_df, tvl_df, tmp_path / 'batch')
+    assert_same_outputs(tmp_path, tmp_path / 'batch')
+
+
+def test_refresh_with_revisions_new_days_and_new_group_matches_batch(tmp_path, state):
+    apy_df, tvl_df = make_summary()
+    early = [col for col in apy_df.columns if not col.startswith('venus_')]
+    publish(state, refresh(state, apy_df[early].iloc[:-2], tvl_df[early].iloc[:-2]), tmp_path)
+
+    apy_df.iloc[-3, 1:3] += 1.5   # Collector revised a recent day
+    tvl_df.iloc[-1, 3:] = 0       # Sparse new day
+    changed = refresh(state, apy_df, tvl_df)
+    assert len(changed) == len(apy_df)  # The venus pools arrive with their full history
+    publish(state, changed, tmp_path)
+    write_batch(apy_df, tvl_df, tmp_path / 'batch')
+    assert_same_outputs(tmp_path, tmp_path / 'batch')
+
+
+def test_sparse_delta_for_new_date_fills_every_group(tmp_path, state):
+    apy_df, tvl_df = make_summary()
+    publish(state, refresh(state, apy_df.iloc[:-1], tvl_df.iloc[:-1]), tmp_path)
+
+    deltas = summary_to_deltas(apy_df.iloc[-1:, :3], tvl_df.iloc[-1:, :3])
+    publish(state, state.apply_deltas(deltas), tmp_path)
+    tvl_df.iloc[-1, 3:] = 0
+    write_batch(apy_df, tvl_df, tmp_path / 'batch')
+    assert_same_outputs(tmp_path, tmp_path / 'batch')
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Script to price deposits and withdrawals per chain and day, and net them out of strategy APYs.
+
+The cost of an action on a chain is gas units x gas price x native token price.
+Daily gas prices come from the EtherScanAPI history cache (data/etherscan) or
+{chain}_daily_gas.csv files, native token prices from data/prices/{TOKEN}.csv;
+missing series fall back to typical values. The resulting date x chain cost
+matrices are joined to the best_*.csv strategies, or to any allocation series,
+with vectorized index lookups, and net APY is computed for many deposit sizes at
+once by broadcasting.
+
+Usage:
+    python transaction_costs.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import glob
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+STATISTICS_DIR = 'statistics'
+ETHERSCAN_DIR = 'data/etherscan'
+PRICES_DIR = 'data/prices'
+APY_TYPES = ['apy', 'apy_base', 'apy_reward', 'apy_total']
+DEPOSIT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Gas used by a typical lending-market supply / withdraw call
+GAS_UNITS = {'deposit': 200_000, 'withdraw': 180_000}
+NATIVE_TOKEN = {
+    'ethereum': 'ETH', 'arbitrum': 'ETH', 'base': 'ETH', 'optimism': 'ETH',
+    'polygon': 'POL', 'avalanche': 'AVAX', 'bnb': 'BNB',
+}
+# Fallbacks when no history is available (see fees.md)
+DEFAULT_GAS_PRICE_GWEI = {
+    'ethereum': 10.0, 'arbitrum': 0.02, 'base': 0.01, 'optimism': 0.01,
+    'polygon': 40.0, 'avalanche': 2.0, 'bnb': 1.0,
+}
+DEFAULT_NATIVE_PRICE_USD = {'ETH': 2500.0, 'POL': 0.25, 'AVAX': 20.0, 'BNB': 600.0}
+CHAIN_ALIASES = {'bsc': 'bnb', 'binance': 'bnb', 'avax': 'avalanche', 'matic': 'polygon'}
+
+
+def normalize_chain(chain):
+    chain = str(chain).strip().lower()
+    return CHAIN_ALIASES.get(chain, chain)
+
+
+def load_gas_history(cache_dir=ETHERSCAN_DIR):
+    """Daily average gas price in gwei (dates x chains) from cached EtherScan chunks and CSVs"""
+    series = {}
+    for path in glob.glob(os.path.join(cache_dir, '*_daily_gas_*.json')):
+        chain = Path(path).name.split('_daily_gas_')[0]
+        with open(path, 'r') as f:
+            result = json.load(f).get('result')
+        if not isinstance(result, list) or not result:
+            continue
+        df = pd.DataFrame(result)
+        dates = pd.to_datetime(pd.to_numeric(df['unixTimeStamp']), unit='s').dt.normalize()
+        gwei = pd.Series(pd.to_numeric(df['avgGasPrice_Wei']).to_numpy() / 1e9, index=dates)
+        series.setdefault(chain, []).append(gwei)
+
+    for path in glob.glob(os.path.join(cache_dir, '*_daily_gas.csv')):
+        chain = Path(path).name.split('_daily_gas')[0]
+        df = pd.read_csv(path)
+        gwei = pd.Series(df['gas_price_gwei'].to_numpy(), index=pd.to_datetime(df['date']).dt.normalize())
+        series.setdefault(chain, []).append(gwei)
+
+    if not series:
+        return pd.DataFrame()
+    history = {normalize_chain(chain): pd.concat(parts).groupby(level=0).mean()
+               for chain, parts in series.items()}
+    return pd.DataFrame(history).sort_index()
+
+
+def load_native_prices(prices_dir=PRICES_DIR):
+    """Daily native token prices in USD (dates x tokens) from {TOKEN}.csv files with date,price_usd"""
+    prices = {}
+    for path in glob.glob(os.path.join(prices_dir, '*.csv')):
+        df = pd.read_csv(path)
+        prices[Path(path).stem.upper()] = pd.Series(
+            df['price_usd'].to_numpy(), index=pd.to_datetime(df['date']).dt.normalize())
+    return pd.DataFrame(prices).sort_index() if prices else pd.DataFrame()
+
+
+def _align(history, dates, columns, defaults):
+    """Reindex a daily history to the given dates and columns, filling gaps and missing columns"""
+    aligned = pd.DataFrame(index=dates)
+    for column in columns:
+        if column in history.columns:
+            values = history[column].reindex(history.index.union(dates)).ffill().bfill().reindex(dates)
+        else:
+            values = pd.Series(np.nan, index=dates)
+        aligned[column] = values.fillna(defaults.get(column, np.nan))
+    return aligned
+
+
+@profiled('process')
+def build_cost_matrix(dates, chains, action='deposit', gas_history=None, native_prices=None):
+    """USD cost of one deposit or withdraw per day (rows) and chain (columns)"""
+    dates = pd.DatetimeIndex(pd.to_datetime(dates)).normalize().unique().sort_values()
+    chains = sorted({normalize_chain(chain) for chain in chains})
+    gas_history = load_gas_history() if gas_history is None else gas_history
+    native_prices = load_native_prices() if native_prices is None else native_prices
+
+    gas = _align(gas_history, dates, chains, DEFAULT_GAS_PRICE_GWEI)
+    tokens = sorted({NATIVE_TOKEN.get(chain, 'ETH') for chain in chains})
+    prices = _align(native_prices, dates, tokens, DEFAULT_NATIVE_PRICE_USD)
+    token_prices = prices[[NATIVE_TOKEN.get(chain, 'ETH') for chain in chains]].to_numpy()
+
+    costs = gas.to_numpy() * 1e-9 * GAS_UNITS[action] * token_prices
+    return pd.DataFrame(costs, index=dates, columns=chains)
+
+
+def lookup_costs(cost_matrix, dates, chains):
+    """Vectorized cost_matrix[date, chain] for aligned arrays of dates and chains"""
+    rows = cost_matrix.index.get_indexer(pd.to_datetime(pd.Series(dates)).dt.normalize())
+    cols = cost_matrix.columns.get_indexer([normalize_chain(chain) for chain in chains])
+    if (rows < 0).any() or (cols < 0).any():
+        raise KeyError('dates or chains missing from the cost matrix')
+    return cost_matrix.to_numpy()[rows, cols]
+
+
+def allocation_costs(allocation, deposit_costs, withdraw_costs, key_columns=('protocol', 'asset', 'chain')):
+    """USD transaction cost per day of a single-pool allocation series
+
+    The first day pays a deposit; each day the pool (key_columns) changes pays a
+    withdraw on the old chain and a deposit on the new one.
+    """
+    allocation = allocation.sort_values('date')
+    keys = allocation[list(key_columns)].astype(str).agg('|'.join, axis=1).to_numpy()
+    chains = allocation['chain'].to_numpy()
+    dates = allocation['date'].to_numpy()
+
+    switched = np.ones(len(allocation), dtype=bool)
+    switched[1:] = keys[1:] != keys[:-1]
+    costs = np.where(switched, lookup_costs(deposit_costs, dates, chains), 0.0)
+    if len(allocation) > 1:
+        previous_chains = np.roll(chains, 1)
+        exits = switched.copy()
+        exits[0] = False
+        idx = np.flatnonzero(exits)
+        costs[idx] += lookup_costs(withdraw_costs, dates[idx], previous_chains[idx])
+    return pd.Series(costs, index=allocation.index)
+
+
+def net_apy(apy, costs_usd, deposit_sizes):
+    """Net APY (days x sizes): each day's cost is charged as an annualized drag on that day"""
+    apy = np.asarray(apy, dtype=float)[:, None]
+    costs = np.asarray(costs_usd, dtype=float)[:, None]
+    sizes = np.asarray(deposit_sizes, dtype=float)[None, :]
+    return apy - costs / sizes * 365 * 100
+
+
+@profiled('summarise')
+def net_apy_frame(best, apy_type, deposit_sizes, deposit_costs, withdraw_costs):
+    """Per-day gross APY, transaction cost and net APY per deposit size for one best_* strategy"""
+    best = best.assign(date=pd.to_datetime(best['date'])).sort_values('date', ignore_index=True)
+    gross = best[f'best_{apy_type}'].to_numpy()
+    costs = allocation_costs(best, deposit_costs, withdraw_costs).to_numpy()
+    net = net_apy(gross, costs, deposit_sizes)
+
+    frame = pd.DataFrame({'date': best['date'].dt.strftime('%Y-%m-%d'), 'protocol': best['protocol'],
+                          'asset': best['asset'], 'chain': best['chain'], 'gross_apy': gross,
+                          'cost_usd': costs})
+    net = pd.DataFrame(net, columns=[f'net_apy_{size}' for size in deposit_sizes])
+    return pd.concat([frame, net], axis=1)
+
+
+def summarize(frames, deposit_sizes):
+    """Mean gross and net APY, switch count and total cost per strategy and deposit size"""
+    rows = []
+    for apy_type, frame in frames.items():
+        switches = int((frame['cost_usd'] > 0).sum()) - 1
+        for size in deposit_sizes:
+            rows.append({
+                'strategy': apy_type,
+                'deposit_usd': size,
+                'gross_apy': frame['gross_apy'].mean(),
+                'net_apy': frame[f'net_apy_{size}'].mean(),
+                'switches': max(switches, 0),
+                'total_cost_usd': frame['cost_usd'].sum()
+            })
+    return pd.DataFrame(rows)
+
+
+def load_best_protocols(statistics_dir=STATISTICS_DIR):
+    best_protocols = {}
+    for apy_type in APY_TYPES:
+        path = Path(statistics_dir) / f'best_{apy_type}.csv'
+        if path.exists():
+            best_protocols[apy_type] = pd.read_csv(path)
+    return best_protocols
+
+
+def main(best_protocols=None, deposit_sizes=None, argv=None):
+    """Net APY per strategy and deposit size; programmatic callers pass argv=[] to ignore sys.argv"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEPOSIT_SIZES,
+                        help='deposit sizes in USD')
+    args = parser.parse_args(argv)
+    deposit_sizes = [int(size) for size in (deposit_sizes or args.sizes)]
+
+    if best_protocols is None:
+        best_protocols = load_best_protocols()
+    if not best_protocols:
+        raise FileNotFoundError(f'No best_*.csv found in {STATISTICS_DIR}; run strategy.py first')
+
+    dates = pd.concat([pd.to_datetime(df['date']) for df in best_protocols.values()])
+    chains = pd.concat([df['chain'] for df in best_protocols.values()]).unique()
+    gas_history = load_gas_history()
+    native_prices = load_native_prices()
+    print(f"Gas history for: {', '.join(gas_history.columns) or 'none (using defaults)'}")
+    deposit_costs = build_cost_matrix(dates, chains, 'deposit', gas_history, native_prices)
+    withdraw_costs = build_cost_matrix(dates, chains, 'withdraw', gas_history, native_prices)
+
+    print('\nAverage deposit cost per chain (USD):')
+    print(deposit_costs.mean().round(4).to_string())
+
+    frames = {}
+    for apy_type, best in best_protocols.items():
+        frames[apy_type] = net_apy_frame(best, apy_type, deposit_sizes, deposit_costs, withdraw_costs)
+        output_file = Path(STATISTICS_DIR) / f'net_apy_{apy_type}.csv'
+        frames[apy_type].to_csv(output_file, index=False)
+        print(f"Saved net APY for {apy_type} to {output_file}")
+
+    summary = summarize(frames, deposit_sizes)
+    summary_file = Path(STATISTICS_DIR) / 'net_apy_summary.csv'
+    summary.to_csv(summary_file, index=False)
+    print(f"\nSaved summary to {summary_file}")
+    print(summary.round(2).to_string(index=False))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
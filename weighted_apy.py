@@ -1,20 +1,33 @@
 #!/usr/bin/env python3
 """
 Script to calculate TVL-weighted average APY for each day across all pools using summary_apy.csv and summary_tvl.csv.
+
+Besides the overall weighted APY, the same pass produces TVL-weighted APY per
+protocol, per chain and per asset by multiplying the masked APY*TVL and TVL
+matrices with a pool -> group membership matrix.
 """
 
+import numpy as np
 import pandas as pd
 from pathlib import Path
-import csv
 
-def load_allowed_pools():
-    allowed_pools = set()
-    with open('pools_1000000.txt', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            allowed_pools.add(row['name'])
-    return allowed_pools
+from pool_registry import REGISTRY_FILE, PoolRegistry, pool_parts
+from profiling import count, profiled
+
+GROUPINGS = ['protocol', 'chain', 'asset']
+NAME_PARTS = {'protocol': 0, 'asset': 1, 'chain': 2}  # Position in the tuple of pool_registry.pool_parts
+
+def load_allowed_pools(registry_file=REGISTRY_FILE, **filters):
+    """Names of the registered DefiLlama pools, optionally narrowed with PoolRegistry.select filters"""
+    with PoolRegistry(registry_file) as registry:
+        return registry.names(source='defillama', **filters)
+
+def load_pool_metadata(registry_file=REGISTRY_FILE):
+    """Protocol, chain and asset of each pool, indexed by pool name"""
+    with PoolRegistry(registry_file) as registry:
+        return registry.metadata()[GROUPINGS]
 
+@profiled('load')
 def load_summary_data(allowed_pools):
     apy_path = Path('statistics/summary_apy.csv')
     tvl_path = Path('statistics/summary_tvl.csv')
@@ -24,40 +37,85 @@ def load_summary_data(allowed_pools):
     apy_df = pd.read_csv(apy_path)
     tvl_df = pd.read_csv(tvl_path)
 
+    # Apply the allowlist by column selection, keeping both frames in the same column order
+    pool_cols = [col for col in apy_df.columns if col != 'date' and col in allowed_pools]
+    pool_cols = [col for col in pool_cols if col in tvl_df.columns]
+    apy_df = apy_df[['date'] + pool_cols]
+    tvl_df = tvl_df[['date'] + pool_cols]
+    count('rows', apy_df.shape[0] * len(pool_cols))
+
     return apy_df, tvl_df
 
+def weighted_sums(apy_df, tvl_df):
+    """Masked APY*TVL and TVL matrices (days x pools) plus the pool column order"""
+    pool_cols = [col for col in apy_df.columns if col != 'date']
+    apys = apy_df[pool_cols].to_numpy(dtype=float)
+    tvls = tvl_df[pool_cols].to_numpy(dtype=float)
+    mask = (tvls > 0) & ~np.isnan(apys) & ~np.isnan(tvls)
+    weights = np.where(mask, tvls, 0.0)
+    products = np.where(mask, apys, 0.0) * weights
+    return products, weights, pool_cols
+
+def build_membership_matrix(pool_cols, metadata, by):
+    """Pools x groups 0/1 matrix; pools without metadata fall back to their file name"""
+    groups = [pool_parts(pool, metadata)[NAME_PARTS[by]] for pool in pool_cols]
+    return pd.get_dummies(pd.Series(groups, index=pool_cols), dtype=float)
+
+def _weighted_frame(dates, numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weighted = np.where(denominator > 0, numerator / denominator, np.nan)
+    return pd.DataFrame({
+        'date': dates,
+        'weighted_apy': np.round(weighted, 2),
+        'total_tvl': np.round(denominator, 2)
+    })
+
+@profiled('summarise')
 def calculate_weighted_apy(apy_df, tvl_df):
     # Assume both dataframes have the same columns: 'date' + pool names
-    pool_cols = [col for col in apy_df.columns if col != 'date']
-    results = []
-    for i in range(len(apy_df)):
-        apys = apy_df.loc[i, pool_cols].astype(float)
-        tvls = tvl_df.loc[i, pool_cols].astype(float)
-        mask = (tvls > 0) & apys.notna() & tvls.notna()
-        apys = apys[mask]
-        tvls = tvls[mask]
-        total_tvl = tvls.sum()
-        if total_tvl > 0:
-            weighted_apy = (apys * tvls).sum() / total_tvl
-        else:
-            weighted_apy = float('nan')
-        results.append({
-            'date': apy_df.loc[i, 'date'],
-            'weighted_apy': round(weighted_apy, 2),
-            'total_tvl': round(total_tvl, 2)
-        })
-    return pd.DataFrame(results)
-
-def main():
+    products, weights, _ = weighted_sums(apy_df, tvl_df)
+    return _weighted_frame(apy_df['date'].to_numpy(), products.sum(axis=1), weights.sum(axis=1))
+
+@profiled('summarise')
+def calculate_grouped_weighted_apy(apy_df, tvl_df, metadata, groupings=GROUPINGS, memberships=None):
+    """TVL-weighted APY per group for every grouping, from one membership product
+
+    Pass `memberships` ({grouping: build_membership_matrix(...)}) to reuse the
+    matrices across calls on row chunks of the same pools.
+    """
+    products, weights, pool_cols = weighted_sums(apy_df, tvl_df)
+    if memberships is None:
+        memberships = {by: build_membership_matrix(pool_cols, metadata, by) for by in groupings}
+    membership = pd.concat(memberships.values(), axis=1)
+
+    numerators = products @ membership.to_numpy()
+    denominators = weights @ membership.to_numpy()
+
+    dates = apy_df['date'].to_numpy()
+    results = {}
+    offset = 0
+    for by, matrix in memberships.items():
+        frames = []
+        for j, group in enumerate(matrix.columns):
+            frame = _weighted_frame(dates, numerators[:, offset + j], denominators[:, offset + j])
+            frame.insert(1, by, group)
+            frames.append(frame)
+        offset += matrix.shape[1]
+        results[by] = pd.concat(frames, ignore_index=True).sort_values(['date', by], ignore_index=True)
+    return results
+
+def main(apy_df=None, tvl_df=None):
     output_dir = Path('statistics')
     output_dir.mkdir(exist_ok=True)
 
     print('Loading allowed pools...')
     allowed_pools = load_allowed_pools()
-    print(f'Loaded {len(allowed_pools)} pools from pools_1000000.txt')
+    metadata = load_pool_metadata()
+    print(f'Loaded {len(allowed_pools)} pools from {REGISTRY_FILE}')
 
-    print('Loading summary data...')
-    apy_df, tvl_df = load_summary_data(allowed_pools)
+    if apy_df is None or tvl_df is None:
+        print('Loading summary data...')
+        apy_df, tvl_df = load_summary_data(allowed_pools)
     pool_cols = [col for col in apy_df.columns if col != 'date']
     print(f'Using {len(pool_cols)} pools present in summary files')
 
@@ -68,6 +126,13 @@ def main():
     weighted_apy.to_csv(output_file, index=False)
     print(f'\nSaved weighted APY data to {output_file}')
 
+    print('Calculating weighted APY per protocol, chain and asset...')
+    grouped = calculate_grouped_weighted_apy(apy_df, tvl_df, metadata)
+    for by, df in grouped.items():
+        group_file = output_dir / f'weighted_apy_by_{by}.csv'
+        df.to_csv(group_file, index=False)
+        print(f'Saved weighted APY by {by} to {group_file}')
+
     print('\nSummary Statistics:')
     print(f"Average Weighted APY: {weighted_apy['weighted_apy'].mean():.2f}%")
     print(f"Min Weighted APY: {weighted_apy['weighted_apy'].min():.2f}%")
@@ -77,4 +142,4 @@ def main():
     print(f"Max Total TVL: ${weighted_apy['total_tvl'].max():,.2f}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Script to keep statistics/weighted_apy*.csv up to date from daily deltas instead of full recomputation.
+
+Running sums of APY*TVL and TVL are stored per day and per group (overall, protocol,
+chain, asset) in a small SQLite state file next to the outputs, together with the
+last value seen for every (date, pool) cell. A delta - a newly collected day or a
+corrected value for an existing day - only touches the cells it names: the old
+contribution of each cell is subtracted and the new one added, so refresh cost
+depends on the number of changed cells, not on the length of the history.
+
+Refreshing from the summary files (the `weighted` stage of cli.py) re-reads only
+the days after the last stored one plus the last REVISION_DAYS stored days, which
+collectors revise, and the full history of pools new to the state. The state is
+rebuilt from scratch when it is empty, a pool dropped out of the summary or a
+pool's protocol, chain or asset changed. Every day has a row for every group, as
+in a weighted_apy.py run; when a group first appears its rows are written for
+every day.
+
+Usage:
+    python weighted_apy_stream.py                  # refresh from summary_*.csv
+    python weighted_apy_stream.py --bootstrap      # rebuild state from summary_*.csv
+    python weighted_apy_stream.py deltas.csv       # apply long-format deltas (date,pool,apy,tvl)
+"""
+
+import argparse
+import io
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pool_registry import pool_parts
+from weighted_apy import (GROUPINGS, NAME_PARTS, load_allowed_pools, load_pool_metadata,
+                          load_summary_data)
+
+STATE_FILE = 'statistics/weighted_apy_state.db'
+OUTPUT_DIR = 'statistics'
+OVERALL = 'all'
+REVISION_DAYS = 3        # Trailing stored days re-read on refresh, collectors revise recent values
+TVL_EPSILON = 1e-6       # Running TVL sums below this are cancellation residue, treated as 0
+TAIL_BLOCK_SIZE = 1 << 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    date TEXT NOT NULL,
+    pool TEXT NOT NULL,
+    apy REAL,
+    tvl REAL,
+    PRIMARY KEY (date, pool)
+);
+CREATE TABLE IF NOT EXISTS sums (
+    date TEXT NOT NULL,
+    grouping TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    apy_tvl REAL NOT NULL,
+    tvl REAL NOT NULL,
+    PRIMARY KEY (date, grouping, grp)
+);
+CREATE TABLE IF NOT EXISTS pools (
+    pool TEXT PRIMARY KEY,
+    protocol TEXT NOT NULL,
+    chain TEXT NOT NULL,
+    asset TEXT NOT NULL
+);
+"""
+
+
+def summary_to_deltas(apy_df, tvl_df):
+    """Convert wide summary frames (date + pool columns) into long-format deltas"""
+    apy_long = apy_df.melt(id_vars='date', var_name='pool', value_name='apy')
+    tvl_long = tvl_df.melt(id_vars='date', var_name='pool', value_name='tvl')
+    return apy_long.merge(tvl_long, on=['date', 'pool'], how='outer')
+
+
+def _contributions(apy, tvl):
+    """Masked (apy*tvl, tvl) contribution of each cell, matching weighted_apy.weighted_sums"""
+    apy = np.asarray(apy, dtype=float)
+    tvl = np.asarray(tvl, dtype=float)
+    mask = (tvl > 0) & ~np.isnan(apy) & ~np.isnan(tvl)
+    weights = np.where(mask, tvl, 0.0)
+    return np.where(mask, apy, 0.0) * weights, weights
+
+
+class WeightedApyState:
+    """Running weighted-APY sums per day and group, backed by SQLite"""
+
+    def __init__(self, path=STATE_FILE, metadata=None, allowed_pools=None):
+        self.path = path
+        self.metadata = metadata if metadata is not None else load_pool_metadata()
+        self.allowed_pools = allowed_pools
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.new_groupings = set()  # Groupings that gained a group in the last apply_deltas
+
+    def close(self):
+        self.conn.close()
+
+    def _group_of(self, pool, by):
+        return pool_parts(pool, self.metadata)[NAME_PARTS[by]]
+
+    def reset(self):
+        self.conn.executescript("DELETE FROM cells; DELETE FROM sums; DELETE FROM pools;")
+
+    def pools(self):
+        """{pool: (protocol, chain, asset)} of every pool applied so far"""
+        return {pool: tuple(groups) for pool, *groups in
+                self.conn.execute(f"SELECT pool, {', '.join(GROUPINGS)} FROM pools")}
+
+    def groups(self, grouping):
+        """Sorted groups of a grouping over every pool applied so far"""
+        if grouping == OVERALL:
+            return [OVERALL]
+        return [grp for grp, in self.conn.execute(f"SELECT DISTINCT {grouping} FROM pools ORDER BY {grouping}")]
+
+    def dates(self):
+        """Sorted dates present in the state"""
+        return [date for date, in self.conn.execute(
+            "SELECT date FROM sums WHERE grouping = ? ORDER BY date", (OVERALL,))]
+
+    def apply_deltas(self, deltas):
+        """Apply long-format deltas (date, pool, apy, tvl); returns the set of changed dates"""
+        self.new_groupings = set()
+        deltas = deltas[['date', 'pool', 'apy', 'tvl']].copy()
+        if self.allowed_pools is not None:
+            deltas = deltas[deltas['pool'].isin(self.allowed_pools)]
+        deltas = deltas.drop_duplicates(['date', 'pool'], keep='last')
+        if deltas.empty:
+            return set()
+        deltas['date'] = deltas['date'].astype(str)
+
+        # Look up the previous value of each changed cell through the primary key
+        cur = self.conn.cursor()
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (date TEXT, pool TEXT)")
+        cur.execute("DELETE FROM incoming")
+        cur.executemany("INSERT INTO incoming VALUES (?, ?)",
+                        deltas[['date', 'pool']].itertuples(index=False, name=None))
+        previous = pd.DataFrame(
+            cur.execute("SELECT i.date, i.pool, c.apy, c.tvl FROM incoming i "
+                        "LEFT JOIN cells c ON c.date = i.date AND c.pool = i.pool").fetchall(),
+            columns=['date', 'pool', 'old_apy', 'old_tvl'])
+        merged = deltas.merge(previous, on=['date', 'pool'], how='left')
+
+        new_num, new_den = _contributions(merged['apy'], merged['tvl'])
+        old_num, old_den = _contributions(merged['old_apy'], merged['old_tvl'])
+        merged['d_apy_tvl'] = new_num - old_num
+        merged['d_tvl'] = new_den - old_den
+
+        known = self.pools()
+        added = {pool: tuple(self._group_of(pool, by) for by in GROUPINGS)
+                 for pool in merged['pool'].unique() if pool not in known}
+        self.new_groupings = {by for i, by in enumerate(GROUPINGS)
+                              if {groups[i] for groups in added.values()} - {groups[i] for groups in known.values()}}
+        pool_groups = {**known, **added}
+
+        updates = [merged.assign(grouping=OVERALL, grp=OVERALL)]
+        for i, by in enumerate(GROUPINGS):
+            groups = {pool: pool_groups[pool][i] for pool in merged['pool'].unique()}
+            updates.append(merged.assign(grouping=by, grp=merged['pool'].map(groups)))
+        sums = (pd.concat(updates, ignore_index=True)
+                .groupby(['date', 'grouping', 'grp'])[['d_apy_tvl', 'd_tvl']].sum()
+                .reset_index())
+
+        cur.executemany(
+            "INSERT INTO sums VALUES (?, ?, ?, ?, ?) ON CONFLICT(date, grouping, grp) DO UPDATE "
+            "SET apy_tvl = apy_tvl + excluded.apy_tvl, tvl = tvl + excluded.tvl",
+            sums.itertuples(index=False, name=None))
+        cur.executemany(f"INSERT INTO pools (pool, {', '.join(GROUPINGS)}) VALUES (?, ?, ?, ?)",
+                        ((pool,) + groups for pool, groups in added.items()))
+        cur.executemany(
+            "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?)",
+            ((d, p, None if pd.isna(a) else float(a), None if pd.isna(t) else float(t))
+             for d, p, a, t in deltas.itertuples(index=False, name=None)))
+        self.conn.commit()
+        return set(deltas['date'])
+
+    def weighted_rows(self, dates, grouping=OVERALL):
+        """Weighted APY rows for the given dates in the weighted_apy*.csv layout"""
+        dates = sorted(dates)
+        rows = []
+        # Keep IN (...) lists below SQLite's host parameter limit
+        for start in range(0, len(dates), 500):
+            chunk = dates[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows.extend(self.conn.execute(
+                f"SELECT date, grp, apy_tvl, tvl FROM sums WHERE grouping = ? AND date IN ({placeholders}) "
+                "ORDER BY date, grp", [grouping] + chunk).fetchall())
+        df = pd.DataFrame(rows, columns=['date', grouping, 'apy_tvl', 'tvl'])
+        # Groups a day's deltas did not touch still get a row, as in a full weighted_apy.py run
+        grid = pd.MultiIndex.from_product([sorted(set(df['date'])), self.groups(grouping)],
+                                          names=['date', grouping])
+        df = df.set_index(['date', grouping]).reindex(grid, fill_value=0.0).reset_index()
+        # Running sums drift to tiny non-zero values once a pool's TVL is fully removed
+        tvl = df['tvl'].where(df['tvl'] > TVL_EPSILON, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weighted = np.where(tvl > 0, df['apy_tvl'] / tvl, np.nan)
+        df['weighted_apy'] = np.round(weighted, 2)
+        df['total_tvl'] = np.round(tvl, 2)
+        columns = ['date', 'weighted_apy', 'total_tvl'] if grouping == OVERALL \
+            else ['date', grouping, 'weighted_apy', 'total_tvl']
+        return df[columns]
+
+
+def _tail_start(f, since):
+    """Byte offset of the first row dated on or after `since`, reading the sorted file backwards"""
+    pos = f.seek(0, 2)
+    data = b''
+    while True:
+        step = min(TAIL_BLOCK_SIZE, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+        # Before the first newline is the header at the file start, a partial row elsewhere
+        first = data.find(b'\n') + 1
+        if pos == 0 or (first > 0 and data[first:].split(b',', 1)[0].decode('utf-8') < since):
+            break
+    offset = first
+    for line in data[first:].split(b'\n'):
+        if line and line.split(b',', 1)[0].decode('utf-8') >= since:
+            return pos + offset
+        offset += len(line) + 1
+    return pos + len(data)
+
+
+def update_csv(csv_file, rows, key_columns):
+    """Append rows for new dates, or rewrite the file from the earliest changed date onwards
+
+    Only the tail starting at the earliest date in `rows` is read and rewritten,
+    so a daily update costs O(changed rows), not O(history).
+    """
+    csv_file = Path(csv_file)
+    if rows.empty:
+        return 'unchanged'
+    if not csv_file.exists() or csv_file.stat().st_size == 0:
+        rows.to_csv(csv_file, index=False)
+        return 'created'
+
+    with open(csv_file, 'r+b') as f:
+        columns = f.readline().decode('utf-8').strip().split(',')
+        start = max(_tail_start(f, rows['date'].min()), f.seek(0) + len(f.readline()))
+        f.seek(start)
+        tail = f.read()
+        if not tail.strip():
+            f.seek(start)
+            f.write(rows[columns].to_csv(header=False, index=False).encode('utf-8'))
+            return 'appended'
+        existing = pd.read_csv(io.BytesIO(tail), header=None, names=columns, dtype={'date': str})
+        existing = existing[~existing['date'].isin(set(rows['date']))]
+        patched = pd.concat([existing, rows[columns]], ignore_index=True).sort_values(key_columns, ignore_index=True)
+        f.seek(start)
+        f.truncate()
+        f.write(patched.to_csv(header=False, index=False).encode('utf-8'))
+    return 'patched'
+
+
+def refresh(state, apy_df, tvl_df, revision_days=REVISION_DAYS):
+    """Apply the summary rows that may have changed since the last refresh; returns the changed dates"""
+    pools = [col for col in apy_df.columns if col != 'date' and col in tvl_df.columns]
+    known = state.pools()
+    metadata = {pool: tuple(state._group_of(pool, by) for by in GROUPINGS) for pool in known if pool in pools}
+    if not known or set(known) - set(pools) or any(known[pool] != groups for pool, groups in metadata.items()):
+        state.reset()
+        return state.apply_deltas(summary_to_deltas(apy_df[['date'] + pools], tvl_df[['date'] + pools]))
+
+    dates = state.dates()
+    since = dates[max(len(dates) - revision_days, 0)]
+    recent = apy_df['date'].astype(str).to_numpy() >= since
+    new = ['date'] + [pool for pool in pools if pool not in known]
+    old = ['date'] + [pool for pool in pools if pool in known]
+    deltas = pd.concat([summary_to_deltas(apy_df.loc[recent, old], tvl_df.loc[recent, old]),
+                        summary_to_deltas(apy_df[new], tvl_df[new])], ignore_index=True)
+    return state.apply_deltas(deltas)
+
+
+def publish(state, changed_dates, output_dir=OUTPUT_DIR):
+    """Write the changed dates to weighted_apy.csv and weighted_apy_by_*.csv
+
+    A grouping that gained a group since the last run is rewritten for every date.
+    """
+    output_dir = Path(output_dir)
+    outputs = {OVERALL: (output_dir / 'weighted_apy.csv', ['date'])}
+    for by in GROUPINGS:
+        outputs[by] = (output_dir / f'weighted_apy_by_{by}.csv', ['date', by])
+
+    for grouping, (csv_file, key_columns) in outputs.items():
+        dates = state.dates() if grouping in state.new_groupings else changed_dates
+        rows = state.weighted_rows(dates, grouping)
+        action = update_csv(csv_file, rows, key_columns)
+        print(f"{csv_file}: {action} {rows['date'].nunique()} date(s)")
+
+
+def update(apy_df=None, tvl_df=None, state_file=STATE_FILE, output_dir=OUTPUT_DIR):
+    """Refresh the state and the weighted_apy*.csv outputs from summary frames (loaded if not given)"""
+    allowed_pools = load_allowed_pools()
+    if apy_df is None or tvl_df is None:
+        print('Loading summary data...')
+        apy_df, tvl_df = load_summary_data(allowed_pools)
+    state = WeightedApyState(state_file, allowed_pools=allowed_pools)
+    try:
+        changed = refresh(state, apy_df, tvl_df)
+        print(f'{len(changed)} date(s) changed')
+        publish(state, changed, output_dir)
+    finally:
+        state.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('deltas', nargs='?', help='CSV with date,pool,apy,tvl rows to apply')
+    parser.add_argument('--bootstrap', action='store_true',
+                        help='Rebuild the state from statistics/summary_*.csv')
+    parser.add_argument('--state', default=STATE_FILE, help='State database path')
+    args = parser.parse_args()
+
+    if not args.bootstrap and not args.deltas:
+        update(state_file=args.state)
+        return
+
+    allowed_pools = load_allowed_pools()
+    state = WeightedApyState(args.state, allowed_pools=allowed_pools)
+    try:
+        if args.bootstrap:
+            print('Bootstrapping state from summary files...')
+            apy_df, tvl_df = load_summary_data(allowed_pools)
+            state.reset()
+            changed = state.apply_deltas(summary_to_deltas(apy_df, tvl_df))
+        else:
+            deltas = pd.read_csv(args.deltas, dtype={'date': str})
+            print(f'Applying {len(deltas)} changed cells from {args.deltas}...')
+            changed = state.apply_deltas(deltas)
+        print(f'{len(changed)} date(s) changed')
+        publish(state, changed)
+    finally:
+        state.close()
+
+
+if __name__ == "__main__":
+    main()